@@ -6,6 +6,13 @@ from models_config_enligne import MODELS_ENLIGNE  # Dictionnaire contenant les i
 client = InferenceClient(api_key=os.getenv("HF_token"))
 
 
+class ErreurAgent(Exception):
+    """
+    Échec d'un agent (appel API, paramètre invalide). Le message est affiché à l'utilisateur
+    à la place de la réponse ; il n'est jamais mis en cache comme une réponse.
+    """
+
+
 def choisir_modele_enligne():
     """
     Affiche la liste des modèles disponibles définis dans MODELS_ENLIGNE,
@@ -39,7 +46,10 @@ def generer_reponse(context, question, model_id):
         model_id (str): L'identifiant du modèle à utiliser.
 
     Retourne :
-        str : La réponse générée par le modèle ou un message d'erreur.
+        str : La réponse générée par le modèle.
+
+    Lève :
+        ErreurAgent : Si l'appel à l'API échoue.
     """
     # Construction du prompt pour guider le comportement du modèle
     prompt = f"""Tu es un assistant intelligent. Réponds à la question en te basant uniquement sur le contexte suivant.
@@ -64,7 +74,7 @@ Réponse :
         )
         return completion.choices[0].message["content"].strip()
     except Exception as e:
-        return f"Erreur lors de l'appel API : {e}"
+        raise ErreurAgent(f"Erreur lors de l'appel API : {e}") from e
 
 
 if __name__ == "__main__":
@@ -72,5 +82,8 @@ if __name__ == "__main__":
     model_id = choisir_modele_enligne()
     contexte = "Le capital de la SOCIÉTÉ DES BOISSONS DU MAROC est 102.7 MDH."
     question = "Quelle est le capital de la SOCIÉTÉ DES BOISSONS DU MAROC ?"
-    reponse = generer_reponse(contexte, question, model_id)
+    try:
+        reponse = generer_reponse(contexte, question, model_id)
+    except ErreurAgent as e:
+        reponse = str(e)
     print("\nRéponse générée :\n", reponse)
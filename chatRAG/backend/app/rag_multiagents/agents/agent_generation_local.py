@@ -6,6 +6,12 @@ from models_config_local import MODEL_INFOS  # Dictionnaire contenant les infos
 # Répertoire de stockage des modèles
 MODEL_DIR = os.path.join(os.path.dirname(__file__), "..", "models")
 
+# Taille de la fenêtre de contexte des modèles locaux et tokens réservés à la réponse
+N_CTX = 2048
+MAX_TOKENS_REPONSE = 512
+# Marge de sécurité (tokens) pour les écarts de tokenisation à la jointure des chunks
+MARGE_CONTEXTE = 32
+
 # === TÉLÉCHARGEMENT SIMPLE ===
 
 def download_model(filename, url):
@@ -139,7 +145,7 @@ def charger_modele(model_path):
     print(f"Chargement du modèle depuis {model_path} ...")
     return Llama(
         model_path=model_path,
-        n_ctx=2048,
+        n_ctx=N_CTX,
         n_threads=4,
         verbose=False
     )
@@ -147,19 +153,31 @@ def charger_modele(model_path):
 
 # === GÉNÉRATION DE RÉPONSES ===
 
-def generer_reponse(llm, contexte, question):
+def construire_prompt(contexte, question, strict=False):
     """
-    Génère une réponse en utilisant le contexte, mais autorise des compléments si nécessaire.
+    Construit le prompt envoyé au modèle local.
 
     Args:
-        llm (Llama): Instance du modèle.
         contexte (str): Texte contextuel.
         question (str): Question posée.
+        strict (bool): Si True, le modèle ne doit utiliser que le contexte.
 
     Retourne :
-        str : Réponse générée.
+        str : Prompt au format [INST].
     """
-    prompt = f"""[INST] Utilise ce contexte pour répondre à la question.
+    if strict:
+        return f"""[INST] Tu dois répondre uniquement en utilisant les informations du contexte.
+N'utilise pas tes propres connaissances, même si tu crois que la réponse est évidente.
+Si la réponse n'est pas dans le contexte, ou si le contexte est vide, dis : "Je ne sais pas".
+IMPORTANT : Réponds dans la même langue que la question.
+
+Contexte :
+{contexte}
+
+Question : {question}
+Réponse : [/INST]"""
+
+    return f"""[INST] Utilise ce contexte pour répondre à la question.
 
 IMPORTANT : Réponds dans la même langue que la question.
 
@@ -171,7 +189,49 @@ mais précise que l'information n'est pas mentionnée dans le contexte fourni.
 Question : {question}
 Réponse : [/INST]"""
 
-    output = llm(prompt, max_tokens=512, stop=["</s>"], temperature=0.7)
+def compter_tokens(llm, texte):
+    """
+    Compte les tokens d'un texte avec le tokenizer du modèle chargé.
+
+    Args:
+        llm (Llama): Modèle (ou tokenizer vocab_only) llama.cpp.
+        texte (str): Texte à mesurer.
+
+    Retourne :
+        int : Nombre de tokens (sans BOS).
+    """
+    return len(llm.tokenize(texte.encode("utf-8"), add_bos=False))
+
+def budget_contexte(llm, question, strict=False):
+    """
+    Calcule le nombre de tokens disponibles pour le contexte : fenêtre du modèle
+    moins la réponse réservée, le gabarit du prompt, la question et une marge.
+
+    Args:
+        llm (Llama): Modèle chargé.
+        question (str): Question posée.
+        strict (bool): Gabarit de prompt utilisé.
+
+    Retourne :
+        int : Budget de tokens pour le contexte (jamais négatif).
+    """
+    overhead = compter_tokens(llm, construire_prompt("", question, strict)) + 1  # + BOS
+    return max(0, N_CTX - MAX_TOKENS_REPONSE - overhead - MARGE_CONTEXTE)
+
+def generer_reponse(llm, contexte, question):
+    """
+    Génère une réponse en utilisant le contexte, mais autorise des compléments si nécessaire.
+
+    Args:
+        llm (Llama): Instance du modèle.
+        contexte (str): Texte contextuel.
+        question (str): Question posée.
+
+    Retourne :
+        str : Réponse générée.
+    """
+    prompt = construire_prompt(contexte, question)
+    output = llm(prompt, max_tokens=MAX_TOKENS_REPONSE, stop=["</s>"], temperature=0.7)
     return output["choices"][0]["text"].strip()
 
 def generer_reponse_strict(llm, contexte, question):
@@ -186,18 +246,8 @@ def generer_reponse_strict(llm, contexte, question):
     Retourne :
         str : Réponse générée.
     """
-    prompt = f"""[INST] Tu dois répondre uniquement en utilisant les informations du contexte.
-N'utilise pas tes propres connaissances, même si tu crois que la réponse est évidente.
-Si la réponse n'est pas dans le contexte, ou si le contexte est vide, dis : "Je ne sais pas".
-IMPORTANT : Réponds dans la même langue que la question.
-
-Contexte :
-{contexte}
-
-Question : {question}
-Réponse : [/INST]"""
-
-    output = llm(prompt, max_tokens=512, stop=["</s>"], temperature=0.0)
+    prompt = construire_prompt(contexte, question, strict=True)
+    output = llm(prompt, max_tokens=MAX_TOKENS_REPONSE, stop=["</s>"], temperature=0.0)
     return output["choices"][0]["text"].strip()
 
 
@@ -1,10 +1,14 @@
 import psycopg2
+from psycopg2.extras import execute_values
 from minio import Minio
+from minio.commonconfig import CopySource
 import os
-import PyPDF2
-import csv
-import docx
-import openpyxl
+import uuid
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from extraction_texte import SUPPORTED_EXTENSIONS, collect_text
 
 # === Configuration de la base de données PostgreSQL ===
 
@@ -19,15 +23,16 @@ DB_CONFIG = {
     "port": "5432"                # Port PostgreSQL
 }
 
-# Connexion à PostgreSQL
-try:
-    conn = psycopg2.connect(**DB_CONFIG)
-    cursor = conn.cursor()
-    print("Connexion à PostgreSQL réussie.")
 
-except Exception as e:
-    print(f"Erreur de connexion à PostgreSQL : {e}")
-    exit()
+def get_db_connection():
+    """
+    Ouvre une connexion dédiée à PostgreSQL.
+
+    Les imports s'exécutent dans plusieurs threads (tâches d'ingestion, préparation des
+    fichiers en parallèle) : chaque appel utilise sa propre connexion, fermée à la fin,
+    pour qu'une erreur SQL n'affecte jamais les imports suivants.
+    """
+    return psycopg2.connect(**DB_CONFIG)
 
 
 # === Configuration du client MinIO ===
@@ -54,6 +59,17 @@ except Exception as e:
 # Nom du bucket MinIO utilisé pour stocker les fichiers
 BUCKET_NAME = "documents-storage"
 
+# Les fichiers sont stockés une seule fois, sous leur empreinte SHA-256 : blobs/<sha256>
+BLOB_PREFIX = "blobs/"
+# Objets reçus en flux avant que leur empreinte soit connue : tmp/<uuid>
+STAGING_PREFIX = "tmp/"
+# Taille des parties de l'upload multipart vers MinIO (minimum imposé par S3 : 5 Mo)
+MINIO_PART_SIZE = int(os.getenv("MINIO_PART_SIZE", 16 * 1024 * 1024))
+# Taille des blocs lus lors de la réception ou du hachage d'un fichier
+READ_BLOCK_SIZE = 1024 * 1024
+# Fichiers d'un même upload préparés en parallèle (hachage, stockage MinIO, extraction)
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", 4))
+
 # Vérifie si le bucket existe ; sinon le crée
 if not minio_client.bucket_exists(BUCKET_NAME):
     minio_client.make_bucket(BUCKET_NAME)
@@ -62,96 +78,369 @@ else:
     print(f"Bucket '{BUCKET_NAME}' déjà existant.")
 
 
+# === Tables de déduplication ===
+# document_blobs : un fichier stocké dans MinIO par contenu distinct (empreinte SHA-256)
+# documents.blob_sha256 : fichier d'origine de chaque document
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS document_blobs (
+        sha256 TEXT PRIMARY KEY,
+        bucket TEXT NOT NULL,
+        object_name TEXT NOT NULL,
+        size BIGINT NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT now()
+    );
+    ALTER TABLE documents ADD COLUMN IF NOT EXISTS blob_sha256 TEXT;
+    CREATE INDEX IF NOT EXISTS documents_blob_sha256 ON documents (blob_sha256);
+"""
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def ensure_schema():
+    """
+    Crée les tables de déduplication si besoin (une seule fois par processus).
+
+    Appelée au premier import par la tâche d'ingestion, et non à l'import du module :
+    le serveur démarre même si la base est indisponible ou le rôle sans droit ALTER.
+    """
+    global _schema_ready
+    with _schema_lock:
+        if _schema_ready:
+            return
+        schema_conn = get_db_connection()
+        try:
+            with schema_conn.cursor() as schema_cursor:
+                schema_cursor.execute(SCHEMA_SQL)
+            schema_conn.commit()
+        except Exception:
+            schema_conn.rollback()
+            raise
+        finally:
+            schema_conn.close()
+        _schema_ready = True
+
+
 # === Fonction d'extraction de texte brut à partir d'un fichier ===
 
-def extract_text(file_path):
+def extract_text(file_path, progress=None):
     """
     Extrait le contenu textuel brut d’un fichier en fonction de son extension.
     Prend en charge : PDF, TXT, CSV, DOCX, XLSX.
-    
+
+    Le texte est produit par morceaux (pages, lignes, paragraphes) par extraction_texte.iter_text,
+    puis écrit dans un tampon unique ; les pages des gros PDF sont extraites en parallèle et les
+    tableurs lus ligne par ligne. Le texte est limité à EXTRACTION_MAX_BYTES octets.
+
     Args:
         file_path (str): Chemin vers le fichier local.
+        progress (callable, optionnel): Reçoit la progression de la lecture (voir collect_text).
 
     Returns:
         str or None: Texte extrait du fichier, ou None si erreur ou format non pris en charge.
     """
-    text = ""
-    file_extension = file_path.split('.')[-1].lower()
-
     try:
-        if file_extension == "pdf":
-            with open(file_path, "rb") as pdf_file:
-                reader = PyPDF2.PdfReader(pdf_file)
-                for page in reader.pages:
-                    text += page.extract_text() + "\n"
-
-        elif file_extension == "txt":
-            with open(file_path, "r", encoding="utf-8") as txt_file:
-                text = txt_file.read()
-
-        elif file_extension == "csv":
-            with open(file_path, "r", encoding="utf-8") as csv_file:
-                reader = csv.reader(csv_file)
-                text = "\n".join([", ".join(row) for row in reader])
-
-        elif file_extension == "docx":
-            doc = docx.Document(file_path)
-            text = "\n".join([para.text for para in doc.paragraphs])
-
-        elif file_extension == "xlsx":
-            wb = openpyxl.load_workbook(file_path)
-            for sheet in wb.worksheets:
-                for row in sheet.iter_rows(values_only=True):
-                    text += "\t".join([str(cell) if cell else "" for cell in row]) + "\n"
-
-        else:
-            print(f"Format {file_extension.upper()} non supporté pour l'extraction de texte.")
-            return None
-
+        text, _ = collect_text(file_path, progress=progress)
         return text.strip()
 
+    except ValueError as e:
+        print(e)
+        return None
+
     except Exception as e:
         print(f"Erreur d'extraction du texte : {e}")
         return None
 
 
-# === Fonction pour uploader un document sur MinIO + insertion en base PostgreSQL ===
+# === Upload en flux : requête HTTP -> MinIO + empreinte + copie locale pour l'extraction ===
 
-def upload_document(file_path, conversation_id, user_id):
+class _TeeReader:
     """
-    Upload un fichier vers MinIO et stocke les métadonnées + texte brut dans PostgreSQL.
+    Flux lu par put_object : chaque bloc lu dans la source est aussi haché et écrit
+    dans la copie locale. Le fichier ne traverse le disque local qu'une fois.
+    """
+
+    def __init__(self, source, copy):
+        self.source = source
+        self.copy = copy
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        if data:
+            self.hasher.update(data)
+            self.copy.write(data)
+            self.size += len(data)
+        return data
+
+
+def stream_upload(stream, local_path):
+    """
+    Envoie un fichier vers MinIO au fil de sa lecture (upload multipart), en calculant son
+    SHA-256 et en écrivant la copie locale qui servira à l'extraction du texte.
+
+    L'empreinte n'étant connue qu'à la fin de la lecture, l'objet est d'abord écrit sous un
+    nom temporaire (tmp/<uuid>) ; la tâche d'ingestion le copie ensuite côté serveur vers
+    blobs/<sha256>, ou le supprime si ce contenu est déjà stocké (voir _store_blob).
 
     Args:
-        file_path (str): Chemin local du fichier à uploader.
-        conversation_id (str): ID de la conversation liée au fichier.
-        user_id (str): Identifiant de l'utilisateur ayant uploadé le document.
+        stream: Flux binaire du fichier (ex: FileStorage.stream de la requête Flask).
+        local_path (str): Copie locale à écrire.
+
+    Returns:
+        dict: {"sha256": empreinte hexadécimale, "size": taille en octets, "staged": objet temporaire}.
+    """
+    staged = STAGING_PREFIX + uuid.uuid4().hex
+    try:
+        with open(local_path, "wb") as copy:
+            reader = _TeeReader(stream, copy)
+            minio_client.put_object(BUCKET_NAME, staged, reader, length=-1, part_size=MINIO_PART_SIZE)
+    except Exception:
+        # Copie incomplète : elle ne doit pas être importée
+        if os.path.exists(local_path):
+            os.remove(local_path)
+        raise
+    return {"sha256": reader.hasher.hexdigest(), "size": reader.size, "staged": staged}
+
+
+def file_sha256(file_path):
+    """Empreinte SHA-256 (hexadécimale) d'un fichier local."""
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(READ_BLOCK_SIZE), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+# === Stockage adressé par contenu ===
+
+def _fetch_one(query, params):
+    """Exécute une lecture seule (autocommit : aucune transaction laissée ouverte) ; retourne la première ligne."""
+    read_conn = get_db_connection()
+    try:
+        read_conn.autocommit = True
+        with read_conn.cursor() as read_cursor:
+            read_cursor.execute(query, params)
+            return read_cursor.fetchone()
+    finally:
+        read_conn.close()
+
+
+def discard_staged(staged):
+    """Supprime un objet temporaire de stream_upload (erreurs ignorées : il peut déjà être supprimé)."""
+    try:
+        minio_client.remove_object(BUCKET_NAME, staged)
+    except Exception as e:
+        print(f"Objet temporaire '{staged}' non supprimé : {e}")
+
+
+def sweep_staged_objects(max_age_seconds, keep=()):
+    """
+    Supprime les objets temporaires (tmp/) plus anciens que `max_age_seconds` : envois dont la
+    tâche n'a jamais été créée ou dont le processus a été arrêté.
+
+    Args:
+        max_age_seconds (float): Âge minimal (depuis la fin de l'envoi) d'un objet supprimé.
+        keep (Collection[str]): Objets à conserver (fichiers des tâches en attente ou en cours).
+
+    Returns:
+        int: Nombre d'objets supprimés.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=max_age_seconds)
+    removed = 0
+    for obj in minio_client.list_objects(BUCKET_NAME, prefix=STAGING_PREFIX):
+        if obj.object_name in keep or obj.last_modified is None or obj.last_modified > cutoff:
+            continue
+        discard_staged(obj.object_name)
+        removed += 1
+    return removed
+
+
+def _store_blob(file_path, sha256, staged=None, size=None):
     """
-    if not os.path.exists(file_path):
-        print(f"Fichier '{file_path}' introuvable.")
+    Stocke le fichier dans MinIO sous son empreinte, sauf s'il y est déjà.
+
+    Un fichier reçu en flux (staged : objet temporaire) est copié côté serveur vers
+    blobs/<sha256>, sans être relu ni renvoyé ; sinon (tâches créées avant l'envoi en flux)
+    la copie locale est envoyée.
+    """
+    if _fetch_one("SELECT 1 FROM document_blobs WHERE sha256 = %s", (sha256,)) is not None:
+        if staged:
+            discard_staged(staged)
+        print(f"Contenu {sha256[:12]} déjà stocké dans MinIO : envoi ignoré.")
         return
-    
+
+    object_name = BLOB_PREFIX + sha256
+    if staged:
+        minio_client.copy_object(BUCKET_NAME, object_name, CopySource(BUCKET_NAME, staged))
+        discard_staged(staged)
+    else:
+        minio_client.fput_object(BUCKET_NAME, object_name, file_path)
+    if size is None:
+        size = os.path.getsize(file_path)
+
+    blob_conn = get_db_connection()
+    try:
+        with blob_conn.cursor() as blob_cursor:
+            # Deux imports simultanés du même contenu écrivent le même objet : une seule ligne est gardée
+            blob_cursor.execute("""
+                INSERT INTO document_blobs (sha256, bucket, object_name, size)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (sha256) DO NOTHING
+            """, (sha256, BUCKET_NAME, object_name, size))
+        blob_conn.commit()
+    except Exception:
+        blob_conn.rollback()
+        raise
+    finally:
+        blob_conn.close()
+    print(f"Contenu {sha256[:12]} stocké dans MinIO ({object_name}).")
+
+
+def _document_with_text(sha256):
+    """ID d'un document déjà importé avec le même contenu et un texte extrait, ou None."""
+    row = _fetch_one("""
+        SELECT id FROM documents
+        WHERE blob_sha256 = %s AND content IS NOT NULL
+        ORDER BY id LIMIT 1
+    """, (sha256,))
+    return row[0] if row else None
+
+
+# === Import d'un lot de fichiers : préparation en parallèle, insertion groupée ===
+
+def _prepare_document(entry, progress=None):
+    """
+    Prépare l'import d'un fichier : empreinte, stockage MinIO, puis texte (repris d'un
+    document de même contenu, ou extrait).
+
+    Returns:
+        dict: Résultat du fichier ("file", "status", "error") et ligne à insérer ("row").
+    """
+    file_path = entry["path"]
     file_name = os.path.basename(file_path)
     file_extension = file_name.split(".")[-1].lower()
+    result = {"file": file_name, "status": None, "error": None, "row": None}
 
     try:
-        # Upload du fichier dans MinIO
-        minio_client.fput_object(BUCKET_NAME, file_name, file_path)
-        print(f"Document '{file_name}' stocké dans MinIO.")
-
-        # Extraction du contenu si format pris en charge
-        extracted_text = extract_text(file_path) if file_extension in ["pdf", "txt", "csv", "docx", "xlsx"] else None
-
-        # Insertion dans la table PostgreSQL "documents"
-        cursor.execute("""
-            INSERT INTO documents (filename, bucket, file_type, content, conversation_id, utilisateur_id) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (file_name, BUCKET_NAME, file_extension, extracted_text, conversation_id, user_id))
-        
-        conn.commit()
-        print(f"Document '{file_name}' enregistré avec la conversation '{conversation_id}'.")
-
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"Fichier '{file_path}' introuvable.")
+        sha256 = entry.get("sha256") or file_sha256(file_path)
+        # Stockage du fichier dans MinIO (une seule fois par contenu)
+        _store_blob(file_path, sha256, entry.get("staged"), entry.get("size"))
+
+        # Même contenu déjà extrait : le texte sera recopié sans quitter PostgreSQL
+        source_id = _document_with_text(sha256)
+        extracted_text = None
+        if source_id is None and file_extension in SUPPORTED_EXTENSIONS:
+            extracted_text = extract_text(file_path, progress and (lambda stats: progress(file_name, stats)))
+
+        result["status"] = "repris" if source_id is not None else "importe"
+        result["row"] = (file_name, BUCKET_NAME, file_extension, extracted_text, sha256, source_id)
     except Exception as e:
-        print(f"Erreur lors de l'upload : {e}")
+        if entry.get("staged"):
+            discard_staged(entry["staged"])
+        result["status"] = "erreur"
+        result["error"] = str(e)
+        print(f"Erreur lors de l'upload de '{file_name}' : {e}")
+    return result
+
+
+def _insert_documents(rows, conversation_id, user_id):
+    """Insère toutes les lignes "documents" d'un lot en une requête et une transaction."""
+    insert_conn = get_db_connection()
+    try:
+        with insert_conn.cursor() as insert_cursor:
+            # source_id : document dont le texte est repris (contenu identique déjà extrait)
+            execute_values(insert_cursor, """
+                INSERT INTO documents (filename, bucket, file_type, content, conversation_id, utilisateur_id, blob_sha256)
+                SELECT v.filename, v.bucket, v.file_type, COALESCE(v.content, source.content),
+                       v.conversation_id, v.utilisateur_id, v.blob_sha256
+                FROM (VALUES %s) AS v (filename, bucket, file_type, content, blob_sha256, source_id,
+                                       conversation_id, utilisateur_id, position)
+                LEFT JOIN documents source ON source.id = v.source_id
+                ORDER BY v.position
+            """, [row + (conversation_id, user_id, position) for position, row in enumerate(rows)],
+                template="(%s, %s, %s, %s::text, %s, %s::bigint, %s, %s, %s)",
+                page_size=len(rows))
+        insert_conn.commit()
+    except Exception:
+        insert_conn.rollback()
+        raise
+    finally:
+        insert_conn.close()
+
+
+def import_documents(files, conversation_id, user_id, workers=IMPORT_WORKERS, on_result=None, progress=None):
+    """
+    Importe plusieurs fichiers d'une conversation.
+
+    Les fichiers sont préparés en parallèle (au plus `workers` à la fois) : la durée d'un
+    upload de plusieurs fichiers est proche de celle du plus long. Les lignes "documents"
+    sont ensuite insérées ensemble, en une seule transaction.
+
+    Args:
+        files (List[dict]): Fichiers {"path", "sha256", "size", "staged" (optionnels, voir stream_upload)}.
+        conversation_id (int): ID de la conversation liée aux fichiers.
+        user_id (int): Identifiant de l'utilisateur ayant uploadé les fichiers.
+        workers (int): Nombre de fichiers préparés simultanément.
+        on_result (callable, optionnel): on_result(résultat) appelée à la fin de la préparation de chaque fichier.
+        progress (callable, optionnel): progress(nom du fichier, statistiques) pendant l'extraction.
+
+    Returns:
+        List[dict]: Résultat par fichier, dans l'ordre : "file", "status" ("importe", "repris"
+        ou "erreur") et "error".
+    """
+    ensure_schema()
+
+    def prepare(entry):
+        result = _prepare_document(entry, progress)
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(files)))) as pool:
+        results = list(pool.map(prepare, files))
+
+    rows = [result["row"] for result in results if result["row"] is not None]
+    if rows:
+        try:
+            _insert_documents(rows, conversation_id, user_id)
+            print(f"{len(rows)} document(s) enregistré(s) avec la conversation '{conversation_id}'.")
+        except Exception as e:
+            print(f"Erreur lors de l'insertion des documents : {e}")
+            for result in results:
+                if result["row"] is not None:
+                    result["status"], result["error"] = "erreur", f"Insertion en base : {e}"
+
+    return [{key: result[key] for key in ("file", "status", "error")} for result in results]
+
+
+# === Fonction pour uploader un document sur MinIO + insertion en base PostgreSQL ===
+
+def upload_document(file_path, conversation_id, user_id, progress=None, sha256=None):
+    """
+    Upload un fichier vers MinIO et stocke les métadonnées + texte brut dans PostgreSQL.
+
+    Le fichier est stocké sous son empreinte SHA-256 : un contenu déjà importé (dans
+    n'importe quelle conversation) n'est ni renvoyé à MinIO ni réextrait, son texte est
+    recopié côté serveur depuis le document existant.
+
+    Args:
+        file_path (str): Chemin local du fichier à uploader.
+        conversation_id (str): ID de la conversation liée au fichier.
+        user_id (str): Identifiant de l'utilisateur ayant uploadé le document.
+        progress (callable, optionnel): Reçoit la progression de l'extraction du texte.
+        sha256 (str, optionnel): Empreinte déjà calculée (stream_upload) ; calculée sinon.
+
+    Returns:
+        dict: Résultat de l'import (voir import_documents).
+    """
+    extraction_progress = progress and (lambda file_name, stats: progress(stats))
+    return import_documents(
+        [{"path": file_path, "sha256": sha256}], conversation_id, user_id, progress=extraction_progress
+    )[0]
 
 
 # === Bloc principal de test ===
@@ -159,8 +448,3 @@ def upload_document(file_path, conversation_id, user_id):
 if __name__ == "__main__":
     # Upload de test d’un fichier PDF avec conversation_id défini
     upload_document("cp_sbm_t1_2025.pdf", "conv_abc123", "admin")
-
-    # Fermeture propre des connexions
-    cursor.close()
-    conn.close()
-    print("Connexions fermées.")
@@ -1,10 +1,30 @@
 import os
+import time
+import shutil
 import psycopg2
-import faiss
-import pickle
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from decoupage_texte import RecursiveTextChunker, token_length_function
+from cache_index import INDEX_CACHE
+from modele_embedding import EMBEDDING_MAX_TOKENS, EMBEDDING_MODEL_NAME, encode_texts, get_embedding_tokenizer
+from cache_embeddings_chunks import CHUNK_EMBEDDING_CACHE
+from selection_index import GrowingIndex, build_index
+from pipeline_pretraitement import run_pipeline
+from index_lexical import write_lexical_index
+from assemblage_contexte import write_token_lengths
+from cache_reponses import ANSWER_CACHE
+from stockage_index import (
+    ChunkTexts,
+    ChunkTextsWriter,
+    compute_corpus_metadata,
+    current_version_dir,
+    new_version_dir,
+    publish_version,
+    read_chunk_texts,
+    read_faiss_index,
+    read_metadata,
+    write_faiss_index,
+    write_metadata
+)
 
 # === Configuration de la base de données PostgreSQL ===
 
@@ -19,25 +39,32 @@ DB_CONFIG = {
     "port": "5432"
 }
 
-# === Chemins pour sauvegarder l'index FAISS et les textes associés ===
-FAISS_INDEX_PATH = "backend/app/rag_multiagents/faiss_index/index.faiss"
-TEXTS_PATH = "backend/app/rag_multiagents/faiss_index/texts.pkl"
-
-# === Initialisation du modèle d’embedding ===
-
-# Modèle anglais compact et rapide
-EMBEDDING_MODEL_NAME = "BAAI/bge-small-en-v1.5"
-# Pour du multilingue : paraphrase-multilingual-mpnet-base-v2
-
-embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+# Nombre de documents transférés par aller-retour lors de la lecture en flux
+DOCUMENTS_ITERSIZE = int(os.getenv("DOCUMENTS_ITERSIZE", 16))
 
 # === Initialisation du text splitter ===
-# Divise le texte en petits morceaux avec un chevauchement pour le contexte
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=500,        # Taille maximale des chunks en caractères
-    chunk_overlap=100,     # Chevauchement entre les chunks
-    separators=["\n\n", "\n", ".", ",", " ", ""]  # Ordre de découpe
-)
+# Divise le texte en petits morceaux avec un chevauchement pour le contexte.
+# CHUNKING_MODE="tokens" mesure les chunks en tokens du modèle d'embedding (limite de 512)
+# au lieu de caractères.
+CHUNKING_MODE = os.getenv("CHUNKING_MODE", "chars")
+CHUNK_SIZE_TOKENS = min(int(os.getenv("CHUNK_SIZE_TOKENS", 256)), EMBEDDING_MAX_TOKENS - 2)
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 50))
+
+SEPARATORS = ["\n\n", "\n", ".", ",", " ", ""]  # Ordre de découpe
+
+if CHUNKING_MODE == "tokens":
+    text_splitter = RecursiveTextChunker(
+        chunk_size=CHUNK_SIZE_TOKENS,
+        chunk_overlap=CHUNK_OVERLAP_TOKENS,
+        separators=SEPARATORS,
+        length_function=token_length_function(get_embedding_tokenizer())
+    )
+else:
+    text_splitter = RecursiveTextChunker(
+        chunk_size=500,        # Taille maximale des chunks en caractères
+        chunk_overlap=100,     # Chevauchement entre les chunks
+        separators=SEPARATORS
+    )
 
 # === Connexion à PostgreSQL ===
 try:
@@ -59,132 +86,316 @@ def chunk_text(content, doc_id):
         doc_id (int): ID du document d’origine.
 
     Returns:
-        List[Dict]: Liste de dictionnaires avec doc_id et texte chunké.
+        List[Dict]: Liste de dictionnaires avec doc_id, rang du chunk dans le document ("ordinal"),
+        positions ("start", "end") dans le contenu et texte chunké.
     """
-    raw_chunks = text_splitter.create_documents([content])
-    return [{"doc_id": doc_id, "text": chunk.page_content} for chunk in raw_chunks]
+    return [
+        {"doc_id": doc_id, "ordinal": ordinal, "start": start, "end": end, "text": content[start:end]}
+        for ordinal, (start, end) in enumerate(text_splitter.split_spans(content))
+    ]
 
 # === Fonction de génération des embeddings ===
 
-def embed_chunks(chunks):
+def embed_chunks(chunks, show_progress_bar=True):
     """
     Génére les vecteurs (embeddings) pour chaque chunk de texte.
 
+    Les embeddings déjà calculés (même texte, même modèle, dans n'importe quelle conversation)
+    sont relus depuis le cache disque ; seuls les chunks absents sont encodés, une fois chacun.
+
     Args:
         chunks (List[Dict]): Liste de chunks.
+        show_progress_bar (bool): Affiche la progression (désactivée pour les lots du pipeline).
 
     Returns:
         Tuple[np.ndarray, List[str]]: Vecteurs normalisés + textes d’origine.
     """
     texts = [chunk["text"] for chunk in chunks]
-    embeddings = embedding_model.encode(
-        texts,
-        show_progress_bar=True,
-        normalize_embeddings=True
-    )
+    vectors, missing = CHUNK_EMBEDDING_CACHE.get_many(EMBEDDING_MODEL_NAME, texts)
+
+    if missing:
+        # Les chunks identiques (en-têtes, mentions légales...) ne sont encodés qu'une fois
+        to_encode = list(dict.fromkeys(texts[i] for i in missing))
+        if show_progress_bar:
+            print(f"{len(texts) - len(missing)} embedding(s) repris du cache, {len(to_encode)} à calculer.")
+        encoded = encode_texts(
+            to_encode,
+            show_progress_bar=show_progress_bar,
+            normalize_embeddings=True
+        )
+        CHUNK_EMBEDDING_CACHE.put_many(EMBEDDING_MODEL_NAME, to_encode, encoded)
+        by_text = dict(zip(to_encode, encoded))
+        for i in missing:
+            vectors[i] = by_text[texts[i]]
+
+    embeddings = np.array(vectors, dtype=np.float32)
     return embeddings, texts
 
 # === Création d’un index FAISS ===
 
-def create_faiss_index(embeddings):
+def create_faiss_index(embeddings, index_type=None, precision=None):
     """
     Crée un index FAISS basé sur la similarité de produit scalaire (cosinus pour vecteurs normalisés).
+    Le type d'index dépend de la taille du corpus : IndexFlatIP (exact) pour les petits corpus,
+    HNSW puis IVF-PQ au-delà, avec efSearch / nprobe réglés pour atteindre le rappel visé.
 
     Args:
         embeddings (np.ndarray): Matrice des vecteurs.
+        index_type (str, optionnel): Force "flat", "hnsw" ou "ivfpq".
+        precision (str, optionnel): Précision des vecteurs stockés : "fp32", "fp16" ou "sq8"
+            (INDEX_PRECISION par défaut).
 
     Returns:
-        faiss.IndexFlatIP: Index FAISS prêt pour la recherche.
+        tuple: Index FAISS prêt pour la recherche et description de l'index (type, précision, paramètres, rappel).
     """
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(embeddings)
-    return index
+    return build_index(embeddings, index_type, precision=precision)
 
 # === Récupération des documents liés à une conversation ===
 
-def fetch_documents_by_conversation(conversation_id):
+def iter_documents_by_conversation(conversation_id, exclude_ids=None, itersize=DOCUMENTS_ITERSIZE):
+    """
+    Parcourt en flux les documents non vides liés à une conversation.
+
+    Utilise un curseur nommé (côté serveur) : seuls `itersize` documents sont transférés
+    à la fois, au lieu de tous les contenus d'un coup avec fetchall(). Le curseur vit sur
+    une connexion dédiée, pour que les commits faits ailleurs sur la connexion partagée
+    ne le ferment pas en cours de lecture.
+
+    Args:
+        conversation_id (str): ID de la conversation.
+        exclude_ids (Iterable[int], optionnel): Documents déjà indexés, à ne pas récupérer.
+        itersize (int): Nombre de documents récupérés par aller-retour avec le serveur.
+
+    Yields:
+        Tuple[int, str]: (document_id, contenu).
+    """
+    stream_conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with stream_conn.cursor(name=f"documents_conversation_{conversation_id}") as stream_cursor:
+            stream_cursor.itersize = itersize
+            stream_cursor.execute("""
+                SELECT id, content 
+                FROM documents 
+                WHERE conversation_id = %s AND content IS NOT NULL
+                  AND NOT (id = ANY(%s))
+                ORDER BY id
+            """, (conversation_id, [int(doc_id) for doc_id in exclude_ids or []]))
+            for doc_id, content in stream_cursor:
+                yield doc_id, content
+    finally:
+        stream_conn.close()
+
+
+def fetch_documents_by_conversation(conversation_id, exclude_ids=None):
     """
     Récupère tous les documents non vides liés à une conversation.
 
     Args:
         conversation_id (str): ID de la conversation.
+        exclude_ids (Iterable[int], optionnel): Documents déjà indexés, à ne pas récupérer.
 
     Returns:
         List[Tuple[int, str]]: Liste de tuples (document_id, contenu).
     """
     try:
-        cursor.execute("""
-            SELECT id, content 
-            FROM documents 
-            WHERE conversation_id = %s AND content IS NOT NULL
-        """, (conversation_id,))
-        results = cursor.fetchall()
-        documents = [(doc_id, content) for doc_id, content in results]
-        return documents
+        return list(iter_documents_by_conversation(conversation_id, exclude_ids))
     except Exception as e:
         print(f"Erreur lors de la récupération des documents pour la conversation {conversation_id} : {e}")
         return []
 
 # === Sauvegarde de l’index FAISS et des textes ===
 
-def save_index_for_conversation(conversation_id, index, texts):
+def save_index_for_conversation(conversation_id, index, texts, metadata=None):
     """
-    Sauvegarde l’index FAISS (.faiss) et les textes originaux (.pkl) dans un dossier dédié à la conversation.
+    Sauvegarde l’index FAISS (.faiss), les textes (blocs compressés + offsets, lisibles en mmap),
+    l'index lexical BM25 et les statistiques du corpus (meta.json) dans une nouvelle version
+    du dossier de la conversation, puis la publie.
 
     Args:
         conversation_id (str): ID de la conversation.
         index (faiss.Index): Index FAISS.
         texts (List[str]): Textes correspondants aux vecteurs.
+        metadata (dict, optionnel): Statistiques du corpus ; calculées à partir des textes si absentes.
+    """
+    if metadata is None:
+        metadata = compute_corpus_metadata(texts)
+
+    version = time.time_ns()
+    folder_path = new_version_dir(conversation_id, version)
+    writer = ChunkTextsWriter(folder_path)
+    writer.add(texts)
+    _publish_index(conversation_id, version, folder_path, index, writer, metadata)
+
+
+def _publish_index(conversation_id, version, folder_path, index, writer, metadata, previous_folder=None):
     """
-    folder_path = f"backend/app/rag_multiagents/faiss_index/{conversation_id}"
-    os.makedirs(folder_path, exist_ok=True)
+    Écrit une version complète de l'index dans `folder_path` : textes (écrits par `writer`),
+    index FAISS, index lexical, longueurs en tokens et meta.json, puis la publie en
+    remplaçant le pointeur CURRENT. Les lecteurs passent d'une version entière à l'autre.
 
-    faiss_path = os.path.join(folder_path, "index.faiss")
-    texts_path = os.path.join(folder_path, "texts.pkl")
+    Args:
+        previous_folder (str, optionnel): Version précédente, dont l'index lexical et les longueurs
+            en tokens sont repris (seuls les nouveaux chunks sont traités).
+    """
+    # Version de l'index : change à chaque sauvegarde (clé des réponses mises en cache)
+    metadata["version"] = version
+
+    writer.commit()
+    write_faiss_index(folder_path, index)
+    texts = read_chunk_texts(folder_path)
+    # Index inversé BM25 utilisé par la recherche hybride : après un ajout, les postings des
+    # nouveaux chunks sont fusionnés avec ceux de la version précédente
+    write_lexical_index(folder_path, texts, start=writer.previous_count, previous_folder=previous_folder)
+    # Longueurs en tokens des chunks pour l'assemblage du contexte des modèles locaux
+    write_token_lengths(folder_path, texts, start=writer.previous_count, previous_folder=previous_folder)
+    write_metadata(folder_path, metadata)
+    # Textes mappés relâchés avant le renommage du dossier (impossible sous Windows sinon)
+    del texts
+
+    publish_version(conversation_id, folder_path)
+    _invalidate_conversation_caches(conversation_id)
+    added = len(writer) - writer.previous_count
+    print(f"Index sauvegardé pour la conversation '{conversation_id}' ({added} chunk(s) ajouté(s), {len(writer)} au total).")
+
+
+def _invalidate_conversation_caches(conversation_id):
+    # L'index en mémoire est rechargé en arrière-plan à la prochaine recherche ; les réponses en cache sont périmées
+    INDEX_CACHE.mark_stale(conversation_id)
+    ANSWER_CACHE.invalidate_conversation(conversation_id)
+
+# === Chargement de l'index existant (indexation incrémentale) ===
+
+def load_existing_index(conversation_id):
+    """
+    Charge l'index déjà publié d'une conversation pour y ajouter des documents.
 
-    faiss.write_index(index, faiss_path)
-    with open(texts_path, "wb") as f:
-        pickle.dump(texts, f)
+    Args:
+        conversation_id (str): ID de la conversation.
 
-    print(f"Index sauvegardé pour la conversation '{conversation_id}'.")
+    Returns:
+        tuple ou None: (index FAISS modifiable, métadonnées, dossier de la version), ou None si
+        l'index n'existe pas ou ne permet pas l'ajout (ancien format sans liste des documents indexés).
+    """
+    folder_path = current_version_dir(conversation_id)
+    metadata = read_metadata(folder_path)
+    if not metadata or not metadata.get("documents") or "index" not in metadata:
+        return None
+    try:
+        texts = read_chunk_texts(folder_path)
+        index = read_faiss_index(folder_path, writable=True)
+    except (FileNotFoundError, RuntimeError):
+        return None
+    if not isinstance(texts, ChunkTexts) or len(texts) != index.ntotal:
+        return None
+    return index, metadata, folder_path
+
+
+def _add_texts_to_metadata(metadata, texts):
+    # Mise à jour des statistiques sans relire les anciens textes ("\n".join(anciens + nouveaux))
+    n_new = len(texts)
+    separators = n_new if metadata["chunk_count"] else max(n_new - 1, 0)
+    metadata["total_chars"] += sum(len(t) for t in texts) + separators
+    metadata["chunk_count"] += n_new
+
+def _discard_version(writer, folder_path):
+    # Version non publiée : aucun lecteur ne la connaît, elle peut être supprimée directement
+    writer.abort()
+    shutil.rmtree(folder_path, ignore_errors=True)
 
 # === Pipeline principal : découpage, vectorisation, indexation ===
 
-def run_preprocessing(conversation_id):
+def run_preprocessing(conversation_id, full_rebuild=False, precision=None, progress=None):
     """
-    Pipeline principal :
-    - Récupère les documents liés à une conversation
-    - Découpe le texte en chunks
-    - Génère les embeddings
-    - Crée l’index FAISS
+    Pipeline principal, en flux :
+    - Récupère les documents liés à une conversation qui ne sont pas encore indexés
+    - Découpe le texte en chunks (pool de threads)
+    - Génère les embeddings par lots de taille fixe
+    - Ajoute chaque lot à l’index FAISS (existant ou nouveau) dès qu'il est prêt
     - Sauvegarde les résultats
 
+    La mémoire utilisée par les documents et vecteurs en transit est bornée par la taille
+    des lots et des files du pipeline, quelle que soit la taille du corpus. Si le nombre
+    total de vecteurs impose un autre type d'index (ex: flat -> hnsw), les vecteurs déjà
+    indexés sont transférés sans réencoder les chunks.
+
     Args:
         conversation_id (str): ID de la conversation à traiter.
+        full_rebuild (bool): Ignore l'index existant et réindexe tous les documents.
+        precision (str, optionnel): Précision des vecteurs d'un nouvel index ("fp32", "fp16" ou "sq8",
+            INDEX_PRECISION par défaut). Un index existant garde la sienne (enregistrée dans meta.json) ;
+            pour en changer, utiliser full_rebuild=True.
+        progress (callable, optionnel): Reçoit les statistiques par étape après chaque lot (voir run_pipeline).
+
+    Returns:
+        dict ou None: Statistiques par étape (éléments traités, débit), None si rien à indexer.
     """
-    print(f"Récupération des documents pour la conversation '{conversation_id}'...")
-    documents = fetch_documents_by_conversation(conversation_id)
-    if not documents:
-        print(f"Aucun document trouvé pour la conversation {conversation_id}.")
-        return
+    existing = None if full_rebuild else load_existing_index(conversation_id)
+    previous_folder = None
+    if existing:
+        index, metadata, previous_folder = existing
+        growing = GrowingIndex(index, metadata["index"])
+    else:
+        metadata = compute_corpus_metadata([])
+        growing = GrowingIndex(precision=precision)
+    indexed_ids = list(metadata["documents"])
+
+    # Nouvelle version construite à côté de la version publiée, qui continue de servir les recherches
+    version = time.time_ns()
+    folder_path = new_version_dir(conversation_id, version)
+    writer = ChunkTextsWriter(folder_path, source_folder=previous_folder)
+
+    def index_batch(embeddings, chunks):
+        texts = [chunk["text"] for chunk in chunks]
+        writer.add(
+            texts,
+            doc_ids=[chunk["doc_id"] for chunk in chunks],
+            ordinals=[chunk["ordinal"] for chunk in chunks],
+            spans=[(chunk["start"], chunk["end"]) for chunk in chunks]
+        )
+        growing.add(embeddings)
+        _add_texts_to_metadata(metadata, texts)
 
     print(f"Traitement de la conversation '{conversation_id}'...")
-
-    all_chunks = []
-    for doc_id, content in documents:
-        all_chunks.extend(chunk_text(content, doc_id))
-
-    print(f"Embedding de {len(all_chunks)} chunks...")
-    embeddings, texts = embed_chunks(all_chunks)
-    embeddings = np.array(embeddings)
-
-    index = create_faiss_index(embeddings)
+    try:
+        # Lecture en flux : seuls les documents pas encore indexés sont transférés
+        documents = iter_documents_by_conversation(conversation_id, exclude_ids=indexed_ids)
+        documents_stats, report = run_pipeline(
+            documents,
+            chunk_text,
+            lambda chunks: embed_chunks(chunks, show_progress_bar=False),
+            index_batch,
+            progress=progress
+        )
+    except BaseException:
+        _discard_version(writer, folder_path)
+        raise
+    finally:
+        # Embeddings ajoutés au cache pendant les lots : une seule écriture par indexation
+        CHUNK_EMBEDDING_CACHE.flush()
+
+    if not documents_stats:
+        _discard_version(writer, folder_path)
+        if existing:
+            print(f"Index déjà à jour pour la conversation {conversation_id}.")
+        else:
+            print(f"Aucun document trouvé pour la conversation {conversation_id}.")
+        return None
+
+    # Documents sans contenu découpable et aucun index existant : rien à sauvegarder
+    if growing.ntotal == 0:
+        _discard_version(writer, folder_path)
+        print(f"Aucun chunk produit pour la conversation {conversation_id}.")
+        return report
+
+    index, index_info = growing.finalize()
+    metadata["documents"].update(documents_stats)
+    metadata["index"] = index_info
 
     print("Sauvegarde de l'index FAISS...")
-    save_index_for_conversation(conversation_id, index, texts)
+    _publish_index(conversation_id, version, folder_path, index, writer, metadata, previous_folder)
 
     print(f"Prétraitement terminé pour la conversation {conversation_id}.")
+    return report
 
 # === Exécution de test ===
 
@@ -1,5 +1,6 @@
 # === Imports des modules locaux ===
-from agent_recherche import search
+from agent_recherche import search, load_conversation_index
+from assemblage_contexte import assembler_contexte_local, assembler_contexte_enligne
 from agent_conversation import save_conversation, get_conversation_history
 
 # Import de l’agent local (LLM exécuté en local)
@@ -11,6 +12,7 @@ from agent_generation_local import (
 
 # Import de l’agent distant (LLM via API Hugging Face)
 from agent_generation_enligne import (
+    ErreurAgent,
     generer_reponse as generer_reponse_enligne,
     choisir_modele_enligne
 )
@@ -50,16 +52,32 @@ def poser_question_local(user_id, question, llm, conversation_id):
 
     Returns:
         str: Réponse générée
+
+    Raises:
+        ErreurAgent: Si l'ID de conversation est invalide.
     """
     try:
         conversation_id = int(conversation_id)
     except ValueError:
         print("Erreur: L'ID de conversation pour l'agent local doit être un entier.")
-        return "Erreur: ID de conversation invalide."
+        raise ErreurAgent("Erreur: ID de conversation invalide.")
+
+    # Une seule version d'index pour la recherche et l'assemblage : les indices de chunks
+    # renvoyés par search() désignent les mêmes textes et longueurs en tokens
+    try:
+        index_data = load_conversation_index(conversation_id)
+    except FileNotFoundError as e:
+        print(e)
+        index_data = None
 
     # Recherche contextuelle (RAG)
-    contextes = search(question, conversation_id, top_k=3)
-    contexte_concatene = "\n".join([c['texte'] for c in contextes]) if contextes else "Aucun"
+    contextes = search(question, conversation_id, top_k=3, index_data=index_data) if index_data else None
+
+    # Assemblage des meilleurs passages dans la fenêtre de contexte du modèle (réponse réservée)
+    contexte_concatene = "Aucun"
+    if contextes:
+        _, texts, metadata = index_data
+        contexte_concatene = assembler_contexte_local(contextes, metadata["folder"], llm, question, texts) or "Aucun"
     
     # Génération de la réponse avec le LLM local
     reponse = generer_reponse_local(llm, contexte_concatene, question)
@@ -81,18 +99,22 @@ def poser_question_enligne(user_id, question, conversation_id, api_url):
 
     Returns:
         str: Réponse générée
+
+    Raises:
+        ErreurAgent: Si l'ID de conversation est invalide ou si l'appel à l'API échoue.
     """
     try:
         conversation_id = int(conversation_id) 
     except ValueError:
         print("Erreur: L'ID de conversation pour l'agent en ligne doit être un entier.")
-        return "Erreur: ID de conversation invalide."
+        raise ErreurAgent("Erreur: ID de conversation invalide.")
 
     # Recherche contextuelle (RAG)
     print(f"DEBUG: Calling search with query='{question}', conversation_id={conversation_id}, top_k=3")
     contextes = search(question, conversation_id, top_k=3)
 
-    contexte_concatene = "\n".join([c['texte'] for c in contextes]) if contextes else "Aucun"
+    # Assemblage des meilleurs passages dans le budget de tokens du modèle en ligne
+    contexte_concatene = assembler_contexte_enligne(contextes, api_url) if contextes else "Aucun"
     
     # Génération via API distante
     reponse = generer_reponse_enligne(contexte_concatene, question, api_url) 
@@ -167,5 +189,8 @@ if __name__ == "__main__":
         elif user_input.lower() == "historique":
             afficher_historique(user_id, conversation_id)
         else:
-            response = agent_function(user_input)
+            try:
+                response = agent_function(user_input)
+            except ErreurAgent as e:
+                response = str(e)
             print("Bot:", response)
@@ -1,13 +1,115 @@
-import faiss
-import pickle
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
 import os
+import sys
+from cache_index import INDEX_CACHE
+from modele_embedding import EMBEDDING_MODEL_NAME, encode_texts
+from batch_embedding import EMBEDDING_BATCHER, EMBEDDING_BATCHING
+from selection_index import apply_search_params, index_bytes_per_vector
+from index_lexical import load_lexical_index, reciprocal_rank_fusion
+from cache_embeddings import QUERY_EMBEDDING_CACHE, normalize_query
+from stockage_index import (
+    ChunkTexts,
+    INDEX_FILENAME,
+    META_FILENAME,
+    compute_corpus_metadata,
+    current_version_dir,
+    read_chunk_texts,
+    read_current_version,
+    read_faiss_index,
+    read_metadata,
+    texts_files
+)
 
-# Initialisation du modèle d'embedding pour la requête
-EMBEDDING_MODEL_NAME = "BAAI/bge-small-en-v1.5"
-embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+# Modes de recherche disponibles et paramètres de la recherche hybride
+SEARCH_MODES = ("dense", "hybrid")
+HYBRID_CANDIDATES = 20      # Candidats par classement (dense et lexical) avant fusion
+LEXICAL_BUDGET_MS = 25.0    # Budget de temps du scoring BM25 par requête
+DOC_LENGTH_THRESHOLD = 1000 # En dessous (caractères), tout le corpus sert de contexte, sans recherche
+
+
+def _index_signature(conversation_id):
+    """
+    Signature peu coûteuse de l'état sur disque, utilisée par le cache pour détecter
+    une nouvelle version publiée (éventuellement par un autre processus) : le contenu
+    du pointeur CURRENT, ou les dates de modification pour l'ancien format.
+    """
+    version = read_current_version(conversation_id)
+    if version is not None:
+        return version
+    folder_path = current_version_dir(conversation_id)
+    paths = [os.path.join(folder_path, INDEX_FILENAME)] + texts_files(folder_path)
+    try:
+        signature = tuple(os.stat(path).st_mtime_ns for path in paths)
+    except FileNotFoundError:
+        return None
+    meta_path = os.path.join(folder_path, META_FILENAME)
+    meta_mtime = os.stat(meta_path).st_mtime_ns if os.path.exists(meta_path) else None
+    return signature + (meta_mtime,)
+
+def _estimate_size(index, texts, index_info=None):
+    """
+    Estime l'empreinte mémoire (octets) d'un index FAISS et de ses textes.
+    Les pages mappées sont comptées (estimation prudente) même si elles sont partagées.
+    La taille des vecteurs dépend du type et de la précision de l'index (meta.json).
+    """
+    index_bytes = index.ntotal * index_bytes_per_vector(index_info, index.d)
+    if isinstance(texts, ChunkTexts):
+        texts_bytes = texts.nbytes
+    else:
+        texts_bytes = sys.getsizeof(texts) + sum(sys.getsizeof(t) for t in texts)
+    return index_bytes + texts_bytes
+
+def _read_index_from_disk(conversation_id):
+    """
+    Ouvre l'index FAISS, les textes et les métadonnées depuis le disque (sans passer par le cache).
+    L'index et le blob de textes sont mappés en mémoire : rien n'est copié sur le tas.
+    Tous les fichiers sont lus dans le dossier de la même version ; metadata["folder"]
+    indique ce dossier (index lexical, longueurs en tokens).
+
+    Returns:
+        tuple: ((index, textes, métadonnées), taille estimée en octets).
+    """
+    folder_path = current_version_dir(conversation_id)
+
+    # Ouverture de l'index FAISS
+    index = read_faiss_index(folder_path)
+    # Ouverture des textes chunkés (décodés à la demande)
+    texts = read_chunk_texts(folder_path)
+    # Statistiques du corpus ; calculées une seule fois au chargement pour les index sans meta.json
+    metadata = read_metadata(folder_path) or compute_corpus_metadata(texts)
+    # Paramètres de recherche (efSearch / nprobe) réglés à la construction de l'index
+    apply_search_params(index, metadata.get("index"))
+    metadata["folder"] = folder_path
+
+    return (index, texts, metadata), _estimate_size(index, texts, metadata.get("index"))
+
+def load_conversation_index(conversation_id):
+    """
+    Charge l'index FAISS, les textes et les métadonnées du corpus pour une conversation.
+    Les index déjà chargés sont servis depuis le cache LRU en mémoire (INDEX_CACHE) ;
+    une nouvelle version publiée est rechargée en arrière-plan pendant que l'ancienne
+    continue de répondre.
+    
+    Args:
+        conversation_id (int ou str): Identifiant de la conversation.
+    
+    Returns:
+        tuple: L'index FAISS, la séquence des textes et le dictionnaire de métadonnées.
+    
+    Raises:
+        FileNotFoundError: Si les fichiers index ou textes n'existent pas pour la conversation donnée.
+    """
+    def signature():
+        return _index_signature(conversation_id)
+
+    def loader():
+        # Vérification de l'existence des fichiers (uniquement en cas de défaut de cache)
+        if signature() is None:
+            raise FileNotFoundError(f"Index ou textes manquants pour la conversation : {conversation_id}")
+        return _read_index_from_disk(conversation_id)
+
+    return INDEX_CACHE.get_or_load(conversation_id, loader, signature)
 
 def load_index(conversation_id):
     """
@@ -22,82 +124,131 @@ def load_index(conversation_id):
     Raises:
         FileNotFoundError: Si les fichiers index ou textes n'existent pas pour la conversation donnée.
     """
-    index_path = f"backend/app/rag_multiagents/faiss_index/{conversation_id}/index.faiss"
-    texts_path = f"backend/app/rag_multiagents/faiss_index/{conversation_id}/texts.pkl"
+    index, texts, _ = load_conversation_index(conversation_id)
+    return index, texts
+
+def get_index_version(conversation_id, min_chars=0):
+    """
+    Retourne la version de l'index d'une conversation (écrite dans meta.json à chaque sauvegarde).
+    
+    Args:
+        conversation_id (int ou str): Identifiant de la conversation.
+        min_chars (int): Taille minimale du corpus ; en dessous, la version n'est pas retournée
+            (document court servi en entier par search(), sans embedding de la requête).
+    
+    Returns:
+        int ou None: Version de l'index, ou None si la conversation n'a pas d'index
+            ou si son corpus fait moins de min_chars caractères.
+    """
+    try:
+        _, _, metadata = load_conversation_index(conversation_id)
+    except FileNotFoundError:
+        return None
+    if metadata["total_chars"] < min_chars:
+        return None
+    return metadata.get("version")
 
-    # Vérification de l'existence des fichiers
-    if not os.path.exists(index_path) or not os.path.exists(texts_path):
-        raise FileNotFoundError(f"Index ou textes manquants pour la conversation : {conversation_id}")
+def embed_queries(queries):
+    """
+    Génère en un seul appel au modèle les embeddings normalisés de plusieurs requêtes.
+    Les requêtes déjà en cache ne sont pas réencodées ; les doublons ne sont encodés qu'une fois.
+    
+    Args:
+        queries (List[str]): Textes des requêtes.
+    
+    Returns:
+        np.ndarray: Matrice float32 de forme (len(queries), dim), dans l'ordre des requêtes.
+    """
+    normalized_queries = [normalize_query(q) for q in queries]
 
-    # Chargement de l'index FAISS
-    index = faiss.read_index(index_path)
-    # Chargement des textes chunkés
-    with open(texts_path, "rb") as f:
-        texts = pickle.load(f)
+    vectors = {}
+    missing = []
+    for normalized_query in dict.fromkeys(normalized_queries):
+        vector = QUERY_EMBEDDING_CACHE.get(EMBEDDING_MODEL_NAME, normalized_query)
+        if vector is None:
+            missing.append(normalized_query)
+        else:
+            vectors[normalized_query] = vector
 
-    return index, texts
+    # Encodage groupé des requêtes absentes du cache. Les petites demandes (typiquement une
+    # question /chat) passent par le dispatcher, qui les regroupe avec celles des requêtes concurrentes.
+    if missing:
+        if EMBEDDING_BATCHING and len(missing) < EMBEDDING_BATCHER.max_batch_size:
+            encoded = EMBEDDING_BATCHER.encode(missing)
+        else:
+            encoded = np.asarray(encode_texts(missing, normalize_embeddings=True), dtype=np.float32)
+        for normalized_query, vector in zip(missing, encoded):
+            QUERY_EMBEDDING_CACHE.put(EMBEDDING_MODEL_NAME, normalized_query, vector)
+            vectors[normalized_query] = vector
+
+    return np.stack([vectors[q] for q in normalized_queries]).astype(np.float32, copy=True)
 
 def embed_query(query):
     """
     Génère l'embedding normalisé pour la requête utilisateur.
+    Les requêtes déjà vues (après normalisation du texte) sont servies depuis
+    le cache LRU QUERY_EMBEDDING_CACHE sans appeler le modèle.
     
     Args:
         query (str): Texte de la requête utilisateur.
     
     Returns:
-        np.ndarray: Embedding vectoriel normalisé correspondant à la requête.
+        np.ndarray: Embedding vectoriel normalisé (float32, forme (1, dim)) correspondant à la requête.
     """
-    query_embedding = embedding_model.encode([query], normalize_embeddings=True)
+    query_embedding = embed_queries([query])
     return query_embedding
 
-def search(query, conversation_id, top_k=5, similarity_threshold=0.75, context_window=1, doc_length_threshold=1000):
+def _context_range(texts, idx, context_window):
     """
-    Effectue une recherche sémantique avec extension contextuelle autour des résultats.
+    Intervalle [start, end) des chunks à joindre autour du chunk `idx`.
+
+    Lorsque le magasin de chunks connaît le document d'origine de chaque chunk, l'extension
+    s'arrête aux limites du document : un chunk voisin issu d'un autre document n'est pas ajouté.
+    """
+    start = max(0, idx - context_window)
+    end = min(len(texts), idx + context_window + 1)
+    doc_ids = getattr(texts, "doc_ids", None)
+    if doc_ids is None or doc_ids[idx] < 0:
+        return start, end
+    # Les chunks d'un même document sont contigus dans l'index
+    doc_id = doc_ids[idx]
+    while doc_ids[start] != doc_id:
+        start += 1
+    while doc_ids[end - 1] != doc_id:
+        end -= 1
+    return start, end
+
+def _select_results(conversation_id, texts, distances, indices, top_k, similarity_threshold, context_window):
+    """
+    Filtre, étend et trie les résultats FAISS d'une requête.
+    Partagée par search() et search_many() pour garantir des résultats identiques.
     
     Args:
-        query (str): Requête utilisateur à rechercher.
-        conversation_id (int ou str): ID de la conversation pour charger le bon index.
+        conversation_id (int ou str): ID de la conversation (affichage).
+        texts (Sequence[str]): Textes des chunks de la conversation.
+        distances (np.ndarray): Scores de similarité renvoyés par FAISS pour la requête (1 ligne).
+        indices (np.ndarray): Indices des chunks renvoyés par FAISS pour la requête (1 ligne).
         top_k (int): Nombre maximum de résultats à retourner.
         similarity_threshold (float): Seuil minimal de similarité pour retenir un résultat.
         context_window (int): Nombre de chunks avant et après à inclure autour du chunk pertinent.
-        doc_length_threshold (int): Taille minimale du document pour appliquer la recherche, sinon on retourne tout.
     
     Returns:
-        list of dict ou None: Liste de dictionnaires avec le texte trouvé sous la clé 'texte', ou None si aucun résultat.
+        list of dict ou None: Liste de dictionnaires avec le texte trouvé sous la clé 'texte' (plus 'score' et
+            'chunks', indices des chunks couverts), ou None si aucun résultat.
     """
-    try:
-        # Chargement de l'index et des textes chunkés
-        index, texts = load_index(conversation_id)
-    except FileNotFoundError as e:
-        print(e)
-        return None
-
-    # Calcul de l'embedding de la requête
-    query_embedding = embed_query(query)
-
-    # Recherche dans l'index FAISS
-    distances, indices = index.search(query_embedding, top_k)
-
     relevant_texts = []
     seen_indices = set()
 
-    # Concaténation de tout le texte pour vérifier la longueur globale
-    full_text = "\n".join(texts)
-    if len(full_text) < doc_length_threshold:
-        print("Document trop court, retour du texte complet.")
-        return [{"texte": full_text}]
-
     # Parcours des résultats obtenus
-    for i, distance in enumerate(distances[0]):
+    for i, distance in enumerate(distances):
         # On ne garde que les résultats au-dessus du seuil de similarité
         if distance >= similarity_threshold:
-            idx = indices[0][i]
+            idx = indices[i]
             if idx not in seen_indices:
                 # Extension du contexte autour du chunk pertinent
-                start = max(0, idx - context_window)
-                end = min(len(texts), idx + context_window + 1)
+                start, end = _context_range(texts, idx, context_window)
                 expanded_text = " ".join(texts[start:end])
-                relevant_texts.append((expanded_text, distance))
+                relevant_texts.append((expanded_text, distance, (int(start), int(end))))
                 # On marque les indices inclus pour éviter les doublons
                 seen_indices.update(range(start, end))
 
@@ -111,8 +262,200 @@ def search(query, conversation_id, top_k=5, similarity_threshold=0.75, context_w
 
     # Affichage des résultats pour information
     print(f"Résultats pour la conversation {conversation_id} (top {top_k}):")
-    for i, (text, distance) in enumerate(relevant_texts[:top_k]):
+    for i, (text, distance, _) in enumerate(relevant_texts[:top_k]):
         print(f"{i + 1}. (similarité : {1 - distance:.4f}) | Chunk étendu de longueur {len(text)}")
 
     # Retour des résultats sous forme de liste de dictionnaires
-    return [{"texte": text} for text, _ in relevant_texts[:top_k]]
+    # ('score' et 'chunks' servent à l'assemblage du contexte sous budget de tokens)
+    return [
+        {"texte": text, "score": float(distance), "chunks": list(range(start, end))}
+        for text, distance, (start, end) in relevant_texts[:top_k]
+    ]
+
+def _select_hybrid_results(conversation_id, texts, distances, indices, lexical_ranking, top_k, similarity_threshold, context_window):
+    """
+    Fusionne les classements dense (FAISS) et lexical (BM25) par Reciprocal Rank Fusion,
+    puis applique la même extension contextuelle que _select_results.
+    
+    Args:
+        lexical_ranking (Sequence[int]): Indices des chunks classés par score BM25 décroissant.
+        Autres arguments: Voir _select_results().
+    
+    Returns:
+        list of dict ou None: Liste de dictionnaires avec le texte trouvé sous la clé 'texte' (plus 'score' et
+            'chunks', indices des chunks couverts), ou None si aucun résultat.
+    """
+    # Seuls les résultats denses au-dessus du seuil participent à la fusion
+    dense_ranking = [idx for distance, idx in zip(distances, indices) if idx >= 0 and distance >= similarity_threshold]
+    fused = reciprocal_rank_fusion([dense_ranking, lexical_ranking])
+
+    relevant_texts = []
+    seen_indices = set()
+    for idx, score in fused:
+        if idx in seen_indices:
+            continue
+        # Extension du contexte autour du chunk pertinent
+        start, end = _context_range(texts, idx, context_window)
+        relevant_texts.append((" ".join(texts[start:end]), score, (int(start), int(end))))
+        seen_indices.update(range(start, end))
+        if len(relevant_texts) >= top_k:
+            break
+
+    if not relevant_texts:
+        print("Aucun résultat pertinent trouvé (recherche hybride).")
+        return None
+
+    print(f"Résultats hybrides pour la conversation {conversation_id} (top {top_k}):")
+    for i, (text, score, _) in enumerate(relevant_texts):
+        print(f"{i + 1}. (score RRF : {score:.4f}) | Chunk étendu de longueur {len(text)}")
+
+    return [
+        {"texte": text, "score": float(score), "chunks": list(range(start, end))}
+        for text, score, (start, end) in relevant_texts
+    ]
+
+def _results_for_query(conversation_id, metadata, texts, query, distances, indices, mode, top_k, similarity_threshold, context_window, lexical_budget_ms):
+    """Sélectionne les résultats d'une requête selon le mode de recherche ("dense" ou "hybrid")."""
+    if mode == "dense":
+        return _select_results(conversation_id, texts, distances, indices, top_k, similarity_threshold, context_window)
+
+    # Index lexical de la même version que l'index FAISS, chargé à la demande ;
+    # sans lui, la fusion se réduit au classement dense
+    lexical_index = load_lexical_index(metadata["folder"])
+    lexical_ranking = []
+    if lexical_index is not None:
+        lexical_ranking, _ = lexical_index.search(query, top_n=max(top_k, HYBRID_CANDIDATES), budget_ms=lexical_budget_ms)
+    return _select_hybrid_results(
+        conversation_id, texts, distances, indices, lexical_ranking, top_k, similarity_threshold, context_window
+    )
+
+def _n_candidates(mode, top_k):
+    """Nombre de voisins demandés à FAISS : plus large en mode hybride pour nourrir la fusion."""
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Mode de recherche inconnu : {mode} (attendu : {', '.join(SEARCH_MODES)})")
+    return top_k if mode == "dense" else max(top_k, HYBRID_CANDIDATES)
+
+def search(query, conversation_id, top_k=5, similarity_threshold=0.75, context_window=1, doc_length_threshold=DOC_LENGTH_THRESHOLD,
+           mode="dense", lexical_budget_ms=LEXICAL_BUDGET_MS, index_data=None):
+    """
+    Effectue une recherche sémantique avec extension contextuelle autour des résultats.
+    En mode "hybrid", les résultats FAISS sont fusionnés (RRF) avec ceux de l'index lexical BM25,
+    ce qui retrouve les chiffres, sigles et noms exacts que la recherche dense peut manquer.
+    
+    Args:
+        query (str): Requête utilisateur à rechercher.
+        conversation_id (int ou str): ID de la conversation pour charger le bon index.
+        top_k (int): Nombre maximum de résultats à retourner.
+        similarity_threshold (float): Seuil minimal de similarité pour retenir un résultat.
+        context_window (int): Nombre de chunks avant et après à inclure autour du chunk pertinent.
+        doc_length_threshold (int): Taille minimale du document pour appliquer la recherche, sinon on retourne tout.
+        mode (str): "dense" (FAISS seul) ou "hybrid" (FAISS + BM25).
+        lexical_budget_ms (float): Budget de temps du calcul BM25 en mode hybride.
+        index_data (tuple, optionnel): (index, textes, métadonnées) déjà chargés par load_conversation_index.
+            L'appelant qui réutilise les textes ou le dossier de la version (assemblage du contexte)
+            les passe ici : les indices de chunks renvoyés correspondent alors à la même version,
+            même si une nouvelle version est publiée entre-temps.
+    
+    Returns:
+        list of dict ou None: Liste de dictionnaires avec le texte trouvé sous la clé 'texte' (plus 'score' et
+            'chunks', indices des chunks couverts), ou None si aucun résultat.
+    """
+    n_candidates = _n_candidates(mode, top_k)
+
+    if index_data is None:
+        try:
+            # Chargement de l'index, des textes chunkés et des statistiques du corpus
+            index_data = load_conversation_index(conversation_id)
+        except FileNotFoundError as e:
+            print(e)
+            return None
+    index, texts, metadata = index_data
+
+    # Document court : on retourne tout le texte, sans calculer d'embedding ni interroger l'index
+    if metadata["total_chars"] < doc_length_threshold:
+        print("Document trop court, retour du texte complet.")
+        return [{"texte": "\n".join(texts), "score": 1.0, "chunks": list(range(len(texts)))}]
+
+    # Calcul de l'embedding de la requête
+    query_embedding = embed_query(query)
+
+    # Recherche dans l'index FAISS
+    distances, indices = index.search(query_embedding, n_candidates)
+
+    return _results_for_query(
+        conversation_id, metadata, texts, query, distances[0], indices[0],
+        mode, top_k, similarity_threshold, context_window, lexical_budget_ms
+    )
+
+def search_many(queries, conversation_ids, top_k=5, similarity_threshold=0.75, context_window=1, doc_length_threshold=DOC_LENGTH_THRESHOLD,
+                mode="dense", lexical_budget_ms=LEXICAL_BUDGET_MS):
+    """
+    Version groupée de search() pour plusieurs requêtes (évaluation, reformulation, questions multiples).
+    
+    Toutes les requêtes à encoder le sont en un seul batch, puis une seule recherche FAISS
+    est lancée par conversation avec la matrice complète de ses requêtes. Chaque résultat
+    est identique à celui qu'aurait renvoyé search() pour la même requête.
+    
+    Args:
+        queries (List[str]): Requêtes à rechercher.
+        conversation_ids (int, str ou list): Un ID commun à toutes les requêtes, ou un ID par requête.
+        top_k, similarity_threshold, context_window, doc_length_threshold, mode, lexical_budget_ms: Voir search().
+    
+    Returns:
+        list: Pour chaque requête (dans l'ordre), la valeur que renverrait search().
+    
+    Raises:
+        ValueError: Si la liste d'IDs n'a pas la même longueur que la liste de requêtes.
+    """
+    n_candidates = _n_candidates(mode, top_k)
+
+    if isinstance(conversation_ids, (list, tuple)):
+        if len(conversation_ids) != len(queries):
+            raise ValueError("conversation_ids doit contenir un ID par requête.")
+    else:
+        conversation_ids = [conversation_ids] * len(queries)
+
+    results = [None] * len(queries)
+
+    # Regroupement des requêtes par conversation (ordre de première apparition conservé)
+    groups = {}
+    for position, conversation_id in enumerate(conversation_ids):
+        groups.setdefault(conversation_id, []).append(position)
+
+    # Chargement des index et traitement des documents courts, sans embedding
+    to_search = []
+    for conversation_id, positions in groups.items():
+        try:
+            index, texts, metadata = load_conversation_index(conversation_id)
+        except FileNotFoundError as e:
+            print(e)
+            continue
+
+        if metadata["total_chars"] < doc_length_threshold:
+            print("Document trop court, retour du texte complet.")
+            full_text = "\n".join(texts)
+            for position in positions:
+                results[position] = [{"texte": full_text, "score": 1.0, "chunks": list(range(len(texts)))}]
+            continue
+
+        to_search.append((conversation_id, index, texts, metadata, positions))
+
+    if not to_search:
+        return results
+
+    # Un seul encodage pour toutes les requêtes restantes
+    positions_to_embed = [p for _, _, _, _, positions in to_search for p in positions]
+    embeddings = embed_queries([queries[p] for p in positions_to_embed])
+    row_of = {p: row for row, p in enumerate(positions_to_embed)}
+
+    # Une recherche FAISS par conversation, avec toutes ses requêtes d'un coup
+    for conversation_id, index, texts, metadata, positions in to_search:
+        query_matrix = np.ascontiguousarray(embeddings[[row_of[p] for p in positions]])
+        distances, indices = index.search(query_matrix, n_candidates)
+        for row, position in enumerate(positions):
+            results[position] = _results_for_query(
+                conversation_id, metadata, texts, queries[position], distances[row], indices[row],
+                mode, top_k, similarity_threshold, context_window, lexical_budget_ms
+            )
+
+    return results
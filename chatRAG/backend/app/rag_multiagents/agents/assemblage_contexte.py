@@ -0,0 +1,232 @@
+import os
+import re
+import threading
+
+import numpy as np
+from llama_cpp import Llama
+
+from cache_index import IndexCache
+from models_config_local import MODEL_INFOS
+from models_config_enligne import MODELS_ENLIGNE
+from agent_generation_local import MODEL_DIR, budget_contexte, compter_tokens
+
+# === Assemblage du contexte sous budget de tokens ===
+# Les longueurs en tokens de chaque chunk sont calculées à l'indexation avec le tokenizer
+# de chaque modèle local téléchargé, et stockées dans faiss_index/<conversation_id>/tokens_<modèle>.npy.
+
+TOKEN_LENGTHS_PREFIX = "tokens_"
+
+# Estimation pour les modèles sans tokenizer local (API distante) : ~4 caractères par token
+CHARS_PER_TOKEN = 4
+# Budget par défaut des modèles en ligne qui n'en déclarent pas dans MODELS_ENLIGNE
+BUDGET_CONTEXTE_ENLIGNE = 6000
+
+# Tokenizers vocab_only chargés à la demande pour l'indexation (chemin du modèle -> Llama)
+_tokenizers = {}
+_tokenizers_lock = threading.Lock()
+
+# Longueurs en tokens des chunks, par (conversation, modèle)
+TOKEN_LENGTHS_CACHE = IndexCache(max_bytes=64 * 1024 * 1024, max_entries=256)
+
+
+def tokenizer_key(model_path):
+    """Identifiant de fichier stable pour le tokenizer d'un modèle (nom du .gguf, sans extension)."""
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    return re.sub(r"[^A-Za-z0-9._-]", "_", name)
+
+
+def _token_lengths_path(folder_path, key):
+    return os.path.join(folder_path, f"{TOKEN_LENGTHS_PREFIX}{key}.npy")
+
+
+def estimate_tokens(text):
+    """Estimation grossière du nombre de tokens d'un texte (sans tokenizer)."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _load_tokenizer(model_path):
+    """Charge uniquement le vocabulaire d'un modèle GGUF (rapide, sans les poids)."""
+    with _tokenizers_lock:
+        tokenizer = _tokenizers.get(model_path)
+        if tokenizer is None:
+            tokenizer = _tokenizers[model_path] = Llama(model_path=model_path, vocab_only=True, verbose=False)
+        return tokenizer
+
+
+def compute_token_lengths(tokenizer, texts):
+    """
+    Calcule la longueur en tokens de chaque chunk.
+
+    Args:
+        tokenizer (Llama): Modèle ou tokenizer vocab_only llama.cpp.
+        texts (Sequence[str]): Textes des chunks.
+
+    Returns:
+        np.ndarray: Longueurs (int32), dans l'ordre des chunks.
+    """
+    return np.fromiter((compter_tokens(tokenizer, t) for t in texts), dtype=np.int32, count=len(texts))
+
+
+def _save_token_lengths(folder_path, key, lengths):
+    path = _token_lengths_path(folder_path, key)
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, lengths)
+    os.replace(path + ".tmp", path)
+
+
+def write_token_lengths(folder_path, texts, start=0, previous_folder=None):
+    """
+    Enregistre, à l'indexation, les longueurs en tokens des chunks pour chaque modèle local
+    déjà téléchargé. Les modèles téléchargés plus tard sont traités à la première question.
+
+    Args:
+        folder_path (str): Dossier de la conversation.
+        texts (Sequence[str]): Textes de tous les chunks de la conversation.
+        start (int): Nombre de chunks déjà indexés (ajout incrémental) ; seules les longueurs
+            des chunks suivants sont calculées et ajoutées aux longueurs existantes.
+        previous_folder (str, optionnel): Dossier des longueurs existantes (version précédente) ;
+            par défaut `folder_path`.
+    """
+    previous_folder = previous_folder or folder_path
+    if start == 0 and previous_folder == folder_path:
+        # Les longueurs d'un index précédent ne correspondent plus aux chunks : on les supprime
+        for filename in os.listdir(folder_path):
+            if filename.startswith(TOKEN_LENGTHS_PREFIX) and filename.endswith(".npy"):
+                os.remove(os.path.join(folder_path, filename))
+
+    for info in MODEL_INFOS.values():
+        model_path = os.path.join(MODEL_DIR, info["filename"])
+        if not os.path.exists(model_path):
+            continue
+        key = tokenizer_key(model_path)
+        previous_path = _token_lengths_path(previous_folder, key)
+        previous = np.load(previous_path) if start and os.path.exists(previous_path) else None
+        # Fichier absent ou désynchronisé : recalcul complet
+        first = start if previous is not None and len(previous) == start else 0
+        try:
+            lengths = compute_token_lengths(_load_tokenizer(model_path), texts[first:])
+        except Exception as e:
+            print(f"Longueurs en tokens non calculées pour {info['filename']} : {e}")
+            continue
+        if first:
+            lengths = np.concatenate([previous, lengths])
+        _save_token_lengths(folder_path, key, lengths)
+
+
+def load_token_lengths(folder_path, llm, texts):
+    """
+    Retourne les longueurs en tokens des chunks d'une conversation pour le modèle donné.
+    Si elles n'ont pas été calculées à l'indexation (modèle téléchargé depuis), elles sont
+    calculées maintenant avec le tokenizer du modèle puis sauvegardées.
+
+    Args:
+        folder_path (str): Dossier de la version d'index chargée (metadata["folder"]).
+        llm (Llama): Modèle local chargé.
+        texts (Sequence[str]): Textes des chunks de la conversation (même ordre que l'index).
+
+    Returns:
+        np.ndarray: Longueurs (int32).
+    """
+    key = tokenizer_key(llm.model_path)
+    path = _token_lengths_path(folder_path, key)
+
+    def signature():
+        return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+    def loader():
+        lengths = np.load(path) if os.path.exists(path) else None
+        # Fichier absent ou périmé (l'index a changé depuis) : recalcul avec le tokenizer du modèle
+        if lengths is None or len(lengths) != len(texts):
+            lengths = compute_token_lengths(llm, texts)
+            try:
+                _save_token_lengths(folder_path, key, lengths)
+            except OSError as e:
+                # Version remplacée puis supprimée entre-temps : les longueurs restent en cache
+                print(f"Longueurs en tokens non sauvegardées : {e}")
+        return lengths, lengths.nbytes
+
+    return TOKEN_LENGTHS_CACHE.get_or_load(f"{folder_path}/{key}", loader, signature)
+
+
+def assemble_context(results, budget_tokens, token_lengths=None, count_tokens=estimate_tokens):
+    """
+    Assemble les passages les mieux notés dans la limite d'un budget de tokens.
+
+    Les passages sont pris par score décroissant ; un passage qui dépasse le budget restant
+    est ignoré au profit des suivants. Si même le meilleur passage dépasse le budget à lui
+    seul, il est tronqué proportionnellement.
+
+    Args:
+        results (list of dict): Résultats de search() ('texte', 'score', 'chunks').
+        budget_tokens (int): Nombre maximal de tokens pour le contexte.
+        token_lengths (np.ndarray, optionnel): Longueurs en tokens par chunk, calculées à l'indexation.
+        count_tokens (callable): Compteur utilisé pour les passages sans longueurs précalculées.
+
+    Returns:
+        str: Contexte concaténé (chaîne vide si aucun résultat).
+    """
+    if not results:
+        return ""
+
+    def cost(result):
+        chunks = result.get("chunks")
+        if token_lengths is not None and chunks and max(chunks) < len(token_lengths):
+            # Somme des longueurs des chunks + un token par jointure
+            return int(token_lengths[chunks].sum()) + len(chunks)
+        return count_tokens(result["texte"])
+
+    ranked = sorted(results, key=lambda r: r.get("score", 0.0), reverse=True)
+    selected, used = [], 0
+    for result in ranked:
+        n_tokens = cost(result) + (1 if selected else 0)  # séparateur "\n"
+        if used + n_tokens > budget_tokens:
+            continue
+        selected.append(result["texte"])
+        used += n_tokens
+
+    if not selected and budget_tokens > 0:
+        best = ranked[0]
+        n_tokens = max(cost(best), 1)
+        selected.append(best["texte"][: len(best["texte"]) * budget_tokens // n_tokens])
+        used = budget_tokens
+
+    print(f"Contexte assemblé : {len(selected)}/{len(results)} passage(s), ~{used}/{budget_tokens} tokens.")
+    return "\n".join(selected)
+
+
+def assembler_contexte_local(contextes, folder_path, llm, question, texts):
+    """
+    Assemble le contexte pour un modèle local, avec son tokenizer et sa fenêtre n_ctx.
+
+    Args:
+        contextes (list of dict): Résultats de search().
+        folder_path (str): Dossier de la version d'index chargée (metadata["folder"]).
+        llm (Llama): Modèle local chargé.
+        question (str): Question posée (comptée dans le prompt).
+        texts (Sequence[str]): Textes des chunks de la conversation.
+
+    Returns:
+        str: Contexte à injecter dans le prompt.
+    """
+    budget = budget_contexte(llm, question)
+    token_lengths = load_token_lengths(folder_path, llm, texts) if texts is not None else None
+    return assemble_context(contextes, budget, token_lengths, lambda t: compter_tokens(llm, t))
+
+
+def assembler_contexte_enligne(contextes, api_url):
+    """
+    Assemble le contexte pour un modèle en ligne (budget déclaré dans MODELS_ENLIGNE,
+    tokens estimés faute de tokenizer local).
+
+    Args:
+        contextes (list of dict): Résultats de search().
+        api_url (str): Identifiant du modèle en ligne.
+
+    Returns:
+        str: Contexte à injecter dans le prompt.
+    """
+    budget = next(
+        (m.get("budget_contexte", BUDGET_CONTEXTE_ENLIGNE) for m in MODELS_ENLIGNE.values() if m["api_url"] == api_url),
+        BUDGET_CONTEXTE_ENLIGNE,
+    )
+    return assemble_context(contextes, budget)
@@ -0,0 +1,134 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+from modele_embedding import encode_texts
+
+# === Micro-batching des encodages de requêtes ===
+
+# Activation du regroupement ("1") ou encodage direct dans le thread de la requête ("0")
+EMBEDDING_BATCHING = os.getenv("EMBEDDING_BATCHING", "1") == "1"
+# Attente maximale (ms) pour compléter un batch, et taille maximale d'un batch
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", 5.0))
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", 32))
+
+
+def _encode_normalized(texts):
+    return encode_texts(texts, normalize_embeddings=True)
+
+
+class EmbeddingBatcher:
+    """
+    Regroupe les encodages demandés par des requêtes /chat concurrentes.
+
+    Un thread dédié attend la première demande, collecte les suivantes pendant au plus
+    `max_wait_ms` millisecondes ou jusqu'à `max_batch_size` textes, puis encode le tout
+    en un seul appel au modèle. Chaque appelant reçoit un Future avec son vecteur.
+    """
+
+    def __init__(self, encode_fn=_encode_normalized, max_wait_ms=EMBEDDING_BATCH_MAX_WAIT_MS,
+                 max_batch_size=EMBEDDING_BATCH_MAX_SIZE):
+        self.encode_fn = encode_fn
+        self.max_wait_ms = max_wait_ms
+        self.max_batch_size = max_batch_size
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self.batches = 0
+        self.items = 0
+        self.max_seen_batch = 0
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, text):
+        """
+        Soumet un texte à encoder.
+
+        Args:
+            text (str): Texte (déjà normalisé) à encoder.
+
+        Returns:
+            Future: Résolu avec le vecteur float32 du texte.
+        """
+        self._ensure_started()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def submit_many(self, texts):
+        """Soumet plusieurs textes ; retourne un Future par texte, dans l'ordre."""
+        return [self.submit(text) for text in texts]
+
+    def encode(self, texts):
+        """Encode des textes via le dispatcher et attend le résultat (matrice float32)."""
+        futures = self.submit_many(texts)
+        return np.stack([f.result() for f in futures])
+
+    def _collect_batch(self):
+        # Bloque jusqu'à la première demande, puis complète le batch jusqu'à l'échéance
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            texts = [text for text, _ in batch]
+            try:
+                vectors = np.asarray(self.encode_fn(texts), dtype=np.float32)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+            with self._stats_lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.max_seen_batch = max(self.max_seen_batch, len(batch))
+
+    def stats(self):
+        """
+        Retourne les compteurs du dispatcher.
+
+        Returns:
+            dict: batches, items, taille moyenne et maximale des batches, file d'attente courante.
+        """
+        with self._stats_lock:
+            return {
+                "enabled": EMBEDDING_BATCHING,
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+                "max_batch_size_seen": self.max_seen_batch,
+                "queue_size": self._queue.qsize(),
+                "max_wait_ms": self.max_wait_ms,
+                "max_batch_size": self.max_batch_size,
+            }
+
+
+# Dispatcher partagé par le processus
+EMBEDDING_BATCHER = EmbeddingBatcher()
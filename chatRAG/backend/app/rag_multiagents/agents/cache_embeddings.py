@@ -0,0 +1,161 @@
+import os
+import re
+import atexit
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+# === Configuration du cache des embeddings de requêtes ===
+
+# Nombre maximal de requêtes gardées en mémoire
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 4096))
+
+# Fichier .npz de persistance entre redémarrages (désactivée si la variable est vide)
+QUERY_EMBEDDING_CACHE_PATH = os.getenv("QUERY_EMBEDDING_CACHE_PATH", "")
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    """
+    Normalise le texte d'une requête pour qu'une même question tapée différemment
+    (espaces, casse, formes Unicode) partage la même entrée de cache.
+
+    Le tokenizer de BGE-small-en est non sensible à la casse : la mise en minuscules
+    ne modifie pas l'embedding produit.
+
+    Args:
+        query (str): Requête brute.
+
+    Returns:
+        str: Requête normalisée.
+    """
+    query = unicodedata.normalize("NFKC", query)
+    return _WHITESPACE_RE.sub(" ", query).strip().lower()
+
+
+class QueryEmbeddingCache:
+    """
+    Cache LRU thread-safe des embeddings de requêtes, stockés en float32.
+
+    La clé combine le nom (et la version) du modèle d'embedding et le texte normalisé :
+    changer de modèle ne sert jamais un vecteur calculé par un autre.
+    """
+
+    def __init__(self, max_size=QUERY_EMBEDDING_CACHE_SIZE, path=QUERY_EMBEDDING_CACHE_PATH):
+        self.max_size = max_size
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (modèle, requête normalisée) -> np.ndarray float32
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.path:
+            self.load(self.path)
+
+    def get(self, model_name, normalized_query):
+        """Retourne le vecteur en cache ou None."""
+        key = (model_name, normalized_query)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, model_name, normalized_query, vector):
+        """Ajoute un vecteur au cache (converti en float32) et évince les plus anciens."""
+        key = (model_name, normalized_query)
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Vide entièrement le cache."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Retourne les compteurs du cache, utiles pour le dimensionner.
+
+        Returns:
+            dict: hits, misses, evictions, hit_rate, entries, max_size.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "max_size": self.max_size,
+            }
+
+    def save(self, path=None):
+        """
+        Sauvegarde le contenu du cache (ordre LRU conservé) dans un fichier .npz.
+
+        Args:
+            path (str, optionnel): Chemin du fichier ; self.path par défaut.
+        """
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            keys = list(self._entries.keys())
+            vectors = list(self._entries.values())
+
+        if not keys:
+            return
+
+        # Les vecteurs de dimensions différentes (modèles différents) sont regroupés par modèle
+        models = np.array([k[0] for k in keys])
+        queries = np.array([k[1] for k in keys])
+        dims = {v.shape[0] for v in vectors}
+        if len(dims) != 1:
+            print("Cache des requêtes non sauvegardé : dimensions d'embedding hétérogènes.")
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, models=models, queries=queries, vectors=np.stack(vectors))
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        """Recharge un cache sauvegardé par save() ; ignore un fichier absent ou illisible."""
+        if not os.path.exists(path):
+            return
+        try:
+            data = np.load(path)
+            models, queries, vectors = data["models"], data["queries"], data["vectors"]
+        except Exception as e:
+            print(f"Impossible de relire le cache des requêtes {path} : {e}")
+            return
+
+        with self._lock:
+            for model_name, query, vector in zip(models, queries, vectors):
+                self._entries[(str(model_name), str(query))] = vector.astype(np.float32)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        print(f"Cache des requêtes rechargé : {len(self._entries)} entrées.")
+
+
+# Instance partagée par le processus
+QUERY_EMBEDDING_CACHE = QueryEmbeddingCache()
+
+# Persistance automatique à l'arrêt du processus si un chemin est configuré
+if QUERY_EMBEDDING_CACHE_PATH:
+    atexit.register(QUERY_EMBEDDING_CACHE.save)
@@ -0,0 +1,299 @@
+import os
+import json
+import atexit
+import hashlib
+import threading
+
+import numpy as np
+
+# === Cache disque des embeddings de chunks ===
+# Un même document (rapport trimestriel, contrat type...) est souvent importé dans plusieurs
+# conversations : ses chunks produisent exactement les mêmes embeddings. Le cache les
+# conserve sur disque, indexés par hash(modèle + texte du chunk).
+#
+# Organisation du dossier :
+#   vectors.f16   : matrice float16 (capacité x dimension), ouverte en np.memmap
+#   keys.npy      : empreinte SHA-256 tronquée (16 octets) de chaque emplacement (zéros = libre)
+#   last_used.npy : compteur de dernière utilisation par emplacement (éviction LRU)
+#   meta.json     : dimension des vecteurs et compteur courant
+#
+# Les ajouts sont écrits sur disque par flush(), appelée à la fin de chaque indexation
+# (et à l'arrêt du processus) : le coût d'un lot ne dépend pas de la taille du cache.
+
+CHUNK_EMBEDDING_CACHE_DIR = os.getenv(
+    "CHUNK_EMBEDDING_CACHE_DIR", "backend/app/rag_multiagents/embedding_cache"
+)
+# Taille maximale sur disque (vecteurs + clés) ; cache désactivé si 0
+CHUNK_EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("CHUNK_EMBEDDING_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+
+VECTORS_FILENAME = "vectors.f16"
+KEYS_FILENAME = "keys.npy"
+LAST_USED_FILENAME = "last_used.npy"
+META_FILENAME = "meta.json"
+
+KEY_BYTES = 16
+# Croissance du fichier de vecteurs par paliers, pour ne pas le réallouer à chaque ajout
+GROWTH_SLOTS = 4096
+# Proportion de la capacité libérée d'un coup lorsqu'il faut évincer
+EVICTION_FRACTION = 0.05
+
+_EMPTY_KEY = bytes(KEY_BYTES)
+
+
+def chunk_key(model_name, text):
+    """Empreinte d'un chunk pour un modèle donné (16 premiers octets du SHA-256)."""
+    digest = hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).digest()
+    return digest[:KEY_BYTES]
+
+
+class ChunkEmbeddingCache:
+    """
+    Cache persistant et thread-safe des embeddings de chunks, stockés en float16.
+
+    Les vecteurs sont dans un fichier mappé en mémoire ; seule la table
+    empreinte -> emplacement est gardée en mémoire (dict). Lorsque la taille maximale
+    est atteinte, les emplacements les moins récemment utilisés sont réattribués.
+    Le dossier est prévu pour un seul processus écrivain (le backend Flask).
+    """
+
+    def __init__(self, folder_path=CHUNK_EMBEDDING_CACHE_DIR, max_bytes=CHUNK_EMBEDDING_CACHE_MAX_BYTES):
+        self.folder_path = folder_path
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._opened = False
+        self._dim = None
+        self._vectors = None      # np.memmap float16 (capacité, dim)
+        self._keys = None         # np.ndarray S16 (capacité,)
+        self._last_used = None    # np.ndarray int64 (capacité,)
+        self._slots = {}          # empreinte -> emplacement
+        self._free = []           # emplacements libres
+        self._clock = 0
+        self._dirty = False       # ajouts pas encore écrits sur disque
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return bool(self.folder_path) and self.max_bytes > 0
+
+    def _path(self, filename):
+        return os.path.join(self.folder_path, filename)
+
+    def _max_slots(self, dim):
+        return max(1, self.max_bytes // (dim * 2 + KEY_BYTES + 8))
+
+    def _open(self):
+        """Relit le cache depuis le disque au premier accès. Doit être appelée sous self._lock."""
+        if self._opened:
+            return
+        self._opened = True
+        meta_path = self._path(META_FILENAME)
+        vectors_path = self._path(VECTORS_FILENAME)
+        # np.memmap refuse les fichiers vides
+        if not os.path.exists(meta_path) or not os.path.exists(vectors_path) or not os.path.getsize(vectors_path):
+            return
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            keys = np.load(self._path(KEYS_FILENAME))
+            last_used = np.load(self._path(LAST_USED_FILENAME))
+            dim = int(meta["dim"])
+            vectors = np.memmap(vectors_path, dtype=np.float16, mode="r+")
+            vectors = vectors.reshape(-1, dim)
+        except Exception as e:
+            print(f"Cache des embeddings de chunks illisible ({e}) : il sera reconstruit.")
+            return
+
+        capacity = min(len(keys), len(last_used), len(vectors))
+        self._dim = dim
+        self._vectors = vectors[:capacity]
+        self._keys = keys[:capacity].copy()
+        self._last_used = last_used[:capacity].copy()
+        self._clock = int(meta.get("clock", 0))
+        # numpy retire les octets nuls finaux des chaînes S16 : ljust restaure l'empreinte
+        for slot, key in enumerate(self._keys.tolist()):
+            if key:
+                self._slots[key.ljust(KEY_BYTES, b"\0")] = slot
+            else:
+                self._free.append(slot)
+        print(f"Cache des embeddings de chunks : {len(self._slots)} vecteurs sur disque.")
+
+    def _reset(self, dim):
+        """Recrée un cache vide pour une dimension donnée. Doit être appelée sous self._lock."""
+        os.makedirs(self.folder_path, exist_ok=True)
+        self._dim = dim
+        self._vectors = None
+        self._keys = np.zeros(0, dtype=f"S{KEY_BYTES}")
+        self._last_used = np.zeros(0, dtype=np.int64)
+        self._slots = {}
+        self._free = []
+        self._resize(0)
+        self._flush()
+
+    def _resize(self, capacity):
+        """Agrandit les fichiers à `capacity` emplacements. Doit être appelée sous self._lock."""
+        vectors_path = self._path(VECTORS_FILENAME)
+        old_capacity = len(self._keys)
+        with open(vectors_path, "ab") as f:
+            f.truncate(capacity * self._dim * 2)
+        self._vectors = (
+            np.memmap(vectors_path, dtype=np.float16, mode="r+", shape=(capacity, self._dim))
+            if capacity else None
+        )
+        self._keys = np.concatenate([self._keys, np.zeros(capacity - old_capacity, dtype=f"S{KEY_BYTES}")])
+        self._last_used = np.concatenate([self._last_used, np.zeros(capacity - old_capacity, dtype=np.int64)])
+        self._free.extend(range(capacity - 1, old_capacity - 1, -1))
+
+    def _allocate(self, n):
+        """Réserve n emplacements, en agrandissant puis en évinçant si nécessaire. Sous self._lock."""
+        max_slots = self._max_slots(self._dim)
+        missing = n - len(self._free)
+        if missing > 0 and len(self._keys) < max_slots:
+            growth = max(missing, GROWTH_SLOTS)
+            self._resize(min(len(self._keys) + growth, max_slots))
+
+        missing = n - len(self._free)
+        if missing > 0 and self._slots:
+            # Éviction LRU par lot : on libère plus que nécessaire pour amortir le coût
+            n_evict = min(len(self._slots), max(missing, int(len(self._keys) * EVICTION_FRACTION)))
+            used = np.array(list(self._slots.values()), dtype=np.int64)
+            oldest = used[np.argpartition(self._last_used[used], n_evict - 1)[:n_evict]]
+            for slot in oldest.tolist():
+                del self._slots[bytes(self._keys[slot]).ljust(KEY_BYTES, b"\0")]
+                self._keys[slot] = _EMPTY_KEY
+                self._free.append(slot)
+            self.evictions += n_evict
+            # Les clés évincées sont retirées du disque avant que leurs vecteurs soient
+            # remplacés : une clé sur disque ne désigne jamais le vecteur d'un autre chunk
+            self._flush()
+
+        n = min(n, len(self._free))
+        slots = self._free[-n:] if n else []
+        del self._free[len(self._free) - n:]
+        return slots
+
+    def _flush(self):
+        """Écrit les vecteurs puis les clés : une clé ne pointe jamais vers un vecteur non écrit."""
+        if self._vectors is not None:
+            self._vectors.flush()
+        for filename, array in ((KEYS_FILENAME, self._keys), (LAST_USED_FILENAME, self._last_used)):
+            path = self._path(filename)
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(path + ".tmp", path)
+        data = json.dumps({"dim": self._dim, "clock": self._clock}).encode("utf-8")
+        with open(self._path(META_FILENAME) + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(self._path(META_FILENAME) + ".tmp", self._path(META_FILENAME))
+        self._dirty = False
+
+    def flush(self):
+        """Écrit sur disque les embeddings ajoutés depuis la dernière écriture."""
+        with self._lock:
+            if self._dirty:
+                self._flush()
+
+    def get_many(self, model_name, texts):
+        """
+        Cherche les embeddings de plusieurs chunks.
+
+        Args:
+            model_name (str): Modèle d'embedding.
+            texts (List[str]): Textes des chunks.
+
+        Returns:
+            tuple: (liste de vecteurs float32 ou None par texte, indices des textes absents du cache).
+        """
+        keys = [chunk_key(model_name, t) for t in texts]
+        found = [None] * len(texts)
+        missing = []
+        if not self.enabled:
+            return found, list(range(len(texts)))
+
+        with self._lock:
+            self._open()
+            self._clock += 1
+            for i, key in enumerate(keys):
+                slot = self._slots.get(key)
+                if slot is None:
+                    missing.append(i)
+                    continue
+                found[i] = np.asarray(self._vectors[slot], dtype=np.float32)
+                self._last_used[slot] = self._clock
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return found, missing
+
+    def put_many(self, model_name, texts, vectors):
+        """
+        Ajoute des embeddings au cache. Ils sont utilisables aussitôt et écrits sur disque
+        au prochain flush().
+
+        Args:
+            model_name (str): Modèle d'embedding.
+            texts (List[str]): Textes des chunks.
+            vectors (np.ndarray): Embeddings correspondants (n, dim).
+        """
+        if not self.enabled or not len(texts):
+            return
+        vectors = np.asarray(vectors)
+        dim = vectors.shape[1]
+
+        with self._lock:
+            self._open()
+            if self._dim != dim:
+                self._reset(dim)
+
+            new = {}
+            for text, vector in zip(texts, vectors):
+                key = chunk_key(model_name, text)
+                if key not in self._slots:
+                    new[key] = vector
+            if not new:
+                return
+
+            slots = self._allocate(len(new))
+            self._clock += 1
+            for slot, (key, vector) in zip(slots, new.items()):
+                self._vectors[slot] = vector.astype(np.float16)
+                self._keys[slot] = key
+                self._last_used[slot] = self._clock
+                self._slots[key] = slot
+            self._dirty = True
+
+    def clear(self):
+        """Vide entièrement le cache (mémoire et disque)."""
+        with self._lock:
+            self._open()
+            if self._dim is not None:
+                self._reset(self._dim)
+
+    def stats(self):
+        """
+        Retourne les compteurs du cache.
+
+        Returns:
+            dict: hits, misses, evictions, hit_rate, entries, capacité et taille sur disque.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            capacity = len(self._keys) if self._keys is not None else 0
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._slots),
+                "capacity": capacity,
+                "disk_bytes": capacity * ((self._dim or 0) * 2 + KEY_BYTES + 8),
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Instance partagée par le processus
+CHUNK_EMBEDDING_CACHE = ChunkEmbeddingCache()
+atexit.register(CHUNK_EMBEDDING_CACHE.flush)
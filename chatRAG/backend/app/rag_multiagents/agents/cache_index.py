@@ -0,0 +1,253 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# === Configuration du cache des index ===
+
+# Budget mémoire total (en octets) et nombre maximal de conversations gardées en mémoire
+INDEX_CACHE_MAX_BYTES = int(os.getenv("INDEX_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+INDEX_CACHE_MAX_ENTRIES = int(os.getenv("INDEX_CACHE_MAX_ENTRIES", 32))
+
+# Intervalle minimal (en secondes) entre deux vérifications de la signature disque d'une entrée
+INDEX_CACHE_CHECK_INTERVAL = float(os.getenv("INDEX_CACHE_CHECK_INTERVAL", 2.0))
+
+
+class IndexCache:
+    """
+    Cache LRU thread-safe pour les index chargés, indexé par conversation_id.
+
+    L'éviction est bornée à la fois par la taille mémoire estimée des entrées (octets)
+    et par le nombre d'entrées. Chaque entrée peut porter une signature (ex: dates de
+    modification des fichiers) qui est revérifiée au plus toutes les `check_interval`
+    secondes, afin de détecter une réécriture faite par un autre processus.
+
+    Avec `background_reload`, une entrée dont la signature a changé continue d'être servie
+    pendant qu'un thread charge la nouvelle version ; celle-ci remplace l'ancienne une fois
+    prête. Les requêtes en cours terminent sur l'ancienne valeur qu'elles détiennent.
+    """
+
+    def __init__(self, max_bytes=INDEX_CACHE_MAX_BYTES, max_entries=INDEX_CACHE_MAX_ENTRIES,
+                 check_interval=INDEX_CACHE_CHECK_INTERVAL, background_reload=False):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self.background_reload = background_reload
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # clé -> dict(value, size, signature, checked_at, loader)
+        self._key_locks = {}           # clé -> verrou de chargement (évite les chargements en double)
+        self._total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.background_reloads = 0
+
+    @staticmethod
+    def _key(conversation_id):
+        # Les IDs arrivent tantôt en int, tantôt en str : on normalise la clé
+        return str(conversation_id)
+
+    def _key_lock(self, key):
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def _drop_key_lock(self, key):
+        # Doit être appelée sous self._lock. Un verrou détenu (chargement en cours) est conservé ;
+        # au pire, un thread qui allait le prendre en crée un autre et charge la clé en double
+        lock = self._key_locks.get(key)
+        if lock is not None and not lock.locked():
+            del self._key_locks[key]
+
+    def _release_key_lock(self, key):
+        # Après un chargement : sans entrée (échec du chargement, valeur trop grosse), le verrou
+        # de la clé est supprimé, pour ne pas en garder un par clé demandée
+        with self._lock:
+            if key not in self._entries:
+                self._drop_key_lock(key)
+
+    def _lookup(self, key, signature):
+        """
+        Retourne l'entrée en cache si elle est encore valide (et compte un succès), sinon None.
+
+        Prend self._lock ; la signature (accès disque) est calculée hors du verrou global,
+        par un seul thread à la fois pour une entrée donnée.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            now = time.monotonic()
+            if signature is None or now - entry["checked_at"] < self.check_interval:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            # Les autres threads servent l'entrée sans vérifier pendant ce calcul
+            entry["checked_at"] = now
+
+        current = signature()
+
+        with self._lock:
+            if self._entries.get(key) is not entry:
+                # Entrée remplacée ou supprimée pendant la vérification : on relit l'état courant
+                entry = self._entries.get(key)
+                if entry is None:
+                    return None
+            elif current != entry["signature"]:
+                if not (self.background_reload and current is not None and entry["loader"] is not None):
+                    self._remove(key)
+                    self.invalidations += 1
+                    return None
+                # L'ancienne valeur reste servie jusqu'à la fin du rechargement
+                if not entry.get("reloading"):
+                    entry["reloading"] = True
+                    self._start_reload(key, entry["loader"], signature)
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def get_or_load(self, conversation_id, loader, signature=None):
+        """
+        Retourne la valeur en cache pour la conversation, ou la charge via `loader`.
+
+        Args:
+            conversation_id (int ou str): Identifiant de la conversation.
+            loader (callable): Fonction sans argument retournant (valeur, taille_en_octets).
+            signature (callable, optionnel): Fonction sans argument retournant une signature
+                comparable de l'état sur disque ; une différence invalide l'entrée.
+
+        Returns:
+            object: La valeur chargée (ou servie depuis le cache).
+        """
+        key = self._key(conversation_id)
+
+        entry = self._lookup(key, signature)
+        if entry is not None:
+            return entry["value"]
+
+        # Un seul chargement par clé à la fois : les autres threads attendent puis relisent le cache
+        try:
+            with self._key_lock(key):
+                entry = self._lookup(key, signature)
+                if entry is not None:
+                    return entry["value"]
+                with self._lock:
+                    self.misses += 1
+
+                current_signature = signature() if signature is not None else None
+                value, size = loader()
+                self.put(conversation_id, value, size, current_signature, loader)
+                return value
+        finally:
+            self._release_key_lock(key)
+
+    def _start_reload(self, key, loader, signature):
+        def reload():
+            try:
+                with self._key_lock(key):
+                    try:
+                        current_signature = signature()
+                        value, size = loader()
+                    except Exception as e:
+                        print(f"Rechargement en arrière-plan impossible pour '{key}' : {e}")
+                        self.invalidate(key)
+                        return
+                    self.put(key, value, size, current_signature, loader)
+                    with self._lock:
+                        self.background_reloads += 1
+            finally:
+                self._release_key_lock(key)
+
+        threading.Thread(target=reload, name=f"index-reload-{key}", daemon=True).start()
+
+    def mark_stale(self, conversation_id):
+        """
+        Force la revérification de la signature d'une entrée au prochain accès
+        (ex: après publication d'une nouvelle version par ce processus).
+        """
+        key = self._key(conversation_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry["checked_at"] = float("-inf")
+
+    def put(self, conversation_id, value, size, signature=None, loader=None):
+        """Insère (ou remplace) une entrée puis applique la politique d'éviction."""
+        key = self._key(conversation_id)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            # Une entrée plus grosse que le budget total n'est pas mise en cache
+            if size > self.max_bytes:
+                return
+
+            self._entries[key] = {
+                "value": value,
+                "size": size,
+                "signature": signature,
+                "checked_at": time.monotonic(),
+                "loader": loader,
+            }
+            self._total_bytes += size
+            self._evict()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry["size"]
+        self._drop_key_lock(key)
+
+    def _evict(self):
+        # Éviction des entrées les moins récemment utilisées (début de l'OrderedDict)
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+
+    def invalidate(self, conversation_id):
+        """Supprime l'entrée d'une conversation (ex: après réécriture de son index)."""
+        key = self._key(conversation_id)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        """Vide entièrement le cache."""
+        with self._lock:
+            for key in list(self._key_locks):
+                self._drop_key_lock(key)
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        """
+        Retourne les compteurs du cache.
+
+        Returns:
+            dict: hits, misses, evictions, invalidations, hit_rate, entries, bytes.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "background_reloads": self.background_reloads,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+            }
+
+
+# Instance partagée par l'agent de recherche et l'agent de prétraitement
+INDEX_CACHE = IndexCache(background_reload=True)
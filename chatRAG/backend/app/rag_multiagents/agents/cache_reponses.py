@@ -0,0 +1,143 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# === Configuration du cache sémantique des réponses ===
+
+# Distance cosinus maximale entre deux questions pour réutiliser une réponse
+ANSWER_CACHE_MAX_DISTANCE = float(os.getenv("ANSWER_CACHE_MAX_DISTANCE", 0.05))
+# Durée de vie d'une réponse en cache (secondes)
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 3600))
+# Nombre total de réponses gardées en mémoire (toutes conversations confondues)
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 2048))
+
+
+class AnswerCache:
+    """
+    Cache sémantique thread-safe des réponses générées.
+
+    Les réponses sont rangées par (conversation_id, version de l'index, modèle, mode de génération).
+    Une question est servie depuis le cache si son embedding (normalisé) est à une distance
+    cosinus inférieure à `max_distance` d'une question déjà posée dans le même groupe.
+    """
+
+    def __init__(self, max_distance=ANSWER_CACHE_MAX_DISTANCE, ttl=ANSWER_CACHE_TTL,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # id -> dict(key, embedding, question, answer, created_at)
+        self._by_key = {}              # clé de groupe -> liste d'ids
+        self._next_id = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _group_key(conversation_id, index_version, model_name, mode):
+        return (str(conversation_id), index_version, model_name, mode)
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        ids = self._by_key.get(entry["key"])
+        if ids is not None:
+            ids.remove(entry_id)
+            if not ids:
+                del self._by_key[entry["key"]]
+
+    def lookup(self, conversation_id, index_version, model_name, mode, embedding):
+        """
+        Cherche une réponse pour une question proche.
+
+        Args:
+            conversation_id (int ou str): ID de la conversation.
+            index_version: Version de l'index de la conversation (None si aucun index).
+            model_name (str): Modèle de génération.
+            mode (str): Mode de génération (ex: "local", "enligne").
+            embedding (np.ndarray): Embedding normalisé de la question.
+
+        Returns:
+            str ou None: Réponse en cache, ou None.
+        """
+        key = self._group_key(conversation_id, index_version, model_name, mode)
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        now = time.monotonic()
+
+        with self._lock:
+            best_id, best_similarity = None, 1.0 - self.max_distance
+            for entry_id in list(self._by_key.get(key, [])):
+                entry = self._entries[entry_id]
+                if now - entry["created_at"] > self.ttl:
+                    self._remove(entry_id)
+                    self.expirations += 1
+                    continue
+                similarity = float(np.dot(entry["embedding"], embedding))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id]["answer"]
+
+    def store(self, conversation_id, index_version, model_name, mode, embedding, question, answer):
+        """Ajoute une réponse au cache et évince les plus anciennes si nécessaire."""
+        key = self._group_key(conversation_id, index_version, model_name, mode)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "key": key,
+                "embedding": np.asarray(embedding, dtype=np.float32).ravel(),
+                "question": question,
+                "answer": answer,
+                "created_at": time.monotonic(),
+            }
+            self._by_key.setdefault(key, []).append(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_conversation(self, conversation_id):
+        """Supprime toutes les réponses d'une conversation (ex: après reconstruction de son index)."""
+        conversation_id = str(conversation_id)
+        with self._lock:
+            for key in [k for k in self._by_key if k[0] == conversation_id]:
+                for entry_id in list(self._by_key[key]):
+                    self._remove(entry_id)
+
+    def stats(self):
+        """
+        Retourne les compteurs du cache.
+
+        Returns:
+            dict: hits, misses, evictions, expirations, hit_rate, entries.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "max_distance": self.max_distance,
+                "ttl": self.ttl,
+            }
+
+
+# Instance partagée par le processus
+ANSWER_CACHE = AnswerCache()
@@ -0,0 +1,155 @@
+import threading
+from collections import deque
+
+# === Découpage récursif des textes en chunks ===
+# Reproduit le découpage de RecursiveCharacterTextSplitter (LangChain 0.2, keep_separator=True,
+# strip_whitespace=True) sans copier de sous-chaînes : chaque morceau est un intervalle
+# (début, fin) du texte d'origine. Les morceaux d'un même niveau sont contigus, un chunk
+# fusionné est donc simplement text[début du premier:fin du dernier].
+#
+# Chaque niveau de séparateur parcourt une fois la portion de texte qu'il reçoit :
+# le coût total est linéaire en la taille du texte (au plus len(separators) passes).
+
+DEFAULT_SEPARATORS = ["\n\n", "\n", " ", ""]
+
+
+def char_lengths(text, spans):
+    """Longueur en caractères de chaque intervalle."""
+    return [end - start for start, end in spans]
+
+
+def token_length_function(tokenizer):
+    """
+    Crée une fonction de longueur en tokens pour RecursiveTextChunker.
+
+    Args:
+        tokenizer: Tokenizer Hugging Face (ex: celui du modèle d'embedding BGE).
+
+    Returns:
+        callable: (text, spans) -> nombre de tokens (sans tokens spéciaux) de chaque intervalle.
+    """
+    # Les tokenizers rapides ne supportent pas les appels concurrents (pool de découpage)
+    lock = threading.Lock()
+
+    def lengths(text, spans):
+        if not spans:
+            return []
+        with lock:
+            encoded = tokenizer([text[start:end] for start, end in spans], add_special_tokens=False)
+        return [len(ids) for ids in encoded["input_ids"]]
+    return lengths
+
+
+class RecursiveTextChunker:
+    """
+    Découpe un texte en chunks d'au plus `chunk_size` (caractères ou tokens) avec chevauchement.
+
+    Le texte est coupé sur le premier séparateur présent (dans l'ordre de `separators`),
+    le séparateur restant attaché au début du morceau suivant ; les morceaux trop longs
+    sont redécoupés avec les séparateurs suivants, puis les morceaux sont regroupés
+    jusqu'à `chunk_size` en gardant au plus `chunk_overlap` de recouvrement.
+
+    Args:
+        chunk_size (int): Taille maximale d'un chunk.
+        chunk_overlap (int): Recouvrement maximal entre deux chunks consécutifs.
+        separators (List[str]): Séparateurs, du plus grossier au plus fin ("" = caractère).
+        length_function (callable): (text, spans) -> longueurs ; caractères par défaut.
+    """
+
+    def __init__(self, chunk_size=500, chunk_overlap=100, separators=None, length_function=char_lengths):
+        if chunk_overlap > chunk_size:
+            raise ValueError(
+                f"Le chevauchement ({chunk_overlap}) doit être inférieur à la taille des chunks ({chunk_size})."
+            )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = list(separators or DEFAULT_SEPARATORS)
+        self.length_function = length_function
+
+    def split_text(self, text):
+        """Découpe un texte ; retourne la liste des chunks (chaînes)."""
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+    def split_spans(self, text):
+        """
+        Découpe un texte et retourne la position de chaque chunk.
+
+        Returns:
+            List[Tuple[int, int]]: Intervalles (début, fin) en caractères ; text[début:fin] est le chunk.
+        """
+        chunks = []
+        self._split(text, 0, len(text), self.separators, chunks)
+        return chunks
+
+    def _split_on(self, text, start, end, separator):
+        # Équivalent de re.split avec le séparateur conservé en tête du morceau suivant
+        if separator == "":
+            return [(i, i + 1) for i in range(start, end)]
+        spans = []
+        piece_start = start
+        position = text.find(separator, start, end)
+        while position != -1:
+            if position > piece_start:
+                spans.append((piece_start, position))
+            piece_start = position
+            position = text.find(separator, position + len(separator), end)
+        if end > piece_start:
+            spans.append((piece_start, end))
+        return spans
+
+    def _split(self, text, start, end, separators, chunks):
+        separator = separators[-1]
+        next_separators = []
+        for i, candidate in enumerate(separators):
+            if candidate == "":
+                separator = candidate
+                break
+            if text.find(candidate, start, end) != -1:
+                separator = candidate
+                next_separators = separators[i + 1:]
+                break
+
+        splits = self._split_on(text, start, end, separator)
+        lengths = self.length_function(text, splits)
+
+        good = []
+        for span, length in zip(splits, lengths):
+            if length < self.chunk_size:
+                good.append((span, length))
+                continue
+            if good:
+                self._merge(text, good, chunks)
+                good = []
+            if not next_separators:
+                chunks.append(span)
+            else:
+                self._split(text, span[0], span[1], next_separators, chunks)
+        if good:
+            self._merge(text, good, chunks)
+
+    def _emit(self, text, current, chunks):
+        # Chunk = texte continu du premier au dernier morceau, sans espaces aux extrémités
+        start, end = current[0][0][0], current[-1][0][1]
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end > start:
+            chunks.append((start, end))
+
+    def _merge(self, text, splits, chunks):
+        # Les séparateurs sont conservés dans les morceaux : aucune longueur de jointure
+        current = deque()
+        total = 0
+        for split in splits:
+            length = split[1]
+            if total + length > self.chunk_size:
+                if current:
+                    self._emit(text, current, chunks)
+                    # Retire les premiers morceaux jusqu'à ne garder que le recouvrement voulu
+                    while total > self.chunk_overlap or (total + length > self.chunk_size and total > 0):
+                        total -= current.popleft()[1]
+            current.append(split)
+            total += length
+        if current:
+            self._emit(text, current, chunks)
@@ -0,0 +1,216 @@
+import io
+import os
+import csv
+import time
+import atexit
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import PyPDF2
+import docx
+import openpyxl
+
+# === Extraction du texte brut des fichiers, en flux ===
+# Chaque extracteur est un générateur qui produit le texte morceau par morceau (page,
+# ligne, paragraphe) : la concaténation des morceaux donne le texte complet du fichier.
+#
+# Les pages des PDF volumineux sont extraites en parallèle dans un pool de processus
+# (PyPDF2 est du Python pur : les threads ne donneraient aucun gain à cause du GIL),
+# par paquets de pages, en conservant l'ordre du document.
+#
+# Les tableurs sont lus ligne par ligne (openpyxl en lecture seule, csv.reader) : la mémoire
+# utilisée ne dépend que du texte produit, que collect_text peut plafonner.
+#
+# Ce module ne dépend ni de la base ni de MinIO. Les processus du pool (forkserver ou spawn)
+# réimportent toutefois le script principal sous le nom __mp_main__ : le point d'entrée du
+# serveur (application.py) n'importe donc l'application (serveur.py) que sous son garde
+# __main__, sans quoi chaque processus du pool se reconnecterait à PostgreSQL et à MinIO.
+
+SUPPORTED_EXTENSIONS = ("pdf", "txt", "csv", "docx", "xlsx")
+
+# Processus d'extraction des PDF (1 = extraction dans le processus courant)
+PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", min(4, os.cpu_count() or 1)))
+# Pages extraites par tâche envoyée au pool
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 16))
+# En dessous de ce nombre de pages, le coût du pool dépasse le gain
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 32))
+# Taille des blocs lus dans les fichiers texte
+TEXT_READ_BLOCK_SIZE = 1024 * 1024
+# Taille maximale (octets UTF-8) du texte extrait d'un fichier ; le reste est ignoré (0 = pas de limite)
+EXTRACTION_MAX_BYTES = int(os.getenv("EXTRACTION_MAX_BYTES", 0))
+# Intervalle minimal entre deux appels du suivi de progression
+EXTRACTION_PROGRESS_SECONDS = 1.0
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _mp_context():
+    # Pas de fork : le processus de l'application a d'autres threads (torch, EmbeddingBatcher,
+    # tâches d'ingestion) et un enfant forké peut rester bloqué sur un verrou qu'ils détenaient.
+    # forkserver crée les processus depuis un serveur monothread lancé à part ; spawn sinon (Windows)
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+
+def _get_pool():
+    """Pool de processus partagé, créé au premier PDF volumineux."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PDF_EXTRACTION_WORKERS, mp_context=_mp_context())
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def extract_pdf_pages(file_path, start, end):
+    """
+    Extrait le texte des pages [start, end) d'un PDF (exécutée dans un processus du pool).
+
+    Returns:
+        List[str]: Texte de chaque page.
+    """
+    with open(file_path, "rb") as pdf_file:
+        reader = PyPDF2.PdfReader(pdf_file)
+        return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def iter_pdf_pages(file_path, workers=PDF_EXTRACTION_WORKERS, pages_per_task=PDF_PAGES_PER_TASK):
+    """
+    Produit le texte des pages d'un PDF, dans l'ordre.
+
+    Au plus 2 tâches par processus sont en cours à la fois : la mémoire occupée ne dépend
+    pas du nombre de pages.
+
+    Yields:
+        str: Texte d'une page.
+    """
+    with open(file_path, "rb") as pdf_file:
+        reader = PyPDF2.PdfReader(pdf_file)
+        n_pages = len(reader.pages)
+        if workers <= 1 or n_pages < PDF_PARALLEL_MIN_PAGES:
+            for page in reader.pages:
+                yield page.extract_text() or ""
+            return
+
+    pool = _get_pool()
+    pending = deque()
+    try:
+        for start in range(0, n_pages, pages_per_task):
+            end = min(start + pages_per_task, n_pages)
+            pending.append(pool.submit(extract_pdf_pages, file_path, start, end))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # Générateur abandonné (erreur, arrêt du consommateur) : les paquets restants sont annulés
+        for future in pending:
+            future.cancel()
+
+
+def _iter_lines(lines):
+    # Lignes séparées par "\n", sans "\n" final
+    for i, line in enumerate(lines):
+        yield ("\n" if i else "") + line
+
+
+def iter_text(file_path):
+    """
+    Produit le texte brut d'un fichier morceau par morceau, selon son extension.
+    Prend en charge : PDF, TXT, CSV, DOCX, XLSX.
+
+    Args:
+        file_path (str): Chemin vers le fichier local.
+
+    Yields:
+        str: Morceaux de texte (page, ligne, paragraphe) ; leur concaténation est le texte du fichier.
+
+    Raises:
+        ValueError: Si le format n'est pas pris en charge.
+    """
+    file_extension = file_path.split('.')[-1].lower()
+
+    if file_extension == "pdf":
+        for page_text in iter_pdf_pages(file_path):
+            yield page_text + "\n"
+
+    elif file_extension == "txt":
+        with open(file_path, "r", encoding="utf-8") as txt_file:
+            for block in iter(lambda: txt_file.read(TEXT_READ_BLOCK_SIZE), ""):
+                yield block
+
+    elif file_extension == "csv":
+        with open(file_path, "r", encoding="utf-8") as csv_file:
+            yield from _iter_lines(", ".join(row) for row in csv.reader(csv_file))
+
+    elif file_extension == "docx":
+        doc = docx.Document(file_path)
+        yield from _iter_lines(para.text for para in doc.paragraphs)
+
+    elif file_extension == "xlsx":
+        # Lecture seule : les lignes sont lues à la demande au lieu de charger tout le classeur.
+        # Comme avant le passage en flux, une cellule de formule donne sa formule ("=SUM(B1:B2)")
+        # et non la valeur mise en cache par le tableur (absente des fichiers générés par programme)
+        wb = openpyxl.load_workbook(file_path, read_only=True)
+        try:
+            for sheet in wb.worksheets:
+                for row in sheet.iter_rows(values_only=True):
+                    yield "\t".join([str(cell) if cell else "" for cell in row]) + "\n"
+        finally:
+            wb.close()
+
+    else:
+        raise ValueError(f"Format {file_extension.upper()} non supporté pour l'extraction de texte.")
+
+
+def collect_text(file_path, max_bytes=EXTRACTION_MAX_BYTES, progress=None):
+    """
+    Assemble le texte d'un fichier à partir de iter_text, dans un tampon unique.
+
+    Args:
+        file_path (str): Chemin vers le fichier local.
+        max_bytes (int): Taille maximale (octets UTF-8) du texte ; 0 = pas de limite.
+            Au-delà, la lecture s'arrête et le texte est tronqué.
+        progress (callable, optionnel): progress(statistiques) appelée au plus chaque
+            EXTRACTION_PROGRESS_SECONDS pendant la lecture, puis à la fin.
+
+    Returns:
+        tuple: (texte, statistiques {"pieces", "bytes", "truncated", "seconds"}).
+    """
+    buffer = io.StringIO()
+    stats = {"pieces": 0, "bytes": 0, "truncated": False, "seconds": 0.0}
+    start = last_report = time.perf_counter()
+
+    pieces = iter_text(file_path)
+    try:
+        for piece in pieces:
+            size = len(piece.encode("utf-8"))
+            if max_bytes and stats["bytes"] + size > max_bytes:
+                # Coupe au dernier caractère complet sous la limite
+                remaining = max_bytes - stats["bytes"]
+                piece = piece.encode("utf-8")[:remaining].decode("utf-8", errors="ignore")
+                size = len(piece.encode("utf-8"))
+                stats["truncated"] = True
+            buffer.write(piece)
+            stats["pieces"] += 1
+            stats["bytes"] += size
+            if stats["truncated"]:
+                break
+            now = time.perf_counter()
+            if progress is not None and now - last_report >= EXTRACTION_PROGRESS_SECONDS:
+                last_report = now
+                stats["seconds"] = round(now - start, 3)
+                progress(dict(stats))
+    finally:
+        # Ferme le fichier (et annule les pages PDF restantes) si la lecture s'arrête avant la fin
+        pieces.close()
+
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    if stats["truncated"]:
+        print(f"Texte de '{os.path.basename(file_path)}' tronqué à {max_bytes} octets (EXTRACTION_MAX_BYTES).")
+    if progress is not None:
+        progress(dict(stats))
+    return buffer.getvalue(), stats
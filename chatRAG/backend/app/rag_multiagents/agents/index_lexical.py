@@ -0,0 +1,277 @@
+import os
+import re
+import json
+import time
+import unicodedata
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from cache_index import IndexCache, INDEX_CACHE_MAX_ENTRIES
+
+# === Index lexical BM25 par conversation ===
+# Fichiers écrits à côté de l'index FAISS, dans faiss_index/<conversation_id>/ :
+#   lex_vocab.json    : liste des termes (position = identifiant du terme)
+#   lex_df.npy        : fréquence documentaire de chaque terme (int32)
+#   lex_offsets.npy   : début des postings de chaque terme (int64, V+1 valeurs)
+#   lex_docs.npy      : indices des chunks de chaque posting (int32)
+#   lex_tf.npy        : fréquence du terme dans le chunk (uint16)
+#   lex_doclen.npy    : longueur de chaque chunk en tokens (int32)
+
+LEX_VOCAB_FILENAME = "lex_vocab.json"
+LEX_ARRAYS = ("df", "offsets", "docs", "tf", "doclen")
+
+# Paramètres BM25 classiques
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Budget mémoire du cache des index lexicaux
+LEXICAL_CACHE_MAX_BYTES = int(os.getenv("LEXICAL_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+
+# Nombres (102.7, 1,234.5), sigles et mots : on garde les séparateurs internes des nombres
+_TOKEN_RE = re.compile(r"\w+(?:[.,]\w+)*")
+
+
+def tokenize(text):
+    """
+    Découpe un texte en tokens lexicaux normalisés (minuscules, NFKC).
+    Les montants et références (ex: "102.7", "1,234") restent des tokens uniques.
+    """
+    return _TOKEN_RE.findall(unicodedata.normalize("NFKC", text).lower())
+
+
+def _array_path(folder_path, name):
+    return os.path.join(folder_path, f"lex_{name}.npy")
+
+
+def lexical_files(folder_path):
+    """Retourne la liste des fichiers de l'index lexical d'une conversation."""
+    return [os.path.join(folder_path, LEX_VOCAB_FILENAME)] + [_array_path(folder_path, n) for n in LEX_ARRAYS]
+
+
+def _postings(texts, vocabulary, first_doc=0):
+    """
+    Postings des chunks `texts` (numérotés à partir de `first_doc`), triés par terme puis par chunk.
+    Les termes inconnus sont ajoutés à `vocabulary`.
+
+    Returns:
+        tuple: (identifiants des termes, indices des chunks, fréquences, longueurs des chunks en tokens).
+    """
+    term_ids, doc_ids, tfs = array("i"), array("i"), array("H")
+    doclen = np.zeros(len(texts), dtype=np.int32)
+
+    for i, text in enumerate(texts):
+        tokens = tokenize(text)
+        doclen[i] = len(tokens)
+        for term, tf in Counter(tokens).items():
+            term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+            doc_ids.append(first_doc + i)
+            tfs.append(min(tf, 65535))
+
+    term_ids = np.frombuffer(term_ids, dtype=np.int32)
+    # Tri stable par terme : les postings de chaque terme restent triés par chunk
+    order = np.argsort(term_ids, kind="stable")
+    return (
+        term_ids[order],
+        np.frombuffer(doc_ids, dtype=np.int32)[order],
+        np.frombuffer(tfs, dtype=np.uint16)[order],
+        doclen,
+    )
+
+
+def _read_lexical_arrays(folder_path):
+    """Vocabulaire et tableaux (mmap) d'un index lexical, ou None s'il est absent ou incomplet."""
+    try:
+        with open(os.path.join(folder_path, LEX_VOCAB_FILENAME), "r", encoding="utf-8") as f:
+            vocabulary = json.load(f)
+        arrays = {name: np.load(_array_path(folder_path, name), mmap_mode="r") for name in LEX_ARRAYS}
+    except (FileNotFoundError, ValueError):
+        return None
+    return vocabulary, arrays
+
+
+def write_lexical_index(folder_path, texts, start=0, previous_folder=None):
+    """
+    Construit et sauvegarde l'index inversé BM25 des chunks d'une conversation.
+
+    Lors d'un ajout incrémental, seuls les nouveaux chunks sont tokenisés : leurs postings,
+    fréquences documentaires et longueurs sont fusionnés avec les tableaux de la version
+    précédente, recopiés tels quels. Les nouveaux chunks ayant les plus grands indices, les
+    postings de chaque terme restent triés par chunk. Le résultat est identique à une
+    reconstruction complète (à l'ordre du vocabulaire près).
+
+    Args:
+        folder_path (str): Dossier de la conversation.
+        texts (Sequence[str]): Textes de tous les chunks, dans l'ordre des vecteurs de l'index FAISS.
+        start (int): Nombre de chunks déjà indexés dans `previous_folder` (ajout incrémental).
+        previous_folder (str, optionnel): Version précédente, dont l'index lexical est repris.
+            Absent, désynchronisé (nombre de chunks différent de `start`) ou non fourni :
+            reconstruction complète.
+    """
+    previous = _read_lexical_arrays(previous_folder) if start and previous_folder else None
+    if previous is not None and len(previous[1]["doclen"]) != start:
+        previous = None
+    if previous is None:
+        start = 0
+
+    vocabulary = {}
+    if previous is not None:
+        vocabulary = {term: i for i, term in enumerate(previous[0])}
+    new_terms, new_docs, new_tf, new_doclen = _postings(texts[start:], vocabulary, first_doc=start)
+
+    n_terms = len(vocabulary)
+    df = np.bincount(new_terms, minlength=n_terms).astype(np.int32)
+    if previous is None:
+        offsets = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(df, out=offsets[1:])
+        arrays = {"df": df, "offsets": offsets, "docs": new_docs, "tf": new_tf, "doclen": new_doclen}
+    else:
+        old = previous[1]
+        old_df = np.zeros(n_terms, dtype=np.int32)
+        old_df[:len(old["df"])] = old["df"]
+        added_df = df
+        df = old_df + added_df
+        offsets = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(df, out=offsets[1:])
+
+        docs = np.empty(int(offsets[-1]), dtype=np.int32)
+        tf = np.empty(int(offsets[-1]), dtype=np.uint16)
+        # Anciens postings : chaque terme est décalé du nombre de postings ajoutés aux termes précédents
+        n_old_terms = len(old["df"])
+        shift = offsets[:n_old_terms] - old["offsets"][:n_old_terms]
+        old_dest = np.arange(len(old["docs"]), dtype=np.int64) + np.repeat(shift, old["df"])
+        docs[old_dest] = old["docs"]
+        tf[old_dest] = old["tf"]
+        # Nouveaux postings : à la suite des anciens postings du même terme
+        added_start = np.zeros(n_terms, dtype=np.int64)
+        np.cumsum(added_df[:-1], out=added_start[1:])
+        rank = np.arange(len(new_terms), dtype=np.int64) - added_start[new_terms]
+        new_dest = offsets[new_terms] + old_df[new_terms] + rank
+        docs[new_dest] = new_docs
+        tf[new_dest] = new_tf
+
+        doclen = np.concatenate([old["doclen"], new_doclen])
+        arrays = {"df": df, "offsets": offsets, "docs": docs, "tf": tf, "doclen": doclen}
+
+    for name, values in arrays.items():
+        tmp_path = _array_path(folder_path, name) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, values)
+        os.replace(tmp_path, _array_path(folder_path, name))
+
+    # Le vocabulaire est écrit en dernier : sa présence signale un index complet
+    vocab_path = os.path.join(folder_path, LEX_VOCAB_FILENAME)
+    with open(vocab_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(list(vocabulary), f, ensure_ascii=False)
+    os.replace(vocab_path + ".tmp", vocab_path)
+
+
+class LexicalIndex:
+    """Index inversé BM25 d'une conversation, tableaux de postings ouverts en mmap."""
+
+    def __init__(self, folder_path):
+        with open(os.path.join(folder_path, LEX_VOCAB_FILENAME), "r", encoding="utf-8") as f:
+            self.term_to_id = {term: i for i, term in enumerate(json.load(f))}
+        self.df, self.offsets, self.docs, self.tf, self.doclen = (
+            np.load(_array_path(folder_path, name), mmap_mode="r") for name in LEX_ARRAYS
+        )
+        self.n_docs = len(self.doclen)
+        self.avgdl = float(self.doclen.mean()) if self.n_docs else 0.0
+
+    @property
+    def nbytes(self):
+        """Taille estimée (octets) : vocabulaire en mémoire + tableaux mappés."""
+        vocab_bytes = sum(len(t) + 80 for t in self.term_to_id)
+        arrays_bytes = sum(a.nbytes for a in (self.df, self.offsets, self.docs, self.tf, self.doclen))
+        return vocab_bytes + arrays_bytes
+
+    def search(self, query, top_n=20, budget_ms=None):
+        """
+        Score BM25 des chunks pour une requête.
+
+        Les termes sont traités du plus rare au plus fréquent : si le budget de temps
+        est dépassé, on s'arrête avec les termes les plus discriminants déjà comptés.
+
+        Args:
+            query (str): Requête utilisateur.
+            top_n (int): Nombre maximum de chunks retournés.
+            budget_ms (float, optionnel): Budget de temps pour le calcul des scores.
+
+        Returns:
+            tuple: (indices des chunks, scores BM25), triés par score décroissant.
+        """
+        start = time.perf_counter()
+        term_ids = {self.term_to_id[t] for t in tokenize(query) if t in self.term_to_id}
+        if not term_ids or not self.n_docs:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term_id in sorted(term_ids, key=lambda t: self.df[t]):
+            begin, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            docs = self.docs[begin:end]
+            tf = self.tf[begin:end].astype(np.float32)
+            df = float(self.df[term_id])
+            idf = np.log(1.0 + (self.n_docs - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self.doclen[docs] / self.avgdl)
+            scores[docs] += idf * tf * (BM25_K1 + 1.0) / (tf + norm)
+
+            if budget_ms is not None and (time.perf_counter() - start) * 1000 > budget_ms:
+                break
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_n:
+            candidates = candidates[np.argpartition(-scores[candidates], top_n - 1)[:top_n]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return candidates, scores[candidates]
+
+
+# Cache des index lexicaux, chargés à la demande (indépendant du cache des index FAISS)
+LEXICAL_CACHE = IndexCache(max_bytes=LEXICAL_CACHE_MAX_BYTES, max_entries=INDEX_CACHE_MAX_ENTRIES)
+
+
+def load_lexical_index(folder_path):
+    """
+    Charge (ou sert depuis LEXICAL_CACHE) l'index lexical d'une version d'index.
+
+    Le cache est indexé par dossier de version : l'index lexical servi correspond toujours
+    à l'index FAISS chargé depuis le même dossier, même pendant la publication d'une
+    nouvelle version.
+
+    Returns:
+        LexicalIndex ou None: None si la conversation n'a pas d'index lexical (index antérieur).
+    """
+    paths = lexical_files(folder_path)
+
+    def signature():
+        try:
+            return tuple(os.stat(path).st_mtime_ns for path in paths)
+        except FileNotFoundError:
+            return None
+
+    def loader():
+        index = LexicalIndex(folder_path)
+        return index, index.nbytes
+
+    try:
+        return LEXICAL_CACHE.get_or_load(folder_path, loader, signature)
+    except FileNotFoundError:
+        return None
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fusionne plusieurs classements par Reciprocal Rank Fusion.
+
+    Args:
+        rankings (List[Sequence[int]]): Classements d'indices de chunks (meilleur en premier).
+        k (int): Constante de lissage RRF.
+
+    Returns:
+        List[Tuple[int, float]]: (indice, score fusionné), triés par score décroissant.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, idx in enumerate(ranking):
+            fused[int(idx)] = fused.get(int(idx), 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,93 @@
+import gc
+import threading
+
+from sentence_transformers import SentenceTransformer
+
+# === Modèle d'embedding partagé par tous les agents ===
+
+# Modèle anglais compact et rapide
+EMBEDDING_MODEL_NAME = "BAAI/bge-small-en-v1.5"
+# Pour du multilingue : paraphrase-multilingual-mpnet-base-v2
+
+# Longueur maximale d'une entrée du modèle, tokens spéciaux ([CLS], [SEP]) compris
+EMBEDDING_MAX_TOKENS = 512
+
+_model = None
+_model_lock = threading.Lock()
+_tokenizer = None
+
+
+def get_embedding_model():
+    """
+    Retourne l'instance unique du modèle d'embedding, chargée au premier appel.
+
+    Le chargement est protégé par un verrou : si plusieurs requêtes arrivent en même
+    temps sur un processus qui vient de démarrer, le modèle n'est chargé qu'une fois.
+
+    Returns:
+        SentenceTransformer: Modèle prêt à encoder requêtes et documents.
+    """
+    global _model
+    model = _model
+    if model is None:
+        with _model_lock:
+            if _model is None:
+                print(f"Chargement du modèle d'embedding {EMBEDDING_MODEL_NAME}...")
+                _model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+            model = _model
+    return model
+
+
+def get_embedding_tokenizer():
+    """
+    Retourne le tokenizer du modèle d'embedding, sans charger les poids si le modèle
+    n'est pas déjà en mémoire (découpage des documents en tokens).
+
+    Returns:
+        PreTrainedTokenizerFast: Tokenizer Hugging Face du modèle.
+    """
+    global _tokenizer
+    if _model is not None:
+        return _model.tokenizer
+    with _model_lock:
+        if _tokenizer is None:
+            from transformers import AutoTokenizer
+            _tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL_NAME)
+        return _tokenizer
+
+
+def encode_texts(texts, **kwargs):
+    """
+    Encode une liste de textes avec le modèle partagé (requêtes comme chunks de documents).
+
+    Args:
+        texts (List[str]): Textes à encoder.
+        **kwargs: Options transmises à SentenceTransformer.encode (normalize_embeddings, batch_size...).
+
+    Returns:
+        np.ndarray: Matrice des embeddings.
+    """
+    return get_embedding_model().encode(texts, **kwargs)
+
+
+def warmup_embedding_model():
+    """
+    Charge le modèle et exécute un premier encodage, pour que la première vraie requête
+    ne paie ni le chargement ni l'initialisation paresseuse de torch.
+    """
+    encode_texts(["warmup"], normalize_embeddings=True)
+    print("Modèle d'embedding prêt.")
+
+
+def unload_embedding_model():
+    """Libère le modèle d'embedding (il sera rechargé au prochain encodage)."""
+    global _model
+    with _model_lock:
+        _model = None
+    gc.collect()
+    print("Modèle d'embedding déchargé.")
+
+
+def is_embedding_model_loaded():
+    """Indique si le modèle d'embedding est actuellement en mémoire."""
+    return _model is not None
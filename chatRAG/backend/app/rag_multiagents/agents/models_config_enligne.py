@@ -3,6 +3,7 @@ MODELS_ENLIGNE = {
     1: {
         "nom": "DeepSeek V3 Chat",
         "api_url": "deepseek-ai/DeepSeek-V3-0324",
-        "model_id": "deepseek-ai/DeepSeek-V3-0324" 
+        "model_id": "deepseek-ai/DeepSeek-V3-0324",
+        "budget_contexte": 6000  # Tokens maximum de contexte injectés dans le prompt
     }
 }
@@ -0,0 +1,213 @@
+import os
+import time
+import queue
+import threading
+
+# === Pipeline de prétraitement en flux ===
+# lecture des documents -> découpage (pool de threads) -> embedding par lots -> indexation
+#
+# Les étapes communiquent par des files bornées : la mémoire occupée par les documents,
+# chunks et vecteurs en transit ne dépend pas de la taille du corpus, et l'encodage
+# (torch relâche le GIL) se fait pendant que les documents suivants sont lus et découpés.
+
+# Nombre de chunks encodés et ajoutés à l'index par lot
+PREPROCESS_BATCH_SIZE = int(os.getenv("PREPROCESS_BATCH_SIZE", 256))
+# Threads de découpage des documents
+PREPROCESS_CHUNK_WORKERS = int(os.getenv("PREPROCESS_CHUNK_WORKERS", 2))
+# Capacité de chaque file entre deux étapes (documents ou lots)
+PREPROCESS_QUEUE_SIZE = int(os.getenv("PREPROCESS_QUEUE_SIZE", 4))
+
+# Marqueur de fin de flux
+_END = object()
+# Délai d'attente sur les files, pour réagir à l'arrêt d'une autre étape
+_POLL_SECONDS = 0.1
+
+
+class StageStats:
+    """Compteurs d'une étape : éléments traités et temps de travail effectif (hors attente)."""
+
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, items, seconds):
+        with self._lock:
+            self.items += items
+            self.busy_seconds += seconds
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "items": self.items,
+                "unit": self.unit,
+                "busy_seconds": round(self.busy_seconds, 3),
+                "throughput": round(self.items / self.busy_seconds, 1) if self.busy_seconds else 0.0,
+            }
+
+
+class _Stopped(Exception):
+    """Levée dans une étape lorsqu'une autre étape a échoué."""
+
+
+def _put(q, item, stop):
+    while True:
+        if stop.is_set():
+            raise _Stopped()
+        try:
+            q.put(item, timeout=_POLL_SECONDS)
+            return
+        except queue.Full:
+            continue
+
+
+def _get(q, stop):
+    while True:
+        if stop.is_set():
+            raise _Stopped()
+        try:
+            return q.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            continue
+
+
+def run_pipeline(documents, chunk_fn, embed_fn, on_batch, batch_size=PREPROCESS_BATCH_SIZE,
+                 workers=PREPROCESS_CHUNK_WORKERS, queue_size=PREPROCESS_QUEUE_SIZE, progress=None):
+    """
+    Exécute le prétraitement en flux.
+
+    Les chunks d'un même document restent contigus et dans l'ordre (l'élargissement de
+    contexte de search() repose sur les chunks voisins) ; l'ordre entre documents peut
+    varier selon les threads de découpage.
+
+    Args:
+        documents (Iterable[Tuple[int, str]]): Documents (doc_id, contenu), lus au fil de l'eau.
+        chunk_fn (callable): chunk_fn(content, doc_id) -> List[Dict] ("doc_id", "text", ...).
+        embed_fn (callable): embed_fn(chunks) -> (np.ndarray, List[str]).
+        on_batch (callable): on_batch(embeddings, chunks), appelée dans le thread appelant pour chaque lot
+            (chunks = dictionnaires produits par chunk_fn, dans l'ordre des vecteurs).
+        batch_size (int): Nombre de chunks par lot d'embedding.
+        workers (int): Nombre de threads de découpage.
+        queue_size (int): Capacité des files entre étapes.
+        progress (callable, optionnel): progress(statistiques par étape), appelée après chaque lot indexé.
+
+    Returns:
+        tuple: ({doc_id: {"chars", "chunks"}} des documents traités, statistiques par étape).
+    """
+    stats = {
+        "lecture": StageStats("lecture", "documents"),
+        "decoupage": StageStats("decoupage", "documents"),
+        "embedding": StageStats("embedding", "chunks"),
+        "indexation": StageStats("indexation", "chunks"),
+    }
+    documents_stats = {}
+    doc_queue = queue.Queue(maxsize=queue_size)
+    chunk_queue = queue.Queue(maxsize=queue_size)
+    batch_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+
+    def stage(target):
+        def run():
+            try:
+                target()
+            except _Stopped:
+                pass
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+        return threading.Thread(target=run, daemon=True)
+
+    def read():
+        iterator = iter(documents)
+        while True:
+            start = time.perf_counter()
+            document = next(iterator, _END)
+            if document is _END:
+                break
+            stats["lecture"].record(1, time.perf_counter() - start)
+            _put(doc_queue, document, stop)
+        for _ in range(workers):
+            _put(doc_queue, _END, stop)
+
+    def chunk():
+        while True:
+            document = _get(doc_queue, stop)
+            if document is _END:
+                _put(chunk_queue, _END, stop)
+                return
+            doc_id, content = document
+            start = time.perf_counter()
+            chunks = chunk_fn(content, doc_id)
+            stats["decoupage"].record(1, time.perf_counter() - start)
+            _put(chunk_queue, (doc_id, len(content), chunks), stop)
+
+    def embed():
+        pending, finished = [], 0
+
+        def flush(chunks):
+            start = time.perf_counter()
+            embeddings, _ = embed_fn(chunks)
+            stats["embedding"].record(len(chunks), time.perf_counter() - start)
+            _put(batch_queue, (embeddings, chunks), stop)
+
+        while finished < workers:
+            item = _get(chunk_queue, stop)
+            if item is _END:
+                finished += 1
+                continue
+            doc_id, n_chars, chunks = item
+            documents_stats[str(doc_id)] = {"chars": n_chars, "chunks": len(chunks)}
+            pending.extend(chunks)
+            while len(pending) >= batch_size:
+                flush(pending[:batch_size])
+                del pending[:batch_size]
+        if pending:
+            flush(pending)
+        _put(batch_queue, _END, stop)
+
+    threads = [stage(read), stage(embed)] + [stage(chunk) for _ in range(workers)]
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = _get(batch_queue, stop)
+            if item is _END:
+                break
+            embeddings, chunks = item
+            start = time.perf_counter()
+            on_batch(embeddings, chunks)
+            stats["indexation"].record(len(chunks), time.perf_counter() - start)
+            if progress is not None:
+                progress({name: s.as_dict() for name, s in stats.items()})
+    except _Stopped:
+        pass
+    except BaseException as e:
+        errors.append(e)
+        stop.set()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
+    wall = time.perf_counter() - wall_start
+    report = {name: s.as_dict() for name, s in stats.items()}
+    report["wall_seconds"] = round(wall, 3)
+    _print_report(report)
+    return documents_stats, report
+
+
+def _print_report(report):
+    print(f"Prétraitement en {report['wall_seconds']:.2f} s :")
+    for name, values in report.items():
+        if name == "wall_seconds":
+            continue
+        print(f"  {name:<11} {values['items']:>8} {values['unit']:<9} "
+              f"{values['busy_seconds']:>8.2f} s  {values['throughput']:>9.1f} {values['unit']}/s")
@@ -0,0 +1,460 @@
+import os
+import faiss
+import numpy as np
+
+# === Seuils de sélection du type d'index selon la taille du corpus (nombre de vecteurs) ===
+
+# En dessous : index exact IndexFlatIP (recherche linéaire, rappel parfait)
+FLAT_MAX_VECTORS = int(os.getenv("FLAT_MAX_VECTORS", 20000))
+# En dessous : graphe HNSW ; au-delà : IVF-PQ (vecteurs compressés)
+HNSW_MAX_VECTORS = int(os.getenv("HNSW_MAX_VECTORS", 500000))
+
+# Rappel visé lors du réglage de efSearch / nprobe, et k utilisé pour le mesurer
+INDEX_TARGET_RECALL = float(os.getenv("INDEX_TARGET_RECALL", 0.95))
+RECALL_K = 10
+# Nombre de requêtes échantillonnées dans le corpus pour mesurer le rappel
+TUNING_QUERIES = 200
+
+# Paramètres de construction
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+IVF_PQ_SUBQUANTIZERS = 48   # 384 dimensions / 48 = 8 dimensions par sous-quantifieur
+IVF_PQ_BITS = 8
+
+# Types d'index, du plus petit au plus grand corpus
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+
+# Précision des vecteurs stockés dans les index flat et HNSW (IVF-PQ les compresse déjà) :
+#   "fp32" : float32 (exact), "fp16" : demi-précision (x2 moins de mémoire),
+#   "sq8"  : quantification scalaire 8 bits par dimension (x4 moins de mémoire)
+INDEX_PRECISIONS = ("fp32", "fp16", "sq8")
+INDEX_PRECISION = os.getenv("INDEX_PRECISION", "fp32")
+# Marge ajoutée de part et d'autre de l'intervalle [min, max] appris par SQ8, en proportion
+# de sa largeur : les vecteurs ajoutés plus tard ne sortent pas de l'intervalle appris
+SQ8_RANGE_MARGIN = 0.1
+# Vecteurs accumulés avant de créer un nouvel index SQ8 : l'intervalle est appris sur cet
+# échantillon plutôt que sur le premier lot seul
+SQ8_TRAIN_VECTORS = int(os.getenv("SQ8_TRAIN_VECTORS", 16384))
+# Proportion maximale de composantes hors de l'intervalle appris dans un lot ajouté ; au-delà,
+# l'index SQ8 est réentraîné (les valeurs hors intervalle seraient tronquées)
+SQ8_MAX_CLIPPED_RATIO = 0.001
+# Nombre de vecteurs relus par bloc lors d'une conversion d'index ou du calcul du rappel
+CONVERSION_BLOCK_SIZE = 65536
+# Points d'entraînement IVF-PQ par liste (64 suffisent)
+IVF_TRAIN_POINTS_PER_LIST = 64
+
+# Valeurs candidates pour le réglage, de la plus rapide à la plus précise
+EF_SEARCH_CANDIDATES = [16, 32, 64, 128, 256, 512]
+NPROBE_CANDIDATES = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+
+
+def choose_index_type(n_vectors):
+    """
+    Choisit le type d'index en fonction du nombre de vecteurs.
+
+    Returns:
+        str: "flat", "hnsw" ou "ivfpq".
+    """
+    if n_vectors <= FLAT_MAX_VECTORS:
+        return "flat"
+    if n_vectors <= HNSW_MAX_VECTORS:
+        return "hnsw"
+    return "ivfpq"
+
+
+def check_precision(precision):
+    """Vérifie une précision de stockage et retourne la précision par défaut si elle est absente."""
+    precision = precision or INDEX_PRECISION
+    if precision not in INDEX_PRECISIONS:
+        raise ValueError(f"Précision d'index inconnue : {precision} (attendu : {', '.join(INDEX_PRECISIONS)})")
+    return precision
+
+
+def index_bytes_per_vector(index_info, dim):
+    """
+    Estime la mémoire occupée par vecteur dans un index (codes et liens du graphe HNSW).
+
+    Args:
+        index_info (dict ou None): Entrée "index" de meta.json.
+        dim (int): Dimension des vecteurs.
+    """
+    index_info = index_info or {}
+    index_type = index_info.get("type", "flat")
+    if index_type == "ivfpq":
+        return IVF_PQ_SUBQUANTIZERS * IVF_PQ_BITS // 8 + 8
+    code_bytes = {"fp32": 4, "fp16": 2, "sq8": 1}[index_info.get("precision", "fp32")] * dim
+    if index_type == "hnsw":
+        # Niveau 0 : 2 * M voisins (int32), niveaux supérieurs négligeables
+        code_bytes += 2 * HNSW_M * 4
+    return code_bytes
+
+
+def _ivf_nlist(n_vectors):
+    # Règle usuelle : ~4 * sqrt(n) listes, en gardant au moins 39 points d'entraînement par liste
+    return int(max(1, min(4 * np.sqrt(n_vectors), n_vectors // 39)))
+
+
+def apply_search_params(index, index_info):
+    """
+    Applique à un index chargé les paramètres de recherche enregistrés dans ses métadonnées.
+
+    Args:
+        index (faiss.Index): Index FAISS.
+        index_info (dict ou None): Entrée "index" de meta.json.
+    """
+    if not index_info:
+        return
+    params = index_info.get("params", {})
+    if "efSearch" in params:
+        faiss.downcast_index(index).hnsw.efSearch = params["efSearch"]
+    if "nprobe" in params:
+        faiss.extract_index_ivf(index).nprobe = params["nprobe"]
+
+
+def recall_at_k(found, truth, k=RECALL_K):
+    """
+    Calcule le rappel@k moyen d'un résultat approché par rapport à la vérité exacte.
+
+    Args:
+        found (np.ndarray): Indices renvoyés par l'index approché (n_requêtes, >= k).
+        truth (np.ndarray): Indices renvoyés par la recherche exacte (n_requêtes, >= k).
+
+    Returns:
+        float: Rappel moyen entre 0 et 1.
+    """
+    hits = 0
+    for row_found, row_truth in zip(found[:, :k], truth[:, :k]):
+        hits += len(set(row_found.tolist()) & set(row_truth.tolist()))
+    return hits / float(truth[:, :k].size)
+
+
+def _sample_queries(embeddings, n_queries=TUNING_QUERIES, seed=0):
+    rng = np.random.default_rng(seed)
+    n = min(n_queries, len(embeddings))
+    return np.ascontiguousarray(embeddings[rng.choice(len(embeddings), n, replace=False)])
+
+
+class ExactNeighbors:
+    """
+    Vérité terrain pour la mesure du rappel, calculée au fil de l'ajout des vecteurs.
+
+    Les requêtes sont échantillonnées dans le premier bloc reçu ; pour chaque bloc suivant,
+    seuls les k meilleurs voisins exacts par requête sont conservés. La mémoire utilisée
+    ne dépend donc pas de la taille du corpus.
+    """
+
+    def __init__(self, n_queries=TUNING_QUERIES, k=RECALL_K, seed=0):
+        self.n_queries = n_queries
+        self.k = k
+        self.seed = seed
+        self.queries = None
+        self.ntotal = 0
+        self._scores = None
+        self._ids = None
+
+    def add(self, vectors):
+        """Prend en compte un bloc de vecteurs (ajoutés à l'index dans le même ordre)."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not len(vectors):
+            return
+        if self.queries is None:
+            self.queries = _sample_queries(vectors, self.n_queries, self.seed)
+            self._scores = np.full((len(self.queries), 0), -np.inf, dtype=np.float32)
+            self._ids = np.zeros((len(self.queries), 0), dtype=np.int64)
+
+        scores = np.concatenate([self._scores, self.queries @ vectors.T], axis=1)
+        ids = np.concatenate([
+            self._ids,
+            np.broadcast_to(np.arange(self.ntotal, self.ntotal + len(vectors)), (len(self.queries), len(vectors)))
+        ], axis=1)
+        if scores.shape[1] > self.k:
+            top = np.argpartition(-scores, self.k - 1, axis=1)[:, :self.k]
+            scores = np.take_along_axis(scores, top, axis=1)
+            ids = np.take_along_axis(ids, top, axis=1)
+        self._scores, self._ids = scores, ids
+        self.ntotal += len(vectors)
+
+    def truth(self):
+        """Retourne (requêtes, indices des k plus proches voisins exacts triés par score décroissant)."""
+        order = np.argsort(-self._scores, axis=1)
+        return self.queries, np.take_along_axis(self._ids, order, axis=1)
+
+
+def tune_index(index, index_type, embeddings=None, target_recall=INDEX_TARGET_RECALL, neighbors=None):
+    """
+    Règle efSearch (HNSW) ou nprobe (IVF) au plus petit niveau atteignant le rappel visé,
+    mesuré contre une recherche exacte sur un échantillon de vecteurs du corpus.
+
+    Args:
+        index (faiss.Index): Index à régler.
+        index_type (str): "flat", "hnsw" ou "ivfpq".
+        embeddings (np.ndarray, optionnel): Vecteurs du corpus.
+        target_recall (float): Rappel@k visé.
+        neighbors (ExactNeighbors, optionnel): Vérité terrain déjà calculée (à la place de embeddings).
+
+    Returns:
+        tuple: (paramètres retenus, rappel mesuré).
+    """
+    if index_type == "flat" and isinstance(index, faiss.IndexFlat):
+        return {}, 1.0
+
+    if neighbors is None:
+        neighbors = ExactNeighbors()
+        for start in range(0, len(embeddings), CONVERSION_BLOCK_SIZE):
+            neighbors.add(embeddings[start:start + CONVERSION_BLOCK_SIZE])
+    queries, truth = neighbors.truth()
+    k = truth.shape[1]
+
+    if index_type == "flat":
+        # Index flat quantifié : aucun paramètre, seul le rappel est mesuré
+        _, found = index.search(queries, k)
+        return {}, recall_at_k(found, truth, k)
+    if index_type == "hnsw":
+        name, candidates = "efSearch", EF_SEARCH_CANDIDATES
+    else:
+        nlist = faiss.extract_index_ivf(index).nlist
+        name, candidates = "nprobe", [c for c in NPROBE_CANDIDATES if c <= nlist] or [nlist]
+
+    params, recall = {}, 0.0
+    for value in candidates:
+        params = {name: value}
+        apply_search_params(index, {"params": params})
+        _, found = index.search(queries, k)
+        recall = recall_at_k(found, truth, k)
+        if recall >= target_recall:
+            break
+    return params, recall
+
+
+def _scalar_quantizer_type(precision):
+    return {"fp16": faiss.ScalarQuantizer.QT_fp16, "sq8": faiss.ScalarQuantizer.QT_8bit}[precision]
+
+
+def _train_scalar_quantizer(index, sq, precision, train_vectors):
+    # fp16 ne nécessite pas d'entraînement ; SQ8 apprend l'intervalle de chaque dimension
+    if precision == "sq8":
+        sq.rangestat = faiss.ScalarQuantizer.RS_minmax
+        sq.rangestat_arg = SQ8_RANGE_MARGIN
+    index.train(np.ascontiguousarray(train_vectors, dtype=np.float32))
+
+
+def _scalar_quantizer(index):
+    """ScalarQuantizer d'un index flat ou HNSW quantifié."""
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.downcast_index(index.storage).sq
+    return faiss.downcast_index(index).sq
+
+
+def sq8_clipped_ratio(index, vectors):
+    """
+    Proportion des composantes de `vectors` hors de l'intervalle appris par un index SQ8
+    (elles seraient tronquées à l'encodage).
+    """
+    sq = _scalar_quantizer(index)
+    trained = faiss.vector_to_array(sq.trained)
+    vmin, vdiff = trained[:sq.d], trained[sq.d:2 * sq.d]
+    clipped = (vectors < vmin) | (vectors > vmin + vdiff)
+    return float(clipped.mean()) if clipped.size else 0.0
+
+
+def create_index(index_type, dim, n_vectors=0, train_vectors=None, precision=None):
+    """
+    Crée un index FAISS vide du type demandé (produit scalaire).
+
+    Args:
+        index_type (str): "flat", "hnsw" ou "ivfpq".
+        dim (int): Dimension des vecteurs.
+        n_vectors (int): Taille prévue du corpus (nombre de listes IVF).
+        train_vectors (np.ndarray, optionnel): Vecteurs d'entraînement (obligatoire pour "ivfpq" et "sq8").
+        precision (str, optionnel): "fp32", "fp16" ou "sq8" (INDEX_PRECISION par défaut) ;
+            sans effet sur "ivfpq".
+
+    Returns:
+        faiss.Index: Index prêt à recevoir des vecteurs.
+    """
+    precision = check_precision(precision)
+    if index_type == "flat":
+        if precision == "fp32":
+            return faiss.IndexFlatIP(dim)
+        index = faiss.IndexScalarQuantizer(dim, _scalar_quantizer_type(precision), faiss.METRIC_INNER_PRODUCT)
+        _train_scalar_quantizer(index, index.sq, precision, train_vectors)
+        return index
+    if index_type == "hnsw":
+        if precision == "fp32":
+            index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexHNSWSQ(dim, _scalar_quantizer_type(precision), HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            _train_scalar_quantizer(index, faiss.downcast_index(index.storage).sq, precision, train_vectors)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return index
+    if index_type == "ivfpq":
+        nlist = _ivf_nlist(n_vectors)
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, IVF_PQ_SUBQUANTIZERS, IVF_PQ_BITS, faiss.METRIC_INNER_PRODUCT)
+        # Entraînement sur un sous-échantillon
+        index.train(_sample_queries(train_vectors, n_queries=IVF_TRAIN_POINTS_PER_LIST * nlist, seed=1))
+        return index
+    raise ValueError(f"Type d'index inconnu : {index_type}")
+
+
+def build_index(embeddings, index_type=None, target_recall=INDEX_TARGET_RECALL, precision=None):
+    """
+    Construit l'index FAISS adapté à la taille du corpus (produit scalaire = cosinus
+    pour des vecteurs normalisés) et règle ses paramètres de recherche.
+
+    Args:
+        embeddings (np.ndarray): Matrice des vecteurs (float32, normalisés).
+        index_type (str, optionnel): Force "flat", "hnsw" ou "ivfpq" ; choisi selon la taille sinon.
+        target_recall (float): Rappel@k visé pour les index approchés.
+        precision (str, optionnel): Précision des vecteurs stockés ("fp32", "fp16" ou "sq8").
+
+    Returns:
+        tuple: (faiss.Index, dict décrivant l'index à enregistrer dans meta.json).
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    n_vectors, dim = embeddings.shape
+    index_type = index_type or choose_index_type(n_vectors)
+    precision = check_precision(precision)
+
+    index = create_index(index_type, dim, n_vectors, embeddings, precision)
+    index.add(embeddings)
+
+    params, recall = tune_index(index, index_type, embeddings, target_recall)
+    index_info = _index_info(index, index_type, precision, params, recall)
+    print(f"Index '{index_type}' ({precision}) construit pour {n_vectors} vecteurs {params} "
+          f"(rappel@{RECALL_K} = {recall:.3f}).")
+    return index, index_info
+
+
+def _index_info(index, index_type, precision, params, recall):
+    return {
+        "type": index_type,
+        "precision": precision,
+        "params": params,
+        "recall_at_k": round(float(recall), 4),
+        "k": RECALL_K,
+        "ntotal": int(index.ntotal),
+    }
+
+
+def iter_index_vectors(index, block_size=CONVERSION_BLOCK_SIZE):
+    """Relit par blocs les vecteurs d'un index flat ou HNSW (décodés si l'index est quantifié)."""
+    for start in range(0, index.ntotal, block_size):
+        yield index.reconstruct_n(start, min(block_size, index.ntotal - start))
+
+
+class GrowingIndex:
+    """
+    Index FAISS alimenté par lots, dont le type suit la taille du corpus.
+
+    L'index commence en flat (ou repart d'un index existant) ; lorsqu'un ajout franchit
+    FLAT_MAX_VECTORS ou HNSW_MAX_VECTORS, les vecteurs déjà indexés sont relus par blocs
+    et transférés dans un index du type supérieur. Les paramètres de recherche sont
+    réglés à la fin, uniquement si l'index a changé de type pendant les ajouts (ou si
+    un nouvel index quantifié a été créé, pour mesurer son rappel).
+
+    La précision des vecteurs est celle de l'index existant ; pour un nouvel index,
+    celle demandée (INDEX_PRECISION par défaut). Un nouvel index SQ8 n'est créé qu'après
+    SQ8_TRAIN_VECTORS vecteurs (ou à la fin), pour apprendre l'intervalle de ses valeurs
+    sur cet échantillon. Si un lot ajouté ensuite (ou à un index existant) sort de cet
+    intervalle, l'index est réentraîné sur ses vecteurs et le lot, puis son rappel remesuré.
+    """
+
+    def __init__(self, index=None, index_info=None, target_recall=INDEX_TARGET_RECALL, precision=None):
+        self.index = index
+        self.index_info = index_info
+        self.index_type = index_info["type"] if index_info else "flat"
+        if index_info:
+            precision = index_info.get("precision", "fp32")
+        self.precision = check_precision(precision)
+        self.target_recall = target_recall
+        self._neighbors = None
+        # Lots en attente de la création d'un nouvel index SQ8
+        self._pending = []
+        self._pending_count = 0
+
+    @property
+    def ntotal(self):
+        indexed = int(self.index.ntotal) if self.index is not None else 0
+        return indexed + self._pending_count
+
+    def add(self, embeddings):
+        """Ajoute un lot de vecteurs (float32, normalisés)."""
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if self.index is None:
+            if self.precision == "sq8":
+                self._pending.append(embeddings)
+                self._pending_count += len(embeddings)
+                if self._pending_count < SQ8_TRAIN_VECTORS:
+                    return
+                self._create_pending()
+            else:
+                self._create(embeddings)
+            return
+
+        target = choose_index_type(self.ntotal + len(embeddings))
+        if INDEX_TYPES.index(target) > INDEX_TYPES.index(self.index_type):
+            self._convert(target, embeddings)
+        elif self.precision == "sq8" and self.index_type != "ivfpq":
+            ratio = sq8_clipped_ratio(self.index, embeddings)
+            if ratio > SQ8_MAX_CLIPPED_RATIO:
+                print(f"Lot hors de l'intervalle SQ8 appris ({ratio:.2%} des valeurs) : réentraînement de l'index.")
+                self._convert(self.index_type, embeddings)
+
+        self.index.add(embeddings)
+        if self._neighbors is not None:
+            self._neighbors.add(embeddings)
+
+    def _create(self, embeddings):
+        # Nouvel index du type adapté au premier lot, entraîné sur ce lot (SQ8 : échantillon accumulé)
+        self.index_type = choose_index_type(len(embeddings))
+        self.index = create_index(self.index_type, embeddings.shape[1], len(embeddings), embeddings, self.precision)
+        if self.precision != "fp32" or self.index_type != "flat":
+            self._neighbors = ExactNeighbors()
+        self.index.add(embeddings)
+        if self._neighbors is not None:
+            self._neighbors.add(embeddings)
+
+    def _create_pending(self):
+        embeddings = np.vstack(self._pending)
+        self._pending, self._pending_count = [], 0
+        self._create(embeddings)
+
+    def _convert(self, index_type, incoming):
+        """Transfère les vecteurs indexés dans un nouvel index `index_type`, entraîné avec le lot `incoming`."""
+        print(f"Conversion de l'index '{self.index_type}' en '{index_type}' ({self.ntotal} vecteurs)...")
+        n_vectors = self.ntotal + len(incoming)
+        train = None
+        if index_type == "ivfpq":
+            # Sous-échantillon régulier, sans relire tout l'index en mémoire
+            step = max(1, n_vectors // (IVF_TRAIN_POINTS_PER_LIST * _ivf_nlist(n_vectors)))
+        elif self.precision == "sq8":
+            step = max(1, n_vectors // CONVERSION_BLOCK_SIZE)
+        if index_type == "ivfpq" or self.precision == "sq8":
+            train = np.vstack([block[::step] for block in iter_index_vectors(self.index)] + [incoming[::step]])
+        new_index = create_index(index_type, self.index.d, n_vectors, train, self.precision)
+        neighbors = ExactNeighbors()
+        for block in iter_index_vectors(self.index):
+            new_index.add(block)
+            neighbors.add(block)
+        self.index, self.index_type, self._neighbors = new_index, index_type, neighbors
+
+    def finalize(self):
+        """
+        Règle l'index si nécessaire et retourne sa description.
+
+        Returns:
+            tuple: (faiss.Index, dict décrivant l'index à enregistrer dans meta.json).
+        """
+        if self._pending:
+            self._create_pending()
+        if self._neighbors is not None:
+            params, recall = tune_index(self.index, self.index_type, target_recall=self.target_recall,
+                                        neighbors=self._neighbors)
+            print(f"Index '{self.index_type}' ({self.precision}) réglé {params} (rappel@{RECALL_K} = {recall:.3f}).")
+        elif self.index_info:
+            # Même type qu'avant les ajouts : les paramètres réglés restent valables
+            params, recall = self.index_info["params"], self.index_info["recall_at_k"]
+        else:
+            params, recall = {}, 1.0
+        return self.index, _index_info(self.index, self.index_type, self.precision, params, recall)
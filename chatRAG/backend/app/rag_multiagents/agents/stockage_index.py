@@ -0,0 +1,547 @@
+import os
+import json
+import pickle
+import time
+import zlib
+import shutil
+import functools
+from array import array
+import faiss
+import numpy as np
+
+# === Organisation du dossier faiss_index/<conversation_id>/ ===
+#   CURRENT      : nom de la version publiée (ex: "v1718000000000000000")
+#   .tmp-v<version>/ : version en cours de construction, renommée en v<version> à sa publication
+#   v<version>/  : une version complète et immuable de l'index, contenant :
+#     index.faiss        : index FAISS (ouvert en mmap lorsque la version de FAISS le permet)
+#     chunks.zblob       : textes des chunks (UTF-8 concaténés), compressés par blocs zlib
+#     chunks_blocks.npy  : position (en octets) de chaque bloc compressé dans chunks.zblob
+#     offsets.npy        : tableau int64 de n+1 positions (octets non compressés) délimitant chaque chunk
+#     chunks_doc.npy     : ID du document d'origine de chaque chunk
+#     chunks_ordinal.npy : rang du chunk dans son document
+#     chunks_span.npy    : positions (début, fin) du chunk dans le contenu du document (caractères)
+#     chunks.json        : taille des blocs
+#     meta.json          : statistiques du corpus (nombre de caractères, de chunks, tailles par document)
+#   Les versions antérieures peuvent contenir texts.bin (blob UTF-8 non compressé) à la place.
+#
+# Chaque sauvegarde écrit une nouvelle version dans un dossier temporaire, le renomme, puis
+# remplace CURRENT par os.replace : un lecteur voit toujours une version entière, jamais
+# un mélange de fichiers. Un dossier temporaire ancien est une construction abandonnée.
+# Sans CURRENT (index antérieurs), les fichiers sont lus directement dans le dossier de la
+# conversation ; texts.pkl (liste picklée) y est encore lu si texts.bin est absent.
+
+FAISS_INDEX_ROOT = "backend/app/rag_multiagents/faiss_index"
+
+# Blocs de texte compressés : taille non compressée, niveau zlib et blocs décompressés gardés en mémoire
+TEXT_BLOCK_SIZE = 64 * 1024
+TEXT_COMPRESSION_LEVEL = 6
+TEXT_BLOCK_CACHE_SIZE = 16
+
+CURRENT_FILENAME = "CURRENT"
+VERSION_PREFIX = "v"
+BUILD_PREFIX = ".tmp-"
+# Versions précédentes conservées après une publication (lecteurs encore en cours)
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", 1))
+# Âge (secondes) au-delà duquel un dossier de construction non publié est une construction abandonnée
+INDEX_STALE_BUILD_SECONDS = float(os.getenv("INDEX_STALE_BUILD_SECONDS", 3600))
+
+INDEX_FILENAME = "index.faiss"
+TEXTS_BLOB_FILENAME = "texts.bin"
+TEXTS_OFFSETS_FILENAME = "offsets.npy"
+CHUNKS_BLOB_FILENAME = "chunks.zblob"
+CHUNKS_BLOCKS_FILENAME = "chunks_blocks.npy"
+CHUNKS_DOC_FILENAME = "chunks_doc.npy"
+CHUNKS_ORDINAL_FILENAME = "chunks_ordinal.npy"
+CHUNKS_SPAN_FILENAME = "chunks_span.npy"
+CHUNKS_LAYOUT_FILENAME = "chunks.json"
+META_FILENAME = "meta.json"
+LEGACY_TEXTS_FILENAME = "texts.pkl"
+
+
+def conversation_dir(conversation_id):
+    """Retourne le dossier de stockage de l'index d'une conversation."""
+    return os.path.join(FAISS_INDEX_ROOT, str(conversation_id))
+
+
+def read_current_version(conversation_id):
+    """
+    Lit le nom de la version publiée (lecture d'un petit fichier, utilisable à chaque requête).
+
+    Returns:
+        str ou None: Nom du dossier de version, ou None si la conversation n'a pas de version publiée.
+    """
+    try:
+        with open(os.path.join(conversation_dir(conversation_id), CURRENT_FILENAME), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def current_version_dir(conversation_id):
+    """Retourne le dossier de la version publiée (ou le dossier de la conversation pour l'ancien format)."""
+    version = read_current_version(conversation_id)
+    folder_path = conversation_dir(conversation_id)
+    return os.path.join(folder_path, version) if version else folder_path
+
+
+def new_version_dir(conversation_id, version):
+    """
+    Crée le dossier de construction d'une nouvelle version (.tmp-v<version>), invisible des
+    lecteurs et renommé en v<version> par publish_version().
+
+    Args:
+        conversation_id (int ou str): ID de la conversation.
+        version (int): Numéro de version (croissant, ex: time.time_ns()).
+
+    Returns:
+        str: Chemin du dossier créé.
+    """
+    folder_path = os.path.join(conversation_dir(conversation_id), f"{BUILD_PREFIX}{VERSION_PREFIX}{version}")
+    os.makedirs(folder_path, exist_ok=True)
+    return folder_path
+
+
+def _version_number(name):
+    if name.startswith(VERSION_PREFIX) and name[len(VERSION_PREFIX):].isdigit():
+        return int(name[len(VERSION_PREFIX):])
+    return None
+
+
+def publish_version(conversation_id, version_dir):
+    """
+    Publie une version complète : renomme son dossier de construction en v<version>,
+    remplace atomiquement le pointeur CURRENT, puis supprime les anciennes versions.
+
+    Args:
+        conversation_id (int ou str): ID de la conversation.
+        version_dir (str): Dossier créé par new_version_dir() et entièrement écrit.
+
+    Returns:
+        str: Dossier de la version publiée.
+    """
+    folder_path = conversation_dir(conversation_id)
+    name = os.path.basename(version_dir)
+    if name.startswith(BUILD_PREFIX):
+        name = name[len(BUILD_PREFIX):]
+        published_dir = os.path.join(folder_path, name)
+        os.replace(version_dir, published_dir)
+    else:
+        published_dir = version_dir
+    _atomic_write_bytes(os.path.join(folder_path, CURRENT_FILENAME), lambda f: f.write(name.encode("utf-8")))
+    gc_versions(conversation_id)
+    return published_dir
+
+
+def _remove_legacy_files(folder_path):
+    # Fichiers de l'ancien format, rangés directement dans le dossier de la conversation
+    for filename in os.listdir(folder_path):
+        path = os.path.join(folder_path, filename)
+        if os.path.isfile(path) and not filename.startswith(CURRENT_FILENAME):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _remove_stale_builds(folder_path):
+    # Dossiers de construction plus anciens que INDEX_STALE_BUILD_SECONDS : la construction a
+    # échoué ou son processus a été arrêté avant publish_version ; ils ne seront jamais publiés
+    for name in os.listdir(folder_path):
+        path = os.path.join(folder_path, name)
+        if name.startswith(BUILD_PREFIX) and os.path.isdir(path) \
+                and time.time() - os.path.getmtime(path) > INDEX_STALE_BUILD_SECONDS:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def gc_versions(conversation_id, keep=INDEX_KEEP_VERSIONS):
+    """
+    Supprime les constructions abandonnées, les versions remplacées (en gardant les `keep`
+    plus récentes) et les fichiers de l'ancien format.
+
+    Un dossier encore ouvert par un lecteur reste lisible sous Linux (fichiers mappés) ;
+    si la suppression échoue (ex: Windows), elle sera retentée à la prochaine publication.
+    """
+    folder_path = conversation_dir(conversation_id)
+    if not os.path.isdir(folder_path):
+        return
+    _remove_stale_builds(folder_path)
+    current = _version_number(read_current_version(conversation_id) or "")
+    if current is None:
+        return
+    _remove_legacy_files(folder_path)
+
+    older = []
+    for name in os.listdir(folder_path):
+        number = _version_number(name)
+        path = os.path.join(folder_path, name)
+        if number is None or number == current or not os.path.isdir(path):
+            continue
+        if number < current:
+            older.append((number, path))
+        elif time.time() - os.path.getmtime(path) > INDEX_STALE_BUILD_SECONDS:
+            # Construction abandonnée avant l'introduction des dossiers .tmp-
+            shutil.rmtree(path, ignore_errors=True)
+
+    for _, path in sorted(older, reverse=True)[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class ChunkTexts:
+    """
+    Séquence en lecture seule des textes de chunks, adossée à un blob UTF-8 mappé en mémoire.
+
+    Aucun texte n'est décodé au chargement : un chunk n'est converti en `str`
+    que lorsqu'il est demandé. Plusieurs processus ouvrant la même conversation
+    partagent ainsi les mêmes pages du cache disque.
+
+    Format texts.bin (non compressé) des versions antérieures : pas de métadonnées
+    par chunk (doc_ids, ordinals et spans valent None).
+    """
+
+    doc_ids = None
+    ordinals = None
+    spans = None
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _decode(self, i):
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return bytes(self._blob[start:end]).decode("utf-8")
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._decode(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("index de chunk hors limites")
+        return self._decode(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._decode(i)
+
+    @property
+    def nbytes(self):
+        """Taille (octets) du blob et des offsets."""
+        return int(self._blob.nbytes + self._offsets.nbytes)
+
+
+class ChunkStore(ChunkTexts):
+    """
+    Magasin colonnaire des chunks : textes compressés par blocs + tableaux parallèles.
+
+    Les textes UTF-8 sont concaténés puis compressés (zlib) par blocs de `block_size`
+    octets non compressés : lire un chunk ne décompresse que le ou les blocs qui le
+    contiennent (les derniers blocs lus sont gardés en mémoire). Tous les tableaux sont
+    ouverts en mmap.
+
+    Attributs:
+        doc_ids (np.ndarray): ID du document d'origine de chaque chunk (-1 si inconnu).
+        ordinals (np.ndarray): Rang du chunk dans son document.
+        spans (np.ndarray): Positions (début, fin) du chunk dans le contenu du document, en caractères.
+    """
+
+    def __init__(self, blob, blocks, offsets, doc_ids, ordinals, spans, block_size):
+        super().__init__(blob, offsets)
+        self._blocks = blocks
+        self.block_size = block_size
+        self.doc_ids = doc_ids
+        self.ordinals = ordinals
+        self.spans = spans
+        self._block = functools.lru_cache(maxsize=TEXT_BLOCK_CACHE_SIZE)(self._decompress_block)
+
+    def _decompress_block(self, b):
+        return zlib.decompress(bytes(self._blob[int(self._blocks[b]):int(self._blocks[b + 1])]))
+
+    def _decode(self, i):
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        if start == end:
+            return ""
+        first, last = start // self.block_size, (end - 1) // self.block_size
+        data = b"".join(self._block(b) for b in range(first, last + 1))
+        local = start - first * self.block_size
+        return data[local:local + end - start].decode("utf-8")
+
+    @property
+    def nbytes(self):
+        """Taille (octets) du blob compressé et des tableaux."""
+        arrays = (self._blob, self._blocks, self._offsets, self.doc_ids, self.ordinals, self.spans)
+        return int(sum(a.nbytes for a in arrays))
+
+
+def _atomic_write_bytes(path, write):
+    """Écrit un fichier via un fichier temporaire puis os.replace (jamais de fichier à moitié écrit)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def _save_array(path, values):
+    _atomic_write_bytes(path, lambda f: np.save(f, values))
+
+
+def _copy_prefix(source_path, f, n_bytes):
+    # Copie les n_bytes premiers octets d'un fichier, par morceaux
+    with open(source_path, "rb") as source:
+        while n_bytes > 0:
+            data = source.read(min(n_bytes, 1024 * 1024))
+            if not data:
+                break
+            f.write(data)
+            n_bytes -= len(data)
+
+
+class ChunkTextsWriter:
+    """
+    Écriture en flux du magasin de chunks (voir ChunkStore).
+
+    Les textes sont compressés bloc par bloc dans un fichier temporaire ; seuls le bloc
+    en cours et les tableaux par chunk (~36 octets par chunk) restent en mémoire.
+    commit() publie les fichiers, abort() abandonne l'écriture.
+
+    Args:
+        folder_path (str): Dossier où écrire les chunks.
+        source_folder (str, optionnel): Repart des chunks d'un autre dossier (version précédente).
+            Les blocs complets sont recopiés tels quels ; un dossier à l'ancien format est converti.
+        block_size (int): Taille (octets non compressés) des blocs.
+    """
+
+    def __init__(self, folder_path, source_folder=None, block_size=TEXT_BLOCK_SIZE):
+        self.folder_path = folder_path
+        self.block_size = block_size
+        self.blob_path = os.path.join(folder_path, CHUNKS_BLOB_FILENAME)
+        self._tmp_path = f"{self.blob_path}.tmp"
+
+        self._offsets = array("q", [0])
+        self._blocks = array("q", [0])
+        self._doc_ids = array("q")
+        self._ordinals = array("i")
+        self._spans = array("q")
+        self._buffer = bytearray()
+        self._file = open(self._tmp_path, "wb")
+
+        if source_folder:
+            self._start_from(source_folder)
+        self.previous_count = len(self)
+
+    def _start_from(self, source_folder):
+        previous = read_chunk_texts(source_folder)
+        if not (isinstance(previous, ChunkStore) and previous.block_size == self.block_size):
+            # Ancien format : textes recopiés sans métadonnées de document
+            for start in range(0, len(previous), 1024):
+                self.add(previous[start:start + 1024])
+            return
+
+        # Les blocs complets sont recopiés compressés ; le dernier bloc, partiel, est repris en mémoire
+        total = int(previous._offsets[-1])
+        n_full = total // self.block_size
+        _copy_prefix(os.path.join(source_folder, CHUNKS_BLOB_FILENAME), self._file, int(previous._blocks[n_full]))
+        self._blocks = array("q", np.asarray(previous._blocks[:n_full + 1]).tolist())
+        if total % self.block_size:
+            self._buffer = bytearray(previous._block(n_full))
+        self._offsets = array("q", np.asarray(previous._offsets).tolist())
+        self._doc_ids = array("q", np.asarray(previous.doc_ids).tolist())
+        self._ordinals = array("i", np.asarray(previous.ordinals).tolist())
+        self._spans = array("q", np.asarray(previous.spans).ravel().tolist())
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _flush_block(self, size):
+        compressed = zlib.compress(bytes(self._buffer[:size]), TEXT_COMPRESSION_LEVEL)
+        self._file.write(compressed)
+        self._blocks.append(self._blocks[-1] + len(compressed))
+        del self._buffer[:size]
+
+    def add(self, texts, doc_ids=None, ordinals=None, spans=None):
+        """
+        Ajoute des chunks à la suite des précédents.
+
+        Args:
+            texts (List[str]): Textes des chunks.
+            doc_ids (List[int], optionnel): Document d'origine de chaque chunk.
+            ordinals (List[int], optionnel): Rang de chaque chunk dans son document.
+            spans (List[Tuple[int, int]], optionnel): Positions (début, fin) dans le document.
+        """
+        position = self._offsets[-1]
+        for i, text in enumerate(texts):
+            data = text.encode("utf-8")
+            self._buffer += data
+            position += len(data)
+            self._offsets.append(position)
+            self._doc_ids.append(doc_ids[i] if doc_ids is not None else -1)
+            self._ordinals.append(ordinals[i] if ordinals is not None else -1)
+            self._spans.extend(spans[i] if spans is not None else (-1, -1))
+            while len(self._buffer) >= self.block_size:
+                self._flush_block(self.block_size)
+
+    def commit(self):
+        """Écrit le dernier bloc et les tableaux, puis publie le blob compressé."""
+        if self._buffer:
+            self._flush_block(len(self._buffer))
+        self._file.close()
+
+        arrays = {
+            CHUNKS_BLOCKS_FILENAME: np.frombuffer(self._blocks, dtype=np.int64),
+            TEXTS_OFFSETS_FILENAME: np.frombuffer(self._offsets, dtype=np.int64),
+            CHUNKS_DOC_FILENAME: np.frombuffer(self._doc_ids, dtype=np.int64),
+            CHUNKS_ORDINAL_FILENAME: np.frombuffer(self._ordinals, dtype=np.int32),
+            CHUNKS_SPAN_FILENAME: np.frombuffer(self._spans, dtype=np.int64).reshape(-1, 2),
+        }
+        for filename, values in arrays.items():
+            _save_array(os.path.join(self.folder_path, filename), values)
+        layout = json.dumps({"block_size": self.block_size}).encode("utf-8")
+        _atomic_write_bytes(os.path.join(self.folder_path, CHUNKS_LAYOUT_FILENAME), lambda f: f.write(layout))
+        # Le blob est publié en dernier : sa présence signale un magasin complet
+        os.replace(self._tmp_path, self.blob_path)
+
+    def abort(self):
+        """Abandonne l'écriture et supprime le fichier temporaire."""
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+def write_chunk_texts(folder_path, texts):
+    """
+    Sauvegarde les textes des chunks dans le magasin de chunks (sans métadonnées de document).
+
+    Args:
+        folder_path (str): Dossier de la conversation.
+        texts (List[str]): Textes des chunks, dans l'ordre des vecteurs de l'index.
+    """
+    writer = ChunkTextsWriter(folder_path)
+    writer.add(texts)
+    writer.commit()
+
+
+def read_chunk_texts(folder_path):
+    """
+    Ouvre les chunks d'une conversation en mmap.
+
+    Returns:
+        ChunkStore, ChunkTexts ou List[str]: Séquence de textes (ChunkTexts pour texts.bin,
+        liste simple pour l'ancien format texts.pkl).
+
+    Raises:
+        FileNotFoundError: Si aucun format de textes n'est présent.
+    """
+    chunks_blob_path = os.path.join(folder_path, CHUNKS_BLOB_FILENAME)
+    blob_path = os.path.join(folder_path, TEXTS_BLOB_FILENAME)
+    offsets_path = os.path.join(folder_path, TEXTS_OFFSETS_FILENAME)
+
+    if os.path.exists(chunks_blob_path):
+        with open(os.path.join(folder_path, CHUNKS_LAYOUT_FILENAME), "r", encoding="utf-8") as f:
+            layout = json.load(f)
+        arrays = [
+            np.load(os.path.join(folder_path, filename), mmap_mode="r")
+            for filename in (CHUNKS_BLOCKS_FILENAME, TEXTS_OFFSETS_FILENAME, CHUNKS_DOC_FILENAME,
+                             CHUNKS_ORDINAL_FILENAME, CHUNKS_SPAN_FILENAME)
+        ]
+        return ChunkStore(_map_blob(chunks_blob_path), *arrays, block_size=layout["block_size"])
+
+    if os.path.exists(blob_path) and os.path.exists(offsets_path):
+        return ChunkTexts(_map_blob(blob_path), np.load(offsets_path, mmap_mode="r"))
+
+    legacy_path = os.path.join(folder_path, LEGACY_TEXTS_FILENAME)
+    if os.path.exists(legacy_path):
+        with open(legacy_path, "rb") as f:
+            return pickle.load(f)
+
+    raise FileNotFoundError(f"Textes manquants dans {folder_path}")
+
+
+def _map_blob(path):
+    # np.memmap refuse les fichiers vides
+    if os.path.getsize(path) > 0:
+        return np.memmap(path, dtype=np.uint8, mode="r")
+    return np.empty(0, dtype=np.uint8)
+
+
+def texts_files(folder_path):
+    """Retourne les fichiers de textes présents (format le plus récent en priorité)."""
+    chunks_blob_path = os.path.join(folder_path, CHUNKS_BLOB_FILENAME)
+    if os.path.exists(chunks_blob_path):
+        return [chunks_blob_path, os.path.join(folder_path, TEXTS_OFFSETS_FILENAME)]
+    blob_path = os.path.join(folder_path, TEXTS_BLOB_FILENAME)
+    offsets_path = os.path.join(folder_path, TEXTS_OFFSETS_FILENAME)
+    if os.path.exists(blob_path) or not os.path.exists(os.path.join(folder_path, LEGACY_TEXTS_FILENAME)):
+        return [blob_path, offsets_path]
+    return [os.path.join(folder_path, LEGACY_TEXTS_FILENAME)]
+
+
+def write_faiss_index(folder_path, index):
+    """Sauvegarde l'index FAISS de manière atomique."""
+    index_path = os.path.join(folder_path, INDEX_FILENAME)
+    tmp_path = f"{index_path}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, index_path)
+
+
+def read_faiss_index(folder_path, writable=False):
+    """
+    Ouvre l'index FAISS en mmap en lecture seule.
+
+    Selon la version de FAISS, le mmap couvre les listes inversées (IO_FLAG_MMAP)
+    et/ou les codes des index plats (IO_FLAG_MMAP_IFC). Si le type d'index ne
+    supporte pas ces options, on retombe sur une lecture classique.
+
+    Args:
+        folder_path (str): Dossier de la conversation.
+        writable (bool): Si True, lecture complète en mémoire pour pouvoir ajouter des vecteurs.
+    """
+    index_path = os.path.join(folder_path, INDEX_FILENAME)
+    if writable:
+        return faiss.read_index(index_path)
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    try:
+        return faiss.read_index(index_path, flags)
+    except RuntimeError:
+        return faiss.read_index(index_path)
+
+
+def compute_corpus_metadata(texts, documents=None):
+    """
+    Calcule les statistiques du corpus d'une conversation.
+
+    Args:
+        texts (Sequence[str]): Textes des chunks.
+        documents (dict, optionnel): {doc_id: {"chars": int, "chunks": int}} par document.
+
+    Returns:
+        dict: total_chars (longueur de "\n".join(texts)), chunk_count et documents.
+    """
+    chunk_count = len(texts)
+    total_chars = sum(len(t) for t in texts) + max(chunk_count - 1, 0)
+    return {
+        "total_chars": total_chars,
+        "chunk_count": chunk_count,
+        "documents": documents or {},
+    }
+
+
+def write_metadata(folder_path, metadata):
+    """Sauvegarde le fichier meta.json de la conversation de manière atomique."""
+    data = json.dumps(metadata, ensure_ascii=False).encode("utf-8")
+    _atomic_write_bytes(os.path.join(folder_path, META_FILENAME), lambda f: f.write(data))
+
+
+def read_metadata(folder_path):
+    """
+    Lit le fichier meta.json de la conversation.
+
+    Returns:
+        dict ou None: Métadonnées, ou None si le fichier n'existe pas (index antérieur).
+    """
+    meta_path = os.path.join(folder_path, META_FILENAME)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
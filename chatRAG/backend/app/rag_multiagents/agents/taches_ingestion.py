@@ -0,0 +1,441 @@
+import os
+import time
+import shutil
+import threading
+import traceback
+
+import psycopg2
+from psycopg2.extras import Json, RealDictCursor
+
+from agent_conversation import get_db_connection
+from agent_importation import discard_staged, import_documents, sweep_staged_objects
+from agent_pretraitement import run_preprocessing
+
+# === Tâches d'ingestion de documents en arrière-plan ===
+# La route d'upload enregistre les fichiers puis crée une tâche (table ingestion_jobs) et
+# répond immédiatement avec son ID. Un pool de threads exécute les tâches : import des
+# fichiers (MinIO + texte en base), puis indexation de la conversation.
+#
+# Une conversation a au plus une tâche en attente : les uploads rapprochés y ajoutent leurs
+# fichiers et sont indexés en une seule passe. Elle a aussi au plus une tâche en cours : une
+# tâche en attente n'est prise que lorsque la précédente de la même conversation est terminée.
+# Ces deux règles sont garanties par des index uniques partiels, y compris entre processus.
+
+# Nombre de threads exécutant les tâches
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", 2))
+# Intervalle de consultation de la table lorsqu'aucune tâche n'est signalée
+INGESTION_POLL_SECONDS = float(os.getenv("INGESTION_POLL_SECONDS", 5))
+# Intervalle minimal entre deux écritures de la progression d'une tâche
+INGESTION_PROGRESS_SECONDS = 1.0
+# Intervalle du signal de vie (heartbeat_at) d'une tâche en cours, en plus de chaque écriture de progression
+INGESTION_HEARTBEAT_SECONDS = float(os.getenv("INGESTION_HEARTBEAT_SECONDS", 15))
+# Une tâche "en cours" sans signal de vie depuis ce délai est considérée comme interrompue
+INGESTION_STALE_SECONDS = float(os.getenv("INGESTION_STALE_SECONDS", 120))
+# Objets temporaires d'upload (tmp/) sans tâche en attente ou en cours plus anciens que ce délai :
+# envois abandonnés (serveur arrêté avant la création de la tâche), supprimés par les threads
+# inoccupés au plus une fois par INGESTION_STALE_SECONDS. Le délai couvre la réception de tous
+# les fichiers d'une requête, avant laquelle la tâche n'existe pas encore
+INGESTION_STAGING_MAX_AGE_SECONDS = float(os.getenv("INGESTION_STAGING_MAX_AGE_SECONDS", 3600))
+
+# Statuts d'une tâche
+STATUS_PENDING = "en_attente"
+STATUS_RUNNING = "en_cours"
+STATUS_DONE = "terminee"
+STATUS_FAILED = "echec"
+
+# Étapes d'une tâche, dans l'ordre
+STAGE_IMPORT = "importation"
+STAGE_INDEX = "indexation"
+
+SCHEMA_SQL = f"""
+    CREATE TABLE IF NOT EXISTS ingestion_jobs (
+        id SERIAL PRIMARY KEY,
+        conversation_id INTEGER NOT NULL,
+        utilisateur_id INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT '{STATUS_PENDING}',
+        stage TEXT,
+        files JSONB NOT NULL DEFAULT '[]',
+        options JSONB NOT NULL DEFAULT '{{}}',
+        progress JSONB NOT NULL DEFAULT '{{}}',
+        error TEXT,
+        created_at TIMESTAMP NOT NULL DEFAULT now(),
+        updated_at TIMESTAMP NOT NULL DEFAULT now(),
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP
+    );
+    ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP;
+    CREATE UNIQUE INDEX IF NOT EXISTS ingestion_jobs_one_pending
+        ON ingestion_jobs (conversation_id) WHERE status = '{STATUS_PENDING}';
+    CREATE UNIQUE INDEX IF NOT EXISTS ingestion_jobs_one_running
+        ON ingestion_jobs (conversation_id) WHERE status = '{STATUS_RUNNING}';
+"""
+
+
+class IngestionQueue:
+    """
+    File persistante des tâches d'ingestion et pool de threads qui les exécute.
+
+    Args:
+        run_job (callable): run_job(job, report) exécute une tâche (dict de la table) ;
+            report(stage, progress) enregistre sa progression.
+        workers (int): Nombre de threads.
+        poll_seconds (float): Intervalle de consultation de la table en l'absence de signal.
+    """
+
+    def __init__(self, run_job, workers=INGESTION_WORKERS, poll_seconds=INGESTION_POLL_SECONDS):
+        self.run_job = run_job
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._schema_ready = False
+        self._last_sweep = 0.0
+
+        self.completed = 0
+        self.failed = 0
+
+    def _ensure_schema(self, conn):
+        if self._schema_ready:
+            return
+        with conn.cursor() as cursor:
+            cursor.execute(SCHEMA_SQL)
+        conn.commit()
+        self._schema_ready = True
+
+    def start(self):
+        """Démarre les threads (une seule fois) ; les tâches interrompues par un arrêt sont marquées en échec."""
+        with self._lock:
+            if self._threads:
+                return
+            conn = get_db_connection()
+            try:
+                self._ensure_schema(conn)
+                self._fail_interrupted(conn)
+            finally:
+                conn.close()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"ingestion-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        print(f"{self.workers} thread(s) d'ingestion démarré(s).")
+
+    def _fail_interrupted(self, conn):
+        # Tâche "en cours" sans signal de vie récent : son processus a été arrêté. Elle libère sa
+        # conversation (index unique "une tâche en cours") ; les documents déjà importés seront
+        # indexés par la prochaine tâche de la conversation
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE ingestion_jobs
+                SET status = %s, error = %s, finished_at = now(), updated_at = now()
+                WHERE status = %s
+                  AND COALESCE(heartbeat_at, updated_at) < now() - make_interval(secs => %s)
+                RETURNING files
+            """, (STATUS_FAILED, "Tâche interrompue (arrêt du serveur).", STATUS_RUNNING, INGESTION_STALE_SECONDS))
+            reclaimed = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+        if reclaimed:
+            print(f"Ingestion : {len(reclaimed)} tâche(s) interrompue(s) marquée(s) en échec.")
+        # Fichiers de ces tâches jamais importés : copies locales et objets temporaires supprimés
+        for files in reclaimed:
+            discard_uploaded_files(files)
+
+    def _sweep_staging(self, conn):
+        # Objets temporaires qu'aucune tâche ne référence : envois abandonnés avant l'appel à enqueue
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep < INGESTION_STALE_SECONDS:
+                return
+            self._last_sweep = now
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT f ->> 'staged' FROM ingestion_jobs, jsonb_array_elements(files) AS f
+                WHERE status IN (%s, %s) AND jsonb_typeof(f) = 'object'
+            """, (STATUS_PENDING, STATUS_RUNNING))
+            keep = {row[0] for row in cursor.fetchall() if row[0]}
+        conn.commit()
+        try:
+            removed = sweep_staged_objects(INGESTION_STAGING_MAX_AGE_SECONDS, keep)
+        except Exception as e:
+            print(f"Ingestion : objets temporaires non nettoyés ({e}).")
+            return
+        if removed:
+            print(f"Ingestion : {removed} objet(s) temporaire(s) abandonné(s) supprimé(s).")
+
+    def enqueue(self, conversation_id, user_id, files, options=None):
+        """
+        Ajoute des fichiers à ingérer pour une conversation.
+
+        Si une tâche est déjà en attente pour cette conversation, les fichiers y sont ajoutés
+        (une seule indexation pour des uploads rapprochés) ; sinon une tâche est créée.
+
+        Args:
+            conversation_id (int): ID de la conversation.
+            user_id (int): Utilisateur ayant uploadé les fichiers.
+            files (List[dict]): Fichiers reçus : {"path": copie locale, "sha256", "size", "staged"} (voir stream_upload).
+            options (dict, optionnel): Options d'indexation (ex: {"precision": "sq8"}).
+
+        Returns:
+            int: ID de la tâche.
+        """
+        self.start()
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                    INSERT INTO ingestion_jobs (conversation_id, utilisateur_id, files, options)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (conversation_id) WHERE status = '{STATUS_PENDING}'
+                    DO UPDATE SET files = ingestion_jobs.files || EXCLUDED.files,
+                                  options = ingestion_jobs.options || EXCLUDED.options,
+                                  updated_at = now()
+                    RETURNING id
+                """, (conversation_id, user_id, Json(list(files)), Json(options or {})))
+                job_id = cursor.fetchone()[0]
+            conn.commit()
+        finally:
+            conn.close()
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        """
+        Retourne l'état d'une tâche.
+
+        Returns:
+            dict ou None: Ligne de la table (statut, étape, progression...), ou None si elle n'existe pas.
+        """
+        # Les tâches restées en attente après un redémarrage reprennent dès la première consultation
+        self.start()
+        conn = get_db_connection()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute("SELECT * FROM ingestion_jobs WHERE id = %s", (job_id,))
+                return cursor.fetchone()
+        finally:
+            conn.close()
+
+    def _claim(self, conn):
+        # Prend la plus ancienne tâche en attente dont la conversation n'a pas de tâche en cours.
+        # SKIP LOCKED : deux threads (ou processus) ne prennent jamais la même tâche.
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            try:
+                cursor.execute(f"""
+                    UPDATE ingestion_jobs SET status = %s, started_at = now(), heartbeat_at = now(), updated_at = now()
+                    WHERE id = (
+                        SELECT j.id FROM ingestion_jobs j
+                        WHERE j.status = '{STATUS_PENDING}'
+                          AND NOT EXISTS (
+                              SELECT 1 FROM ingestion_jobs r
+                              WHERE r.conversation_id = j.conversation_id AND r.status = '{STATUS_RUNNING}'
+                          )
+                        ORDER BY j.id
+                        FOR UPDATE SKIP LOCKED
+                        LIMIT 1
+                    )
+                    RETURNING *
+                """, (STATUS_RUNNING,))
+                job = cursor.fetchone()
+                conn.commit()
+                return job
+            except psycopg2.IntegrityError:
+                # Une autre tâche de la même conversation vient de démarrer
+                conn.rollback()
+                return None
+
+    def _update(self, conn, job_id, **fields):
+        assignments = ", ".join(f"{name} = %s" for name in fields)
+        values = [Json(v) if isinstance(v, (dict, list)) else v for v in fields.values()]
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE ingestion_jobs SET {assignments}, heartbeat_at = now(), updated_at = now() WHERE id = %s",
+                values + [job_id]
+            )
+        conn.commit()
+
+    def _finish(self, conn, job_id, status, error=None):
+        # Une tâche déjà marquée interrompue (signal de vie perdu) garde son statut d'échec
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE ingestion_jobs SET status = %s, error = %s, finished_at = now(), updated_at = now()
+                WHERE id = %s AND status = %s
+            """, (status, error, job_id, STATUS_RUNNING))
+        conn.commit()
+
+    def _heartbeat(self, job_id, stop):
+        # Signal de vie indépendant de la progression : une étape longue et silencieuse
+        # (entraînement d'un index, gros lot d'embeddings) ne fait pas passer la tâche pour interrompue
+        conn = None
+        try:
+            conn = get_db_connection()
+            while not stop.wait(INGESTION_HEARTBEAT_SECONDS):
+                with conn.cursor() as cursor:
+                    cursor.execute("UPDATE ingestion_jobs SET heartbeat_at = now() WHERE id = %s", (job_id,))
+                conn.commit()
+        except psycopg2.Error as e:
+            print(f"Ingestion : signal de vie de la tâche {job_id} interrompu ({e}).")
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _execute(self, conn, job):
+        progress = dict(job["progress"] or {})
+        last_write = [0.0]
+
+        def report(stage, stage_progress, force=False):
+            progress[stage] = stage_progress
+            now = time.monotonic()
+            if force or now - last_write[0] >= INGESTION_PROGRESS_SECONDS:
+                last_write[0] = now
+                self._update(conn, job["id"], stage=stage, progress=progress)
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job["id"], stop),
+                                     name=f"ingestion-heartbeat-{job['id']}", daemon=True)
+        heartbeat.start()
+        try:
+            self.run_job(job, report)
+        except Exception as e:
+            traceback.print_exc()
+            self._update(conn, job["id"], progress=progress)
+            self._finish(conn, job["id"], STATUS_FAILED, str(e))
+            self.failed += 1
+            print(f"Tâche d'ingestion {job['id']} en échec : {e}")
+            return
+        finally:
+            stop.set()
+        self._update(conn, job["id"], progress=progress)
+        self._finish(conn, job["id"], STATUS_DONE)
+        self.completed += 1
+        print(f"Tâche d'ingestion {job['id']} terminée (conversation {job['conversation_id']}).")
+
+    def _worker(self):
+        conn = None
+        while True:
+            try:
+                if conn is None or conn.closed:
+                    conn = get_db_connection()
+                job = self._claim(conn)
+                if job is None:
+                    # Rien à prendre : une tâche d'un processus arrêté bloque peut-être sa conversation
+                    self._fail_interrupted(conn)
+                    self._sweep_staging(conn)
+            except psycopg2.Error as e:
+                print(f"Ingestion : base de données indisponible ({e}).")
+                conn = None
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.poll_seconds)
+                self._wakeup.clear()
+                continue
+
+            try:
+                self._execute(conn, job)
+            except psycopg2.Error as e:
+                # Progression ou statut non enregistrés : la tâche sera marquée en échec après INGESTION_STALE_SECONDS
+                print(f"Ingestion : impossible de mettre à jour la tâche {job['id']} ({e}).")
+                conn = None
+            # La fin d'une tâche peut débloquer la tâche en attente de la même conversation
+            self._wakeup.set()
+
+    def stats(self):
+        """Retourne la configuration du pool et les compteurs de tâches de ce processus."""
+        return {
+            "workers": self.workers,
+            "started": bool(self._threads),
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+def file_entry(entry):
+    """Normalise un fichier d'une tâche (les tâches antérieures ne stockaient que le chemin)."""
+    if isinstance(entry, str):
+        return {"path": entry}
+    return entry
+
+
+def remove_uploaded_file(file_path):
+    """Supprime un fichier uploadé et son dossier temporaire s'il est vide."""
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    folder = os.path.dirname(file_path)
+    if folder and not os.listdir(folder):
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def discard_uploaded_files(files):
+    """
+    Supprime les fichiers reçus d'une tâche qui ne sera pas exécutée (ou d'un upload non confié
+    à une tâche) : copies locales, leur dossier temporaire et objets temporaires MinIO.
+    """
+    for entry in map(file_entry, files):
+        remove_uploaded_file(entry["path"])
+        if entry.get("staged"):
+            discard_staged(entry["staged"])
+
+
+def run_ingestion_job(job, report):
+    """
+    Exécute une tâche d'ingestion : import des fichiers, puis indexation de la conversation.
+
+    Les fichiers sont importés ensemble (préparation en parallèle, insertion groupée, voir
+    import_documents). Un fichier en erreur n'interrompt pas la tâche (erreur listée dans la
+    progression) ; l'indexation a lieu si au moins un fichier a été importé.
+
+    Args:
+        job (dict): Tâche (ligne de ingestion_jobs).
+        report (callable): report(étape, progression, force=False) enregistre la progression.
+    """
+    conversation_id = job["conversation_id"]
+    files = [file_entry(entry) for entry in job["files"]]
+    options = job["options"] or {}
+
+    # Les fichiers sont préparés par plusieurs threads : la progression est mise à jour sous verrou
+    lock = threading.Lock()
+    results, current = [], {}
+
+    def import_progress(force=False):
+        errors = [f"Erreur fichier {r['file']}: {r['error']}" for r in results if r["status"] == "erreur"]
+        report(STAGE_IMPORT, {"done": len(results), "total": len(files), "errors": errors,
+                              "results": list(results), "current": dict(current)}, force=force)
+
+    def on_result(result):
+        with lock:
+            results.append({key: result[key] for key in ("file", "status", "error")})
+            current.pop(result["file"], None)
+            import_progress()
+
+    def extraction_progress(name, stats):
+        # Progression de la lecture des fichiers en cours (octets de texte extraits)
+        with lock:
+            current[name] = stats
+            import_progress()
+
+    import_progress(force=True)
+    try:
+        results[:] = import_documents(files, conversation_id, job["utilisateur_id"],
+                                      on_result=on_result, progress=extraction_progress)
+    finally:
+        for entry in files:
+            remove_uploaded_file(entry["path"])
+    current.clear()
+    import_progress(force=True)
+
+    errors = [f"Erreur fichier {r['file']}: {r['error']}" for r in results if r["status"] == "erreur"]
+    if len(errors) == len(files):
+        raise RuntimeError("Aucun document valide : " + "; ".join(errors))
+
+    report(STAGE_INDEX, {}, force=True)
+    stages = run_preprocessing(
+        conversation_id,
+        precision=options.get("precision"),
+        progress=lambda stats: report(STAGE_INDEX, stats)
+    )
+    report(STAGE_INDEX, stages or {}, force=True)
+
+
+# Instance partagée par le processus
+INGESTION_QUEUE = IngestionQueue(run_ingestion_job)
@@ -0,0 +1,98 @@
+"""
+Benchmark du découpage des documents : decoupage_texte.RecursiveTextChunker
+comparé à RecursiveCharacterTextSplitter de LangChain (paramètres de agent_pretraitement).
+
+Vérifie que les deux produisent exactement les mêmes chunks, puis mesure chunks/s et Mo/s
+pour plusieurs tailles de document. Avec --tokens, mesure aussi le mode en tokens
+(tokenizer du modèle d'embedding) et la taille maximale des chunks obtenus.
+
+Exemple (depuis le dossier chatRAG) :
+    python backend/app/rag_multiagents/benchmarks/bench_chunking.py --sizes 100000 1000000 5000000
+    python backend/app/rag_multiagents/benchmarks/bench_chunking.py --file rapport_extrait.txt --tokens
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agents"))
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter  # noqa: E402
+from decoupage_texte import RecursiveTextChunker, token_length_function  # noqa: E402
+
+SEPARATORS = ["\n\n", "\n", ".", ",", " ", ""]
+
+
+def synthetic_text(n_chars, seed=0):
+    """Texte proche d'un PDF extrait : paragraphes, lignes coupées, ponctuation, quelques longs tokens."""
+    rng = random.Random(seed)
+    words = ["revenue", "contract", "the", "of", "and", "quarterly", "net", "2023", "clause", "party",
+             "shall", "agreement", "income", "total", "in", "EUR", "12,500.00", "section", "a", "to"]
+    parts, size = [], 0
+    while size < n_chars:
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(4, 30)))
+        if rng.random() < 0.02:
+            sentence += " " + "x" * rng.randint(500, 1500)  # table ou URL sans espace
+        end = rng.choice([". ", ", ", ".\n", "\n", ".\n\n"])
+        parts.append(sentence + end)
+        size += len(sentence) + len(end)
+    return "".join(parts)[:n_chars]
+
+
+def timed(split, text, repeat):
+    best, chunks = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = split(text)
+        best = min(best, time.perf_counter() - start)
+    return chunks, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--file", help="Texte réel à découper (remplace --sizes)")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tokens", action="store_true", help="Mesure aussi le mode en tokens")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "r", encoding="utf-8") as f:
+            texts = [f.read()]
+    else:
+        texts = [synthetic_text(n) for n in args.sizes]
+
+    langchain = RecursiveCharacterTextSplitter(
+        chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap, separators=SEPARATORS
+    )
+    native = RecursiveTextChunker(args.chunk_size, args.chunk_overlap, SEPARATORS)
+
+    print(f"{'caractères':>11} {'chunks':>7} | {'langchain ch/s':>14} {'Mo/s':>7} | "
+          f"{'natif ch/s':>11} {'Mo/s':>7} | {'gain':>6} {'identique':>9}")
+    for text in texts:
+        mb = len(text.encode("utf-8")) / 1e6
+        expected, t_lc = timed(lambda t: [d.page_content for d in langchain.create_documents([t])], text, args.repeat)
+        chunks, t_native = timed(native.split_text, text, args.repeat)
+        print(f"{len(text):>11} {len(chunks):>7} | {len(expected) / t_lc:>14.0f} {mb / t_lc:>7.2f} | "
+              f"{len(chunks) / t_native:>11.0f} {mb / t_native:>7.2f} | {t_lc / t_native:>5.1f}x "
+              f"{str(chunks == expected):>9}")
+
+    if args.tokens:
+        from modele_embedding import EMBEDDING_MAX_TOKENS, get_embedding_tokenizer
+
+        tokenizer = get_embedding_tokenizer()
+        chunk_size = EMBEDDING_MAX_TOKENS - 2
+        by_tokens = RecursiveTextChunker(chunk_size, 50, SEPARATORS, token_length_function(tokenizer))
+        print(f"\nMode tokens (chunk_size={chunk_size}) :")
+        for text in texts:
+            chunks, elapsed = timed(by_tokens.split_text, text, 1)
+            longest = max(len(ids) for ids in tokenizer(chunks, add_special_tokens=True)["input_ids"])
+            print(f"{len(text):>11} caractères : {len(chunks)} chunks, {len(chunks) / elapsed:.0f} chunks/s, "
+                  f"plus long = {longest} tokens (limite {EMBEDDING_MAX_TOKENS})")
+
+
+if __name__ == "__main__":
+    main()
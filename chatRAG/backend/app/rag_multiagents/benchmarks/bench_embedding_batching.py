@@ -0,0 +1,79 @@
+"""
+Benchmark du micro-batching des encodages de requêtes (batch_embedding.EmbeddingBatcher).
+
+Simule N clients concurrents qui encodent chacun des questions une par une, comme
+des requêtes /chat, et compare l'encodage direct (batch de 1 par requête) au
+dispatcher : embeddings/s, latence p50 / p99 et taille moyenne des batches.
+
+Exemple (depuis le dossier chatRAG) :
+    python backend/app/rag_multiagents/benchmarks/bench_embedding_batching.py --concurrency 1 4 16 32
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agents"))
+
+from modele_embedding import encode_texts, warmup_embedding_model  # noqa: E402
+from batch_embedding import EmbeddingBatcher  # noqa: E402
+
+
+def make_questions(n):
+    """Questions distinctes (aucun effet de cache) de longueur réaliste."""
+    return [f"What was the net revenue of company number {i} in the fiscal year {2000 + i % 25}?" for i in range(n)]
+
+
+def run_clients(encode_one, concurrency, per_client):
+    questions = make_questions(concurrency * per_client)
+    latencies = [[] for _ in range(concurrency)]
+
+    def client(c):
+        for q in questions[c * per_client:(c + 1) * per_client]:
+            start = time.perf_counter()
+            encode_one(q)
+            latencies[c].append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    lat = np.concatenate([np.array(l) for l in latencies])
+    return len(questions) / elapsed, np.percentile(lat, 50), np.percentile(lat, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--per-client", type=int, default=20)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    warmup_embedding_model()
+
+    def direct(q):
+        return encode_texts([q], normalize_embeddings=True)
+
+    print(f"{'clients':>7} | {'direct emb/s':>12} {'p50':>8} {'p99':>8} | "
+          f"{'batcher emb/s':>13} {'p50':>8} {'p99':>8} {'batch moy.':>10}")
+    for concurrency in args.concurrency:
+        d_tput, d_p50, d_p99 = run_clients(direct, concurrency, args.per_client)
+
+        batcher = EmbeddingBatcher(max_wait_ms=args.max_wait_ms, max_batch_size=args.max_batch_size)
+        b_tput, b_p50, b_p99 = run_clients(lambda q: batcher.submit(q).result(), concurrency, args.per_client)
+        avg_batch = batcher.stats()["avg_batch_size"]
+
+        print(f"{concurrency:>7} | {d_tput:>12.1f} {d_p50:>8.1f} {d_p99:>8.1f} | "
+              f"{b_tput:>13.1f} {b_p50:>8.1f} {b_p99:>8.1f} {avg_batch:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
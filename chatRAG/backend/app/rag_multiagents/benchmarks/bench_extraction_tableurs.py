@@ -0,0 +1,123 @@
+"""
+Benchmark de l'extraction de texte des tableurs (XLSX, CSV).
+
+Compare l'ancienne extraction (classeur chargé entièrement, texte construit par +=) à
+extraction_texte.collect_text (openpyxl en lecture seule, lecture ligne par ligne) sur
+des fichiers synthétiques : lignes/s et pic de mémoire (RSS) du processus. Chaque mesure
+est faite dans un processus neuf pour que les pics ne se cumulent pas.
+
+Exemple (depuis le dossier chatRAG) :
+    python backend/app/rag_multiagents/benchmarks/bench_extraction_tableurs.py --rows 100000 500000
+    python backend/app/rag_multiagents/benchmarks/bench_extraction_tableurs.py --file gros_classeur.xlsx
+"""
+import os
+import sys
+import csv
+import time
+import random
+import argparse
+import resource
+import tempfile
+import multiprocessing
+
+import openpyxl
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agents"))
+
+from extraction_texte import collect_text  # noqa: E402
+
+COLUMNS = 12
+
+
+def synthetic_row(rng, i):
+    return [i, f"client-{rng.randint(1, 50000)}", rng.choice(["EUR", "USD", "MAD"]), round(rng.uniform(0, 1e6), 2)] + \
+        [rng.choice(["oui", "non", None, "en attente", "contrat cadre"]) for _ in range(COLUMNS - 4)]
+
+
+def write_synthetic_files(n_rows, folder, seed=0):
+    """Écrit un XLSX (openpyxl en écriture seule) et un CSV de n_rows lignes."""
+    rng = random.Random(seed)
+    xlsx_path = os.path.join(folder, f"synthetique_{n_rows}.xlsx")
+    csv_path = os.path.join(folder, f"synthetique_{n_rows}.csv")
+
+    wb = openpyxl.Workbook(write_only=True)
+    sheet = wb.create_sheet("donnees")
+    with open(csv_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        for i in range(n_rows):
+            row = synthetic_row(rng, i)
+            sheet.append(row)
+            writer.writerow(["" if cell is None else cell for cell in row])
+    wb.save(xlsx_path)
+    return [xlsx_path, csv_path]
+
+
+def legacy_extract(file_path):
+    """Extraction d'origine de agent_importation.extract_text (XLSX et CSV)."""
+    text = ""
+    if file_path.endswith(".xlsx"):
+        wb = openpyxl.load_workbook(file_path)
+        for sheet in wb.worksheets:
+            for row in sheet.iter_rows(values_only=True):
+                text += "\t".join([str(cell) if cell else "" for cell in row]) + "\n"
+    else:
+        with open(file_path, "r", encoding="utf-8") as csv_file:
+            reader = csv.reader(csv_file)
+            text = "\n".join([", ".join(row) for row in reader])
+    return text.strip()
+
+
+def streaming_extract(file_path):
+    text, _ = collect_text(file_path, max_bytes=0)
+    return text.strip()
+
+
+def _measure(method, file_path, results):
+    extract = legacy_extract if method == "ancienne" else streaming_extract
+    start = time.perf_counter()
+    text = extract(file_path)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss est en kilo-octets sous Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    results.put((elapsed, peak_mb, text.count("\n") + 1 if text else 0, len(text)))
+
+
+def measure(method, file_path):
+    """Exécute une extraction dans un processus neuf ; retourne (secondes, pic RSS en Mo, lignes, caractères)."""
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    process = ctx.Process(target=_measure, args=(method, file_path, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[50000, 200000])
+    parser.add_argument("--file", nargs="+", help="Fichiers XLSX / CSV réels (remplace --rows)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        if args.file:
+            files = args.file
+        else:
+            files = []
+            for n_rows in args.rows:
+                print(f"Génération de {n_rows} lignes...")
+                files += write_synthetic_files(n_rows, folder)
+
+        print(f"\n{'fichier':<28} {'Mo':>7} | {'méthode':<9} {'lignes/s':>10} {'pic RSS (Mo)':>13} {'identique':>9}")
+        for file_path in files:
+            size_mb = os.path.getsize(file_path) / 1e6
+            reference = None
+            for method in ("ancienne", "flux"):
+                elapsed, peak_mb, n_lines, n_chars = measure(method, file_path)
+                reference = reference or (n_lines, n_chars)
+                print(f"{os.path.basename(file_path):<28} {size_mb:>7.1f} | {method:<9} {n_lines / elapsed:>10.0f} "
+                      f"{peak_mb:>13.0f} {str((n_lines, n_chars) == reference):>9}")
+
+
+if __name__ == "__main__":
+    main()
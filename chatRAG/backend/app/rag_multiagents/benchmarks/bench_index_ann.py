@@ -0,0 +1,93 @@
+"""
+Benchmark des types d'index FAISS choisis par selection_index.build_index.
+
+Compare, pour plusieurs tailles de corpus, l'index approché (HNSW / IVF-PQ) à la
+référence exacte IndexFlatIP : rappel@k, latence par requête (p50 / p99) et temps
+de construction.
+
+Exemple (depuis le dossier chatRAG) :
+    python backend/app/rag_multiagents/benchmarks/bench_index_ann.py --sizes 20000 100000 --types hnsw ivfpq
+    python backend/app/rag_multiagents/benchmarks/bench_index_ann.py --embeddings mes_vecteurs.npy
+"""
+import os
+import sys
+import time
+import argparse
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agents"))
+
+from selection_index import RECALL_K, build_index, recall_at_k  # noqa: E402
+
+
+def synthetic_embeddings(n_vectors, dim=384, n_clusters=256, seed=0):
+    """Vecteurs normalisés regroupés en clusters, plus proches de vrais embeddings qu'un bruit uniforme."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, n_vectors)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((n_vectors, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def latencies_ms(index, queries, k):
+    """Latence de chaque requête (recherche une par une, comme dans /chat)."""
+    timings = []
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        index.search(queries[i:i + 1], k)
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.array(timings)
+
+
+def run(embeddings, index_types, n_queries, k):
+    n_vectors = len(embeddings)
+    rng = np.random.default_rng(42)
+    queries = embeddings[rng.choice(n_vectors, n_queries, replace=False)]
+    # Légère perturbation : les requêtes ne sont pas exactement des vecteurs du corpus
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    faiss.normalize_L2(queries)
+
+    print(f"\n=== {n_vectors} vecteurs, dim {embeddings.shape[1]}, {n_queries} requêtes, k={k} ===")
+    print(f"{'type':<8} {'params':<18} {'build (s)':>10} {'recall@k':>9} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+
+    truth = None
+    for index_type in ["flat"] + [t for t in index_types if t != "flat"]:
+        start = time.perf_counter()
+        index, info = build_index(embeddings, index_type)
+        build_s = time.perf_counter() - start
+
+        # La référence exacte est la première ligne du tableau
+        if truth is None:
+            _, truth = index.search(queries, k)
+
+        _, found = index.search(queries, k)
+        recall = recall_at_k(found, truth, k)
+        lat = latencies_ms(index, queries, k)
+        print(f"{index_type:<8} {str(info['params']):<18} {build_s:>10.2f} {recall:>9.3f} "
+              f"{np.percentile(lat, 50):>9.3f} {np.percentile(lat, 99):>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--types", nargs="+", default=["hnsw", "ivfpq"], choices=["flat", "hnsw", "ivfpq"])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=RECALL_K)
+    parser.add_argument("--embeddings", help="Fichier .npy de vrais embeddings (remplace --sizes)")
+    args = parser.parse_args()
+
+    if args.embeddings:
+        embeddings = np.ascontiguousarray(np.load(args.embeddings), dtype=np.float32)
+        faiss.normalize_L2(embeddings)
+        run(embeddings, args.types, min(args.queries, len(embeddings)), args.k)
+        return
+
+    for size in args.sizes:
+        run(synthetic_embeddings(size), args.types, min(args.queries, size), args.k)
+
+
+if __name__ == "__main__":
+    main()
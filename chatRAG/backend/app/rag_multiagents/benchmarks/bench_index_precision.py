@@ -0,0 +1,84 @@
+"""
+Benchmark de la précision des vecteurs stockés (selection_index.INDEX_PRECISIONS).
+
+Pour chaque type d'index (flat, hnsw), compare fp32, fp16 et sq8 : mémoire de l'index
+(taille sérialisée), gain par rapport à fp32, rappel@k contre la recherche exacte en
+float32, latence par requête (p50 / p99) et temps de construction.
+
+Exemple (depuis le dossier chatRAG) :
+    python backend/app/rag_multiagents/benchmarks/bench_index_precision.py --sizes 20000 100000
+    python backend/app/rag_multiagents/benchmarks/bench_index_precision.py --embeddings mes_vecteurs.npy --types flat
+"""
+import os
+import sys
+import time
+import argparse
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agents"))
+
+from selection_index import INDEX_PRECISIONS, RECALL_K, build_index, recall_at_k  # noqa: E402
+from bench_index_ann import latencies_ms, synthetic_embeddings  # noqa: E402
+
+
+def index_bytes(index):
+    """Taille de l'index sérialisé (proche de sa taille en mémoire ou mappée)."""
+    return faiss.serialize_index(index).nbytes
+
+
+def run(embeddings, index_types, precisions, n_queries, k):
+    n_vectors = len(embeddings)
+    rng = np.random.default_rng(42)
+    queries = embeddings[rng.choice(n_vectors, n_queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    faiss.normalize_L2(queries)
+
+    # Référence : recherche exacte sur les vecteurs float32
+    exact = faiss.IndexFlatIP(embeddings.shape[1])
+    exact.add(embeddings)
+    _, truth = exact.search(queries, k)
+
+    print(f"\n=== {n_vectors} vecteurs, dim {embeddings.shape[1]}, {n_queries} requêtes, k={k} ===")
+    print(f"{'type':<6} {'précision':<9} {'Mo':>8} {'gain':>6} {'build (s)':>10} {'recall@k':>9} "
+          f"{'p50 (ms)':>9} {'p99 (ms)':>9}")
+
+    for index_type in index_types:
+        reference_bytes = None
+        for precision in ["fp32"] + [p for p in precisions if p != "fp32"]:
+            start = time.perf_counter()
+            index, _ = build_index(embeddings, index_type, precision=precision)
+            build_s = time.perf_counter() - start
+
+            size = index_bytes(index)
+            reference_bytes = reference_bytes or size
+            _, found = index.search(queries, k)
+            recall = recall_at_k(found, truth, k)
+            lat = latencies_ms(index, queries, k)
+            print(f"{index_type:<6} {precision:<9} {size / 1e6:>8.1f} {reference_bytes / size:>5.1f}x "
+                  f"{build_s:>10.2f} {recall:>9.3f} {np.percentile(lat, 50):>9.3f} {np.percentile(lat, 99):>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--types", nargs="+", default=["flat", "hnsw"], choices=["flat", "hnsw"])
+    parser.add_argument("--precisions", nargs="+", default=list(INDEX_PRECISIONS), choices=INDEX_PRECISIONS)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=RECALL_K)
+    parser.add_argument("--embeddings", help="Fichier .npy de vrais embeddings (remplace --sizes)")
+    args = parser.parse_args()
+
+    if args.embeddings:
+        embeddings = np.ascontiguousarray(np.load(args.embeddings), dtype=np.float32)
+        faiss.normalize_L2(embeddings)
+        run(embeddings, args.types, args.precisions, min(args.queries, len(embeddings)), args.k)
+        return
+
+    for size in args.sizes:
+        run(synthetic_embeddings(size), args.types, args.precisions, min(args.queries, size), args.k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Les agents s'importent entre eux par leur nom de module (comme depuis serveur.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agents"))
@@ -0,0 +1,88 @@
+import pytest
+
+from cache_index import IndexCache
+
+
+def test_eviction_bornee_par_octets():
+    cache = IndexCache(max_bytes=100, max_entries=10)
+    cache.put(1, "a", 40)
+    cache.put(2, "b", 40)
+    cache.get_or_load(1, lambda: ("a", 40))  # 1 devient la plus récemment utilisée
+    cache.put(3, "c", 40)
+
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["bytes"] == 80
+    assert stats["evictions"] == 1
+    # 2 était la moins récemment utilisée
+    assert cache.get_or_load(2, lambda: ("b2", 40)) == "b2"
+
+
+def test_eviction_bornee_par_nombre_d_entrees():
+    cache = IndexCache(max_bytes=10**9, max_entries=2)
+    for key in range(3):
+        cache.put(key, key, 1)
+    assert cache.stats()["entries"] == 2
+    assert cache.get_or_load(0, lambda: ("recharge", 1)) == "recharge"
+
+
+def test_entree_plus_grosse_que_le_budget_non_gardee():
+    cache = IndexCache(max_bytes=10, max_entries=10)
+    assert cache.get_or_load(1, lambda: ("gros", 11)) == "gros"
+    assert cache.stats()["entries"] == 0
+
+
+def test_signature_modifiee_recharge_l_entree():
+    cache = IndexCache(max_bytes=1000, max_entries=10, check_interval=0)
+    state = {"signature": 1, "loads": 0}
+
+    def loader():
+        state["loads"] += 1
+        return f"v{state['signature']}", 10
+
+    signature = lambda: state["signature"]
+    assert cache.get_or_load("conv", loader, signature) == "v1"
+    assert cache.get_or_load("conv", loader, signature) == "v1"
+    assert state["loads"] == 1
+
+    state["signature"] = 2
+    assert cache.get_or_load("conv", loader, signature) == "v2"
+    assert state["loads"] == 2
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_cles_int_et_str_equivalentes():
+    cache = IndexCache(max_bytes=1000, max_entries=10)
+    cache.put(7, "x", 1)
+    assert cache.get_or_load("7", lambda: ("autre", 1)) == "x"
+
+
+def test_signature_calculee_hors_du_verrou_global():
+    cache = IndexCache(max_bytes=1000, max_entries=10, check_interval=0)
+
+    def signature():
+        assert not cache._lock.locked()
+        return 1
+
+    assert cache.get_or_load("conv", lambda: ("v1", 10), signature) == "v1"
+    assert cache.get_or_load("conv", lambda: ("v2", 10), signature) == "v1"
+
+
+def test_verrous_de_cle_supprimes_avec_les_entrees():
+    cache = IndexCache(max_bytes=1000, max_entries=2)
+    for key in range(5):
+        cache.get_or_load(key, lambda: ("v", 1))
+    # Les entrées évincées n'ont plus de verrou de chargement
+    assert set(cache._key_locks) <= {"3", "4"}
+
+    def loader():
+        raise FileNotFoundError("index absent")
+
+    for key in range(10, 20):
+        with pytest.raises(FileNotFoundError):
+            cache.get_or_load(key, loader)
+    assert set(cache._key_locks) <= {"3", "4"}
+
+    cache.invalidate(4)
+    cache.clear()
+    assert cache._key_locks == {}
@@ -0,0 +1,56 @@
+import numpy as np
+
+import cache_reponses
+from cache_reponses import AnswerCache
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_question_proche_servie_depuis_le_cache():
+    cache = AnswerCache(max_distance=0.05)
+    cache.store(1, 10, "mistral", "local", unit(1, 0), "Quel CA ?", "42 M")
+    assert cache.lookup(1, 10, "mistral", "local", unit(1, 0.1)) == "42 M"
+    assert cache.lookup(1, 10, "mistral", "local", unit(1, 1)) is None
+    # Autre version d'index, modèle ou conversation : pas de réponse
+    assert cache.lookup(1, 11, "mistral", "local", unit(1, 0)) is None
+    assert cache.lookup(1, 10, "llama", "local", unit(1, 0)) is None
+    assert cache.lookup(2, 10, "mistral", "local", unit(1, 0)) is None
+
+
+def test_reponse_expiree_apres_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_reponses.time, "monotonic", lambda: now[0])
+    cache = AnswerCache(ttl=60)
+    cache.store(1, 10, "mistral", "local", unit(1, 0), "q", "r")
+
+    now[0] += 59
+    assert cache.lookup(1, 10, "mistral", "local", unit(1, 0)) == "r"
+    now[0] += 2
+    assert cache.lookup(1, 10, "mistral", "local", unit(1, 0)) is None
+    stats = cache.stats()
+    assert stats["expirations"] == 1
+    assert stats["entries"] == 0
+
+
+def test_invalidation_d_une_conversation():
+    cache = AnswerCache()
+    cache.store(1, 10, "mistral", "local", unit(1, 0), "q", "r1")
+    cache.store(1, 10, "mistral", "enligne", unit(1, 0), "q", "r2")
+    cache.store("2", 10, "mistral", "local", unit(1, 0), "q", "r3")
+
+    cache.invalidate_conversation("1")
+    assert cache.lookup(1, 10, "mistral", "local", unit(1, 0)) is None
+    assert cache.lookup(1, 10, "mistral", "enligne", unit(1, 0)) is None
+    assert cache.lookup(2, 10, "mistral", "local", unit(1, 0)) == "r3"
+
+
+def test_eviction_des_plus_anciennes_reponses():
+    cache = AnswerCache(max_entries=2)
+    for i in range(3):
+        cache.store(1, 10, "mistral", "local", unit(1, i), f"q{i}", f"r{i}")
+    assert cache.stats()["evictions"] == 1
+    assert cache.lookup(1, 10, "mistral", "local", unit(1, 0)) is None
+    assert cache.lookup(1, 10, "mistral", "local", unit(1, 2)) == "r2"
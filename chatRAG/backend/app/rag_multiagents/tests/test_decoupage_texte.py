@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+from decoupage_texte import RecursiveTextChunker
+
+
+def langchain_splitter(chunk_size, chunk_overlap):
+    try:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+    except ImportError:
+        text_splitter = pytest.importorskip("langchain.text_splitter")
+        RecursiveCharacterTextSplitter = text_splitter.RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def random_text(rng):
+    words = ["a", "bb", "ccc", "rapport", "chiffre", "d'affaires", "é", "2024", "x" * 40]
+    separators = [" ", " ", " ", "\n", "\n\n", "  ", " \n "]
+    parts = []
+    for _ in range(rng.randint(0, 120)):
+        parts.append(rng.choice(words))
+        parts.append(rng.choice(separators))
+    return "".join(parts)
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_identique_a_langchain(seed):
+    rng = random.Random(seed)
+    chunk_size = rng.randint(5, 120)
+    chunk_overlap = rng.randint(0, chunk_size)
+    text = random_text(rng)
+
+    expected = langchain_splitter(chunk_size, chunk_overlap).split_text(text)
+    assert RecursiveTextChunker(chunk_size, chunk_overlap).split_text(text) == expected
+
+
+def test_intervalles_designent_les_chunks():
+    text = "Premier paragraphe.\n\nDeuxième paragraphe, un peu plus long que le premier.\nFin."
+    chunker = RecursiveTextChunker(chunk_size=30, chunk_overlap=10)
+    spans = chunker.split_spans(text)
+    assert [text[start:end] for start, end in spans] == chunker.split_text(text)
+    assert all(0 <= start < end <= len(text) for start, end in spans)
+
+
+def test_chevauchement_superieur_a_la_taille_refuse():
+    with pytest.raises(ValueError):
+        RecursiveTextChunker(chunk_size=10, chunk_overlap=11)
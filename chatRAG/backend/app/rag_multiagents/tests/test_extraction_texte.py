@@ -0,0 +1,78 @@
+import pytest
+
+from extraction_texte import collect_text
+
+
+def write(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_text(content, encoding="utf-8")
+    return str(path)
+
+
+def test_sans_limite_texte_complet(tmp_path):
+    path = write(tmp_path, "notes.txt", "Chiffre d'affaires : 12 M€\nRésultat : 3 M€")
+    text, stats = collect_text(path, max_bytes=0)
+    assert text == "Chiffre d'affaires : 12 M€\nRésultat : 3 M€"
+    assert stats["bytes"] == len(text.encode("utf-8"))
+    assert not stats["truncated"]
+
+
+@pytest.mark.parametrize("max_bytes", [1, 2, 3, 7, 8, 9])
+def test_troncature_sur_un_caractere_complet(tmp_path, max_bytes):
+    # "é" occupe 2 octets, "€" 3 octets : la limite tombe souvent au milieu d'un caractère
+    content = "é€" * 10
+    path = write(tmp_path, "accents.txt", content)
+    text, stats = collect_text(path, max_bytes=max_bytes)
+
+    size = len(text.encode("utf-8"))
+    assert stats["truncated"]
+    assert stats["bytes"] == size
+    assert max_bytes - 2 <= size <= max_bytes
+    assert content.startswith(text)
+
+
+def test_troncature_entre_deux_morceaux(tmp_path):
+    # CSV : un morceau par ligne ; la lecture s'arrête à la ligne qui dépasse la limite
+    path = write(tmp_path, "lignes.csv", "\n".join(f"ligne {i},é" for i in range(1000)))
+    text, stats = collect_text(path, max_bytes=50)
+    assert stats["truncated"]
+    assert len(text.encode("utf-8")) <= 50
+    assert text.startswith("ligne 0, é\nligne 1, é")
+    assert stats["pieces"] < 10
+
+
+def test_progression_appelee_a_la_fin(tmp_path):
+    path = write(tmp_path, "court.txt", "abc")
+    calls = []
+    collect_text(path, max_bytes=0, progress=calls.append)
+    assert calls and calls[-1]["bytes"] == 3
+
+
+def test_format_non_pris_en_charge(tmp_path):
+    path = write(tmp_path, "image.png", "")
+    with pytest.raises(ValueError):
+        collect_text(path)
+
+
+def test_point_d_entree_sans_effet_de_bord():
+    # Les processus du pool réimportent le script principal sous le nom __mp_main__
+    import runpy
+    import sys
+
+    namespace = runpy.run_module("application", run_name="__mp_main__")
+    assert "app" not in namespace
+    assert "serveur" not in sys.modules
+
+
+def test_xlsx_cellule_de_formule(tmp_path):
+    import openpyxl
+    wb = openpyxl.Workbook()
+    sheet = wb.active
+    sheet.append(["Ventes T1", 120])
+    sheet.append(["Ventes T2", 80])
+    sheet.append(["Total", "=SUM(B1:B2)"])
+    path = str(tmp_path / "ventes.xlsx")
+    wb.save(path)
+
+    text, _ = collect_text(path, max_bytes=0)
+    assert text == "Ventes T1\t120\nVentes T2\t80\nTotal\t=SUM(B1:B2)\n"
@@ -0,0 +1,86 @@
+from index_lexical import LexicalIndex, reciprocal_rank_fusion, write_lexical_index
+
+
+def test_rrf_favorise_les_chunks_presents_dans_les_deux_classements():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 4, 1]], k=60)
+    order = [idx for idx, _ in fused]
+    assert order[:2] == [1, 3]
+    assert set(order) == {1, 2, 3, 4}
+    scores = dict(fused)
+    assert scores[1] == 1 / 61 + 1 / 63
+    assert scores[4] == 1 / 62
+
+
+def test_rrf_classement_vide():
+    assert reciprocal_rank_fusion([[], []]) == []
+    assert reciprocal_rank_fusion([[5], []]) == [(5, 1 / 61)]
+
+
+def test_bm25_classe_le_terme_rare_et_frequent_en_tete(tmp_path):
+    texts = [
+        "le rapport annuel de la société",
+        "chiffre d'affaires 2024 : 1.250 millions, chiffre record",
+        "le chiffre d'affaires progresse",
+        "mentions légales",
+    ]
+    write_lexical_index(str(tmp_path), texts)
+    index = LexicalIndex(str(tmp_path))
+
+    indices, scores = index.search("chiffre d'affaires 1.250")
+    assert list(indices) == [1, 2]
+    assert scores[0] > scores[1] > 0
+
+
+def test_bm25_sans_terme_connu(tmp_path):
+    write_lexical_index(str(tmp_path), ["un texte", "un autre texte"])
+    indices, scores = LexicalIndex(str(tmp_path)).search("inconnu")
+    assert len(indices) == 0 and len(scores) == 0
+
+
+def test_bm25_top_n(tmp_path):
+    write_lexical_index(str(tmp_path), [f"contrat numéro {i}" + " clause" * i for i in range(10)])
+    indices, _ = LexicalIndex(str(tmp_path)).search("clause", top_n=3)
+    assert len(indices) == 3
+
+
+def _postings_par_terme(folder_path):
+    index = LexicalIndex(folder_path)
+    return {
+        term: (list(index.docs[index.offsets[i]:index.offsets[i + 1]]),
+               list(index.tf[index.offsets[i]:index.offsets[i + 1]]))
+        for term, i in index.term_to_id.items()
+    }
+
+
+def test_ajout_incremental_identique_a_la_reconstruction(tmp_path):
+    anciens = ["le chiffre d'affaires progresse", "mentions légales", "rapport annuel 2023"]
+    nouveaux = ["chiffre d'affaires 2024 : 1.250 millions, chiffre record", "nouveau rapport annuel", ""]
+    previous, merged, full = (tmp_path / name for name in ("v1", "v2", "full"))
+    for folder in (previous, merged, full):
+        folder.mkdir()
+
+    write_lexical_index(str(previous), anciens)
+    write_lexical_index(str(merged), anciens + nouveaux, start=len(anciens), previous_folder=str(previous))
+    write_lexical_index(str(full), anciens + nouveaux)
+
+    assert _postings_par_terme(str(merged)) == _postings_par_terme(str(full))
+    merged_index, full_index = LexicalIndex(str(merged)), LexicalIndex(str(full))
+    assert list(merged_index.doclen) == list(full_index.doclen)
+    for query in ("chiffre d'affaires", "rapport annuel", "1.250 légales"):
+        merged_hits, merged_scores = merged_index.search(query)
+        full_hits, full_scores = full_index.search(query)
+        assert list(merged_hits) == list(full_hits)
+        assert list(merged_scores) == list(full_scores)
+
+
+def test_ajout_incremental_desynchronise_reconstruit(tmp_path):
+    previous, merged = tmp_path / "v1", tmp_path / "v2"
+    previous.mkdir()
+    merged.mkdir()
+    write_lexical_index(str(previous), ["un texte"])
+    # La version précédente ne compte qu'un chunk : start=2 impose une reconstruction complète
+    write_lexical_index(str(merged), ["un texte", "un autre texte", "texte final"], start=2,
+                        previous_folder=str(previous))
+    index = LexicalIndex(str(merged))
+    assert index.n_docs == 3
+    assert int(index.df[index.term_to_id["texte"]]) == 3
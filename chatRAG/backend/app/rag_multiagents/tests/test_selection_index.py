@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+import selection_index
+from selection_index import (
+    FLAT_MAX_VECTORS,
+    HNSW_MAX_VECTORS,
+    SQ8_MAX_CLIPPED_RATIO,
+    GrowingIndex,
+    choose_index_type,
+    sq8_clipped_ratio,
+)
+
+
+@pytest.mark.parametrize("n_vectors, expected", [
+    (0, "flat"),
+    (FLAT_MAX_VECTORS, "flat"),
+    (FLAT_MAX_VECTORS + 1, "hnsw"),
+    (HNSW_MAX_VECTORS, "hnsw"),
+    (HNSW_MAX_VECTORS + 1, "ivfpq"),
+])
+def test_choose_index_type_seuils(n_vectors, expected):
+    assert choose_index_type(n_vectors) == expected
+
+
+def _vecteurs(n, dim=8, scale=1.0, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal((n, dim)) * scale).astype(np.float32)
+
+
+def test_sq8_attend_l_echantillon_avant_entrainement(monkeypatch):
+    monkeypatch.setattr(selection_index, "SQ8_TRAIN_VECTORS", 300)
+    growing = GrowingIndex(precision="sq8")
+    growing.add(_vecteurs(100, seed=1))
+    growing.add(_vecteurs(100, seed=2))
+    assert growing.index is None
+    assert growing.ntotal == 200
+
+    growing.add(_vecteurs(100, seed=3))
+    assert growing.index is not None
+    assert growing.ntotal == 300
+
+
+def test_sq8_cree_a_la_fin_sous_le_seuil(monkeypatch):
+    monkeypatch.setattr(selection_index, "SQ8_TRAIN_VECTORS", 1000)
+    growing = GrowingIndex(precision="sq8")
+    growing.add(_vecteurs(50))
+    index, info = growing.finalize()
+    assert index.ntotal == 50
+    assert info["precision"] == "sq8"
+
+
+def test_sq8_reentraine_si_le_lot_sort_de_l_intervalle(monkeypatch):
+    monkeypatch.setattr(selection_index, "SQ8_TRAIN_VECTORS", 100)
+    growing = GrowingIndex(precision="sq8")
+    growing.add(_vecteurs(200, scale=0.1, seed=1))
+    large = _vecteurs(200, scale=1.0, seed=2)
+    assert sq8_clipped_ratio(growing.index, large) > SQ8_MAX_CLIPPED_RATIO
+
+    growing.add(large)
+    assert growing.ntotal == 400
+    assert sq8_clipped_ratio(growing.index, large) <= SQ8_MAX_CLIPPED_RATIO
+    _, info = growing.finalize()
+    assert 0.0 <= info["recall_at_k"] <= 1.0
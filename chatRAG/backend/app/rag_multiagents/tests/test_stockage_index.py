@@ -0,0 +1,70 @@
+import os
+import random
+
+import numpy as np
+
+from stockage_index import CHUNKS_BLOB_FILENAME, ChunkStore, ChunkTextsWriter, read_chunk_texts
+
+
+def random_texts(rng, n):
+    alphabet = "abcdefgh éèàç€ 漢字\n"
+    return ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 60))) for _ in range(n)]
+
+
+def write_store(folder, texts, source_folder=None, block_size=64, first_doc=0):
+    writer = ChunkTextsWriter(str(folder), source_folder=source_folder and str(source_folder), block_size=block_size)
+    writer.add(
+        texts,
+        doc_ids=[first_doc + i // 3 for i in range(len(texts))],
+        ordinals=[i % 3 for i in range(len(texts))],
+        spans=[(i, i + len(t)) for i, t in enumerate(texts)],
+    )
+    writer.commit()
+    return writer
+
+
+def test_aller_retour_des_textes_et_metadonnees(tmp_path):
+    texts = random_texts(random.Random(0), 200)
+    write_store(tmp_path, texts)
+
+    store = read_chunk_texts(str(tmp_path))
+    assert isinstance(store, ChunkStore)
+    assert len(store) == len(texts)
+    # Chunks à cheval sur plusieurs blocs de 64 octets, caractères multi-octets compris
+    assert list(store) == texts
+    assert store[-1] == texts[-1]
+    assert store[10:20] == texts[10:20]
+    assert list(store.doc_ids[:6]) == [0, 0, 0, 1, 1, 1]
+    assert list(store.ordinals[:4]) == [0, 1, 2, 0]
+    assert store.spans[5].tolist() == [5, 5 + len(texts[5])]
+
+
+def test_ajout_recopie_les_blocs_complets(tmp_path):
+    rng = random.Random(1)
+    first, second = random_texts(rng, 100), random_texts(rng, 50)
+    v1, v2 = tmp_path / "v1", tmp_path / "v2"
+    v1.mkdir()
+    v2.mkdir()
+    write_store(v1, first)
+    writer = write_store(v2, second, source_folder=v1, first_doc=1000)
+
+    assert writer.previous_count == len(first)
+    store = read_chunk_texts(str(v2))
+    assert list(store) == first + second
+    assert store.doc_ids[len(first)] == 1000
+    assert list(store.doc_ids[:3]) == [0, 0, 0]
+
+    # Les blocs complets de la version précédente sont recopiés octet pour octet
+    previous = read_chunk_texts(str(v1))
+    n_full = int(previous._offsets[-1]) // previous.block_size
+    copied = int(previous._blocks[n_full])
+    with open(os.path.join(v1, CHUNKS_BLOB_FILENAME), "rb") as a, open(os.path.join(v2, CHUNKS_BLOB_FILENAME), "rb") as b:
+        assert a.read(copied) == b.read(copied)
+    assert np.array_equal(store._blocks[:n_full + 1], previous._blocks[:n_full + 1])
+
+
+def test_magasin_vide(tmp_path):
+    ChunkTextsWriter(str(tmp_path)).commit()
+    store = read_chunk_texts(str(tmp_path))
+    assert len(store) == 0
+    assert list(store) == []
@@ -429,6 +429,23 @@ export default function Chat() {
 
 
 
+  // Interroge le backend jusqu'à la fin d'une tâche d'ingestion (statut "terminee" ou "echec")
+  const waitForIngestionJob = async (jobId, token) => {
+    while (true) {
+      const response = await fetch(`http://localhost:5000/ingestion_jobs/${jobId}`, {
+        headers: { Authorization: `Bearer ${token}` },
+      });
+      if (!response.ok) {
+        throw new Error(`Suivi de la tâche impossible (HTTP ${response.status})`);
+      }
+      const job = await response.json();
+      if (job.status === "terminee" || job.status === "echec") {
+        return job;
+      }
+      await new Promise((resolve) => setTimeout(resolve, 2000));
+    }
+  };
+
   const handleFileChange = async (e) => {
     // Récupère la liste des fichiers sélectionnés dans l'input file
     const files = e.target.files;
@@ -498,11 +515,18 @@ export default function Chat() {
         throw new Error(`Upload failed: ${errorDetails}`);
       }
 
-      // Parse la réponse JSON (succès)
+      // Parse la réponse JSON (succès) : les documents sont traités en arrière-plan
       const data = await response.json();
       console.log("Upload successful response:", data);
 
-      // Met à jour les messages avec la réponse du serveur, en supprimant le message "Traitement en cours"
+      // Suit la tâche d'ingestion jusqu'à la fin de l'import et de l'indexation
+      const job = await waitForIngestionJob(data.job_id, token);
+      const fileErrors = [...(data.errors || []), ...(job.progress?.importation?.errors || [])];
+      const resultText = job.status === "terminee"
+        ? `${data.message.replace("en cours de traitement", "traité(s)")}${fileErrors.length ? ` (${fileErrors.join(" ; ")})` : ""}`
+        : `Erreur de traitement : ${job.error || 'Erreur inconnue'}`;
+
+      // Met à jour les messages avec le résultat, en supprimant le message "Traitement en cours"
       setMessages((prev) => {
         const updatedMessages = (prev[selectedConvId] || []).filter(
           (msg) => !(msg.from === "bot" && msg.isAnimated) // Suppression du message animé temporaire
@@ -511,7 +535,7 @@ export default function Chat() {
           ...prev,
           [selectedConvId]: [
             ...updatedMessages,
-            { from: "bot", text: response.ok ? data.message : `Erreur d'upload: ${data.error || 'Erreur inconnue'}` },
+            { from: "bot", text: resultText },
           ],
         };
       });